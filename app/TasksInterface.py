@@ -1,8 +1,10 @@
+import os
+import sys
 from abc import ABC
 from middle.utils import setup_logger
-from middle.utils import Constants
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from tracing import get_tracer
 logger = setup_logger()
-constants = Constants()
 
 class TasksInterface(ABC):
 
@@ -10,7 +12,20 @@ class TasksInterface(ABC):
         pass
 
     def run_workflow(self):
+        # Devolve as chaves de get_freshness que falharam, para o daemon não dá-las por processadas
         pass
 
     def run_process(self):
         pass
+
+    def get_freshness(self):
+        # Assinatura das datas de atualização da fonte, usada pelo modo daemon; None = sempre executar
+        return None
+
+    def run_pending(self):
+        # Pendências de execuções anteriores (status, notificações), chamada pelo daemon a cada consulta
+        pass
+
+    def span(self, etapa: str, tipo_cvu: str = None, **atributos):
+        # Span de instrumentação nomeado pela classe: with self.span("download", tipo_cvu) as span
+        return get_tracer().span(f"{type(self).__name__}.{etapa}", tipo_cvu=tipo_cvu, **atributos)
@@ -1,8 +1,157 @@
+import os
+import datetime
 from middle.utils import Constants
 
 constants = Constants()
 
+# Limite de tipos de CVU verificados/processados em paralelo (1 = sequencial)
+CVU_MAX_WORKERS = int(os.getenv("CVU_MAX_WORKERS", 4))
 
+# Linhas por bloco na leitura do CSV (0 = arquivo inteiro de uma vez)
+CVU_CHUNK_SIZE = int(os.getenv("CVU_CHUNK_SIZE", 0)) or None
+
+# Envio ao banco: linhas por lote (0 = um único POST), gzip, lotes simultâneos e retry por lote
+CVU_POST_BATCH_SIZE = int(os.getenv("CVU_POST_BATCH_SIZE", 0)) or None
+CVU_POST_GZIP = os.getenv("CVU_POST_GZIP", "false").lower() in ("1", "true", "sim")
+CVU_POST_MAX_IN_FLIGHT = int(os.getenv("CVU_POST_MAX_IN_FLIGHT", 2))
+CVU_POST_RETRIES = int(os.getenv("CVU_POST_RETRIES", 3))
+CVU_POST_BACKOFF = float(os.getenv("CVU_POST_BACKOFF", 1.0))
+
+# Cliente HTTP compartilhado: timeouts (s), retries com backoff, conexões por host e validade do cabeçalho de auth
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 120))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.5))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 10))
+HTTP_AUTH_TTL = float(os.getenv("HTTP_AUTH_TTL", 300))
+# Intervalo mínimo (s) entre requisições ao mesmo host: valor padrão e exceções "host=segundos,host=segundos"
+HTTP_HOST_MIN_INTERVAL = float(os.getenv("HTTP_HOST_MIN_INTERVAL", 0))
+HTTP_HOST_MIN_INTERVAL_POR_HOST = {
+    host.strip(): float(intervalo)
+    for host, _, intervalo in (
+        item.partition("=") for item in os.getenv("HTTP_HOST_MIN_INTERVAL_POR_HOST", "").split(",") if item.strip()
+    )
+}
+
+# Validade (s) do cache de histórico e nomes de usinas usado na geração das tabelas
+CVU_REFERENCE_TTL = float(os.getenv("CVU_REFERENCE_TTL", 600))
+
+# Renderizador da tabela de revisão: "html" (html_to_image) ou "pillow" (PNG desenhado no processo)
+CVU_TABLE_RENDERER = os.getenv("CVU_TABLE_RENDERER", "html")
+
+CCEE_DADOS_ABERTOS_URL = os.getenv("CCEE_DADOS_ABERTOS_URL", "https://dadosabertos.ccee.org.br")
+
+# Cache persistente dos CSVs baixados do pda-download
+CVU_CACHE_DIR = os.getenv(
+    "CVU_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ccee-dados-abertos")
+)
+CVU_CACHE_MAX_BYTES = int(os.getenv("CVU_CACHE_MAX_MB", 512)) * 1024 * 1024
+
+# Estado local persistente (fingerprints do último snapshot enviado etc.)
+CVU_STATE_DIR = os.getenv(
+    "CVU_STATE_DIR", os.path.join(os.path.expanduser("~"), ".local", "state", "ccee-dados-abertos")
+)
+
+# Resumo por etapa da execução: arquivo JSON ou textfile Prometheus (.prom ou CVU_TRACE_FORMAT=prometheus);
+# vazio desliga a gravação
+CVU_TRACE_OUTPUT = os.getenv("CVU_TRACE_OUTPUT", "")
+CVU_TRACE_FORMAT = os.getenv("CVU_TRACE_FORMAT", "json")
+
+# Captura de perfil da execução inteira: "" (desligado), "cprofile" ou "tracemalloc"
+CVU_PROFILE = os.getenv("CVU_PROFILE", "")
+CVU_PROFILE_DIR = os.getenv("CVU_PROFILE_DIR", os.path.join(CVU_STATE_DIR, "perfis"))
+
+# Modo daemon: processo único que consulta as datas de atualização e só executa o workflow quando mudam.
+# Dentro da janela de publicação (horas e dias da semana em BRT, 0 = segunda) consulta a cada POLL_MIN
+# segundos; fora dela o intervalo dobra até POLL_MAX
+CVU_DAEMON = os.getenv("CVU_DAEMON", "false").lower() in ("1", "true", "sim")
+CVU_DAEMON_POLL_MIN = float(os.getenv("CVU_DAEMON_POLL_MIN", 30))
+CVU_DAEMON_POLL_MAX = float(os.getenv("CVU_DAEMON_POLL_MAX", 1800))
+CVU_DAEMON_JANELA_HORAS = os.getenv("CVU_DAEMON_JANELA_HORAS", "8-20")
+CVU_DAEMON_JANELA_DIAS = os.getenv("CVU_DAEMON_JANELA_DIAS", "0-4")
+
+# Envio incremental: só linhas inseridas/alteradas desde o último snapshot enviado. Linhas sem mudança não são
+# reenviadas com o novo dt_atualizacao, então o modo só vale contra um backend que guarda o último valor por
+# (fonte, cd_usina, mes_referencia, ano_horizonte) e responde a consulta por dt_atualizacao com esse valor;
+# CVU_DELTA_BACKEND_ULTIMO_VALOR declara esse contrato e é exigido pelo modo. O diff usa o snapshot inteiro, então o
+# modo não combina com CVU_CHUNK_SIZE (ReadCvu recusa os dois juntos). CVU_FULL_RESYNC força envio completo
+CVU_DELTA_MODE = os.getenv("CVU_DELTA_MODE", "false").lower() in ("1", "true", "sim")
+CVU_DELTA_BACKEND_ULTIMO_VALOR = os.getenv("CVU_DELTA_BACKEND_ULTIMO_VALOR", "false").lower() in ("1", "true", "sim")
+CVU_FULL_RESYNC = os.getenv("CVU_FULL_RESYNC", "false").lower() in ("1", "true", "sim")
+
+# Frames em tipos compactos (inteiros anuláveis reduzidos, Float64, category nas chaves e colunas constantes)
+CVU_COMPACT_DTYPES = os.getenv("CVU_COMPACT_DTYPES", "true").lower() in ("1", "true", "sim")
+
+# Arquivo local dos snapshots ingeridos (Parquet particionado por tipo_cvu e dt_atualizacao, requer pyarrow);
+# GenerateTable lê dele os snapshots antes de consultar a API
+CVU_ARCHIVE = os.getenv("CVU_ARCHIVE", "true").lower() in ("1", "true", "sim")
+CVU_ARCHIVE_DIR = os.getenv("CVU_ARCHIVE_DIR", os.path.join(CVU_STATE_DIR, "snapshots"))
+
+# Índice de tendência: valores por (cd_usina, ano_horizonte) em todas as revisões de cada tipo_cvu,
+# atualizado a cada snapshot processado com só as células alteradas (app/trend_index.py)
+CVU_TREND_INDEX = os.getenv("CVU_TREND_INDEX", "true").lower() in ("1", "true", "sim")
+
+# Ledger local das versões já processadas: tipos sem data nova não consultam o check-cvu, e os PATCH de
+# status são enviados juntos no fim da execução
+CVU_LEDGER = os.getenv("CVU_LEDGER", "true").lower() in ("1", "true", "sim")
+
+# Efeitos colaterais pós-ingestão (trigger de DAG, tabela no WhatsApp): fila local em SQLite, executados
+# em paralelo com retry; TENTATIVAS é o total por efeito somando execuções, concluídos ficam RETENCAO_DIAS
+CVU_EFEITOS_MAX_WORKERS = int(os.getenv("CVU_EFEITOS_MAX_WORKERS", 4))
+CVU_EFEITOS_TENTATIVAS = int(os.getenv("CVU_EFEITOS_TENTATIVAS", 5))
+CVU_EFEITOS_BACKOFF = float(os.getenv("CVU_EFEITOS_BACKOFF", 2.0))
+CVU_EFEITOS_RETENCAO_DIAS = int(os.getenv("CVU_EFEITOS_RETENCAO_DIAS", 30))
+
+# Motor de ingestão declarativo (MAPEAMENTO_DATASETS): datasets processados em paralelo e
+# subconjunto a executar ("pld,geracao"; vazio = todos)
+INGESTAO_MAX_WORKERS = int(os.getenv("INGESTAO_MAX_WORKERS", 8))
+INGESTAO_DATASETS = [nome.strip() for nome in os.getenv("INGESTAO_DATASETS", "").split(",") if nome.strip()]
+
+# Horário de Brasília, sem horário de verão desde 2019
+BRT = datetime.timezone(datetime.timedelta(hours=-3))
+
+
+def _ano_horizonte(df, data_atualizacao):
+    # Conjuntural e merchant não têm horizonte: usa o ano do mês de referência
+    return df['mes_referencia'].astype(str).str[:4]
+
+
+def _dt_atualizacao(df, data_atualizacao):
+    return data_atualizacao.date()
+
+
+RENOMEAR_CVU = {
+    "cvu_cf": "vl_cvu_cf",
+    "cvu_scf": "vl_cvu_scf",
+    "cvu_conjuntural": "vl_cvu",
+    "cvu_estrutural": "vl_cvu",
+    "codigo_modelo_preco": "cd_usina",
+}
+
+
+# Chaves de baixa cardinalidade, mantidas como category quando CVU_COMPACT_DTYPES está ativo
+CATEGORICAS_CVU = ["mes_referencia", "cnpj_agente_vendedor", "codigo_parcela_usina", "mes_referencia_cotacao",
+                   "ano_horizonte"]
+
+
+def _derivadas_cvu(tipo_cvu: str, com_horizonte: bool = False) -> dict:
+    # A derivação do ano_horizonte é decidida pela especificação, uma vez por tipo, e não por bloco lido
+    derivadas = {
+        "dt_atualizacao": _dt_atualizacao,
+        "tipo_cvu": tipo_cvu.replace('_revisado', ''),
+        "fonte": "CCEE_" + tipo_cvu,
+    }
+    if not com_horizonte:
+        derivadas["ano_horizonte"] = _ano_horizonte
+    return derivadas
+
+
+# Especificação declarativa de cada dataset (ver app/datasets.py):
+#   nome_ccee/resource/url: pacote CKAN, recurso e link do pda-download
+#   columns: tipos por coluna (nomes já sanitizados); renames: nomes enviados à API
+#   derivadas: colunas acrescentadas, constantes ou funções (df, data_atualizacao)
+#   ignorar_prefixo: linhas descartadas (notas de rodapé); decimais: arredondamento; endpoint: destino
+#   categoricas: colunas de baixa cardinalidade guardadas como category
 MAPEAMENTO_CVU = {
     "conjuntural": {
         "nome_ccee": "custo_variavel_unitario_conjuntural",
@@ -14,6 +163,11 @@ MAPEAMENTO_CVU = {
                     "cvu_conjuntural": float,
                     "cnpj_agente_vendedor": str,
                     },
+        "renames": RENOMEAR_CVU,
+        "derivadas": _derivadas_cvu("conjuntural"),
+        "ignorar_prefixo": {"mes_referencia": "*"},
+        "decimais": 2,
+        "categoricas": CATEGORICAS_CVU,
         "endpoint": f"{constants.BASE_URL}/api/v2/decks/cvu",
     },
     "estrutural": {
@@ -27,6 +181,11 @@ MAPEAMENTO_CVU = {
                     "ano_horizonte": int,
                     "codigo_parcela_usina": str,
                     },
+        "renames": RENOMEAR_CVU,
+        "derivadas": _derivadas_cvu("estrutural", com_horizonte=True),
+        "ignorar_prefixo": {"mes_referencia": "*"},
+        "decimais": 2,
+        "categoricas": CATEGORICAS_CVU,
         "endpoint": f"{constants.BASE_URL}/api/v2/decks/cvu",
     },
 
@@ -40,6 +199,11 @@ MAPEAMENTO_CVU = {
                     "cvu_conjuntural": float,
                     "cnpj_agente_vendedor": str,
                     },
+        "renames": RENOMEAR_CVU,
+        "derivadas": _derivadas_cvu("conjuntural_revisado"),
+        "ignorar_prefixo": {"mes_referencia": "*"},
+        "decimais": 2,
+        "categoricas": CATEGORICAS_CVU,
         "endpoint": f"{constants.BASE_URL}/api/v2/decks/cvu",
     },
 
@@ -54,7 +218,17 @@ MAPEAMENTO_CVU = {
                     "cvu_scf": float,
                     "mes_referencia_cotacao": str,
                     },
+        "renames": RENOMEAR_CVU,
+        "derivadas": _derivadas_cvu("merchant"),
+        "ignorar_prefixo": {"mes_referencia": "*"},
+        "decimais": 2,
+        "categoricas": CATEGORICAS_CVU,
         "endpoint": f"{constants.BASE_URL}/api/v2/decks/cvu/merchant",
     },
 
 }
+
+
+# Demais datasets de dados abertos da CCEE, no mesmo formato do MAPEAMENTO_CVU, executados pelo
+# produto "dados_abertos" (app/tasks/dados_abertos.py); adicionar um dataset é adicionar uma entrada
+MAPEAMENTO_DATASETS = {}
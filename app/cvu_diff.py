@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class CvuDiff:
+    # Matrizes alinhadas (usina x ano) do snapshot anterior e do atual
+    usinas: np.ndarray
+    anos: np.ndarray
+    old: np.ndarray
+    new: np.ndarray
+    delta: np.ndarray
+    changed: np.ndarray
+    added: np.ndarray
+    removed: np.ndarray
+
+    @property
+    def changed_usinas(self) -> np.ndarray:
+        return self.usinas[self.changed]
+
+    def changes(self) -> pd.DataFrame:
+        # Formato longo: uma linha por (usina, ano) cujo valor mudou
+        linhas, colunas = np.nonzero(_differs(self.old, self.new))
+        return pd.DataFrame({
+            'cd_usina': self.usinas[linhas],
+            'ano_horizonte': self.anos[colunas],
+            'old': self.old[linhas, colunas],
+            'new': self.new[linhas, colunas],
+            'delta': self.delta[linhas, colunas],
+        })
+
+    def to_frame(self) -> pd.DataFrame:
+        # Formato da tabela de revisão: usinas alteradas presentes no snapshot atual,
+        # colunas {ano}_old, {ano}_new e {ano}_dif para os anos presentes em cada lado.
+        # Mesma seleção da tabela por pivot ((dif != 0).any()): um _dif nulo (valor '-' em qualquer
+        # dos lados, inclusive nos dois) mantém a usina, e anos fora do snapshot atual não contam
+        presentes = ~np.isin(self.usinas, self.removed)
+        anos_old = ~np.isnan(self.old[presentes]).all(axis=0)
+        anos_new = ~np.isnan(self.new[presentes]).all(axis=0)
+        com_valor = ~(np.isnan(self.old) & np.isnan(self.new)).all(axis=1)
+        dif = self.delta[:, anos_new]
+        linhas = presentes & com_valor & ((dif != 0) | np.isnan(dif)).any(axis=1)
+
+        blocos = [
+            (self.old[linhas][:, anos_old], self.anos[anos_old], 'old'),
+            (self.new[linhas][:, anos_new], self.anos[anos_new], 'new'),
+            (self.delta[linhas][:, anos_new], self.anos[anos_new], 'dif'),
+        ]
+        return pd.DataFrame(
+            np.hstack([matriz for matriz, _, _ in blocos]),
+            index=pd.Index(self.usinas[linhas], name='cd_usina'),
+            columns=[f'{ano}_{sufixo}' for _, anos, sufixo in blocos for ano in anos],
+        )
+
+
+def diff_cvu(
+    df_old: pd.DataFrame,
+    df_new: pd.DataFrame,
+    value_col: str = 'vl_cvu',
+    index_col: str = 'cd_usina',
+    column_col: str = 'ano_horizonte',
+) -> CvuDiff:
+    usinas, usina_codes = np.unique(
+        np.concatenate([df_old[index_col].to_numpy(), df_new[index_col].to_numpy()]), return_inverse=True
+    )
+    anos, ano_codes = np.unique(
+        np.concatenate([df_old[column_col].to_numpy(), df_new[column_col].to_numpy()]), return_inverse=True
+    )
+    n_old = len(df_old)
+    shape = (len(usinas), len(anos))
+
+    old = _scatter_mean(shape, usina_codes[:n_old], ano_codes[:n_old], df_old[value_col])
+    new = _scatter_mean(shape, usina_codes[n_old:], ano_codes[n_old:], df_new[value_col])
+
+    em_old = np.zeros(len(usinas), dtype=bool)
+    em_old[usina_codes[:n_old]] = True
+    em_new = np.zeros(len(usinas), dtype=bool)
+    em_new[usina_codes[n_old:]] = True
+
+    return CvuDiff(
+        usinas=usinas,
+        anos=anos,
+        old=old,
+        new=new,
+        delta=new - old,
+        changed=_differs(old, new).any(axis=1),
+        added=usinas[em_new & ~em_old],
+        removed=usinas[em_old & ~em_new],
+    )
+
+
+def _scatter_mean(shape: tuple, linhas: np.ndarray, colunas: np.ndarray, valores: pd.Series) -> np.ndarray:
+    # Equivalente a pivot_table(aggfunc='mean'): soma e contagem por célula, sem laços em Python
+    valores = valores.to_numpy(dtype=np.float64, na_value=np.nan)
+    validos = ~np.isnan(valores)
+    flat = np.ravel_multi_index((linhas[validos], colunas[validos]), shape)
+    tamanho = shape[0] * shape[1]
+    soma = np.bincount(flat, weights=valores[validos], minlength=tamanho)
+    contagem = np.bincount(flat, minlength=tamanho)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(contagem > 0, soma / np.maximum(contagem, 1), np.nan).reshape(shape)
+
+
+def _differs(old: np.ndarray, new: np.ndarray) -> np.ndarray:
+    # Valor alterado, ou presente em apenas um dos snapshots
+    nan_old = np.isnan(old)
+    nan_new = np.isnan(new)
+    return (nan_old != nan_new) | (~nan_old & ~nan_new & (old != new))
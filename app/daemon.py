@@ -0,0 +1,192 @@
+import os
+import json
+import fcntl
+import signal
+import datetime
+import threading
+from typing import Optional, Type
+from middle.utils import setup_logger
+from constants import (
+    CVU_STATE_DIR, CVU_DAEMON_POLL_MIN, CVU_DAEMON_POLL_MAX, CVU_DAEMON_JANELA_HORAS, CVU_DAEMON_JANELA_DIAS,
+    BRT,
+)
+from TasksInterface import TasksInterface
+from tracing import get_tracer
+logger = setup_logger()
+
+
+def _parse_intervalo(valor: str) -> range:
+    # "8-20" -> range(8, 21); "3" -> range(3, 4)
+    inicio, _, fim = valor.partition("-")
+    return range(int(inicio), int(fim or inicio) + 1)
+
+
+def _assinatura_processada(atual: dict, ultima: Optional[dict], falhas: list) -> dict:
+    # Só as chaves que terminaram avançam: as que falharam mantêm a data anterior (ou somem), e a
+    # diferença faz a próxima consulta executar o workflow de novo
+    assinatura = dict(atual)
+    for chave in falhas:
+        if ultima and chave in ultima:
+            assinatura[chave] = ultima[chave]
+        else:
+            assinatura.pop(chave, None)
+    return assinatura
+
+
+class PollSchedule:
+    # Intervalo curto dentro da janela usual de publicação da CCEE; fora dela o intervalo
+    # dobra a cada consulta sem novidade até intervalo_max, sem passar do início da próxima janela
+
+    def __init__(
+        self,
+        intervalo_min: float = CVU_DAEMON_POLL_MIN,
+        intervalo_max: float = CVU_DAEMON_POLL_MAX,
+        janela_horas: str = CVU_DAEMON_JANELA_HORAS,
+        janela_dias: str = CVU_DAEMON_JANELA_DIAS,
+        fator: float = 2.0,
+    ):
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = max(intervalo_max, intervalo_min)
+        self.horas = _parse_intervalo(janela_horas)
+        self.dias = _parse_intervalo(janela_dias)
+        self.fator = fator
+        self._atual = intervalo_min
+
+    def em_janela(self, agora: datetime.datetime) -> bool:
+        return agora.weekday() in self.dias and agora.hour in self.horas
+
+    def proximo(self, mudou: bool, erro: bool = False, agora: Optional[datetime.datetime] = None) -> float:
+        agora = agora or datetime.datetime.now(BRT)
+        if mudou or (self.em_janela(agora) and not erro):
+            self._atual = self.intervalo_min
+            return self._atual
+
+        self._atual = min(self._atual * self.fator, self.intervalo_max)
+        if erro:
+            return self._atual
+        return max(min(self._atual, self._segundos_ate_janela(agora)), self.intervalo_min)
+
+    def _segundos_ate_janela(self, agora: datetime.datetime) -> float:
+        inicio_hoje = agora.replace(hour=self.horas.start, minute=0, second=0, microsecond=0)
+        for dias in range(8):
+            candidato = inicio_hoje + datetime.timedelta(days=dias)
+            if candidato > agora and candidato.weekday() in self.dias:
+                return (candidato - agora).total_seconds()
+        return self.intervalo_max
+
+
+class InstanceLock:
+    # flock exclusivo e não bloqueante: o kernel libera o lock se o processo morrer
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            with open(self.path, "r", encoding="utf-8") as f:
+                pid = f.read().strip() or "?"
+            os.close(fd)
+            raise RuntimeError(f"Outra instância do daemon já está em execução (pid {pid}, lock {self.path})")
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Daemon:
+    # Mantém o handler do produto (sessão HTTP, caches, renderizador) carregado entre consultas
+    # e só executa o workflow completo quando as datas de atualização mudam
+
+    def __init__(self, nome: str, handler_cls: Type[TasksInterface], schedule: PollSchedule = None,
+                 state_dir: str = CVU_STATE_DIR, trace_saida: str = "", trace_formato: str = "json"):
+        self.logger = logger
+        self.nome = nome
+        self.handler = handler_cls()
+        self.schedule = schedule or PollSchedule()
+        self.lock = InstanceLock(os.path.join(state_dir, f"daemon_{nome}.lock"))
+        self.state_path = os.path.join(state_dir, f"daemon_{nome}.json")
+        self.trace_saida = trace_saida
+        self.trace_formato = trace_formato
+        self._parar = threading.Event()
+
+    def stop(self, signum=None, frame=None):
+        if signum is not None:
+            self.logger.info("Sinal %s recebido, encerrando daemon após a etapa atual", signal.Signals(signum).name)
+        self._parar.set()
+
+    def run(self):
+        with self.lock:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+            self.logger.info("Daemon %s iniciado (pid %d)", self.nome, os.getpid())
+            ultima = self._load_state()
+
+            while not self._parar.is_set():
+                mudou, erro = False, False
+                # Spans só do ciclo atual; sem isso o daemon acumularia os das consultas sem novidade
+                get_tracer().reset()
+                try:
+                    atual = self.handler.get_freshness()
+                    mudou = atual is not None and atual != ultima
+                    # Handlers sem get_freshness executam a cada consulta, no ritmo do agendamento
+                    if mudou or atual is None:
+                        self.logger.info("Atualização detectada para %s: %s", self.nome, atual)
+                        falhas = self._run_workflow() or []
+                        if falhas:
+                            erro = True
+                            self.logger.warning("Falha em %s para %s, nova tentativa na próxima consulta",
+                                                falhas, self.nome)
+                        if atual is not None:
+                            ultima = _assinatura_processada(atual, ultima, falhas)
+                            self._save_state(ultima)
+                    else:
+                        self.logger.debug("Sem novidades para %s", self.nome)
+                        self.handler.run_pending()
+                except Exception as e:
+                    erro = True
+                    self.logger.error("Falha no ciclo do daemon %s: %s", self.nome, str(e), exc_info=True)
+
+                espera = self.schedule.proximo(mudou=mudou and not erro, erro=erro)
+                self.logger.info("Próxima consulta de %s em %.0fs", self.nome, espera)
+                self._parar.wait(espera)
+
+            self.logger.info("Daemon %s encerrado", self.nome)
+
+    def _run_workflow(self) -> list:
+        try:
+            return self.handler.run_workflow()
+        finally:
+            get_tracer().write(self.trace_saida, self.trace_formato)
+
+    def _load_state(self) -> Optional[dict]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            self.logger.warning("Estado do daemon corrompido, ignorando: %s", str(e))
+            return None
+
+    def _save_state(self, state: Optional[dict]):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
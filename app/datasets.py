@@ -0,0 +1,73 @@
+import datetime
+from dataclasses import dataclass, field
+from typing import Optional
+from constants import BRT
+
+
+@dataclass
+class DatasetSpec:
+    # Uma entrada de MAPEAMENTO_CVU / MAPEAMENTO_DATASETS; ver o comentário em constants.py
+    nome: str
+    nome_ccee: str
+    resource: str
+    url: str
+    columns: dict
+    endpoint: str
+    renames: dict = field(default_factory=dict)
+    derivadas: dict = field(default_factory=dict)
+    ignorar_prefixo: dict = field(default_factory=dict)
+    decimais: Optional[int] = None
+    categoricas: list = field(default_factory=list)
+
+    @classmethod
+    def from_mapping(cls, nome: str, mapeamento: dict) -> "DatasetSpec":
+        campos = set(cls.__dataclass_fields__) - {"nome"}
+        desconhecidos = set(mapeamento) - campos
+        if desconhecidos:
+            raise ValueError(f"Campos desconhecidos no dataset {nome}: {sorted(desconhecidos)}")
+        return cls(nome=nome, **mapeamento)
+
+    @property
+    def text_columns(self) -> set:
+        return {col for col, tipo in self.columns.items() if tipo is str}
+
+
+def load_specs(mapeamento: dict) -> dict:
+    return {nome: DatasetSpec.from_mapping(nome, item) for nome, item in mapeamento.items()}
+
+
+def get_data_atualizacao_ckan(client, base_url: str, spec: DatasetSpec, package: dict = None) -> dict:
+    # package_show do pacote CKAN; quem agenda vários recursos do mesmo pacote pode repassar o
+    # payload já obtido em package para não repetir a consulta
+    if package is None:
+        package = get_package(client, base_url, spec.nome_ccee)
+
+    # A página do dataset exibe metadata_modified (UTC) no fuso BRT com precisão de minutos;
+    # a mesma conversão mantém as chaves já gravadas no check-cvu
+    data_atualizacao = parse_ckan_datetime(package['metadata_modified'])
+
+    resource_last_modified = None
+    for resource in package.get('resources', []):
+        if resource.get('id') == spec.resource:
+            modified = resource.get('last_modified') or resource.get('metadata_modified')
+            if modified:
+                resource_last_modified = parse_ckan_datetime(modified)
+            break
+
+    return {"data_atualizacao": data_atualizacao, "resource_last_modified": resource_last_modified}
+
+
+def get_package(client, base_url: str, nome_ccee: str) -> dict:
+    res = client.get(f"{base_url}/api/3/action/package_show", params={'id': nome_ccee})
+    res.raise_for_status()
+    payload = res.json()
+    if not payload.get('success'):
+        raise ValueError(f"package_show sem sucesso: {payload.get('error')}")
+    return payload['result']
+
+
+def parse_ckan_datetime(value: str) -> datetime.datetime:
+    dt = datetime.datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(BRT).replace(tzinfo=None, second=0, microsecond=0)
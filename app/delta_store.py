@@ -0,0 +1,107 @@
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import pandas as pd
+from middle.utils import setup_logger
+from constants import CVU_STATE_DIR
+logger = setup_logger()
+
+KEY_COLUMNS = ['cd_usina', 'mes_referencia', 'ano_horizonte']
+# Colunas que mudam a cada revisão sem representar mudança no valor da linha. Por ignorar dt_atualizacao, uma
+# linha sem mudança não é reenviada sob a nova data: o backend precisa servir o último valor por chave
+# (CVU_DELTA_BACKEND_ULTIMO_VALOR), e não só as linhas postadas com aquele dt_atualizacao
+IGNORED_COLUMNS = ['dt_atualizacao']
+
+
+@dataclass
+class CvuDelta:
+    tipo_cvu: str
+    key_hash: np.ndarray
+    row_hash: np.ndarray
+    changed: np.ndarray
+    inserts: int
+    updates: int
+    deletes: int
+
+
+class DeltaStore:
+    # Fingerprints (hash da chave e hash da linha) do último snapshot enviado com sucesso por tipo_cvu
+
+    def __init__(self, path: str = os.path.join(CVU_STATE_DIR, "delta.sqlite")):
+        self.logger = logger
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                " tipo_cvu TEXT NOT NULL,"
+                " key_hash INTEGER NOT NULL,"
+                " row_hash INTEGER NOT NULL,"
+                " PRIMARY KEY (tipo_cvu, key_hash))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def diff(self, tipo_cvu: str, df: pd.DataFrame) -> Optional[CvuDelta]:
+        key_hash, row_hash = self.fingerprint(df)
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key_hash, row_hash FROM fingerprints WHERE tipo_cvu = ?", (tipo_cvu,)
+            ).fetchall()
+        if not rows:
+            self.logger.info("Nenhum snapshot anterior para %s, envio completo", tipo_cvu)
+            return None
+
+        anterior = np.array(rows, dtype=np.int64)
+        ordem = np.argsort(anterior[:, 0])
+        anterior_keys = anterior[ordem, 0]
+        anterior_rows = anterior[ordem, 1]
+
+        pos = np.searchsorted(anterior_keys, key_hash)
+        pos_valida = np.minimum(pos, len(anterior_keys) - 1)
+        existe = anterior_keys[pos_valida] == key_hash
+        alterada = existe & (anterior_rows[pos_valida] != row_hash)
+
+        delta = CvuDelta(
+            tipo_cvu=tipo_cvu,
+            key_hash=key_hash,
+            row_hash=row_hash,
+            changed=~existe | alterada,
+            inserts=int((~existe).sum()),
+            updates=int(alterada.sum()),
+            deletes=int((~np.isin(anterior_keys, key_hash)).sum()),
+        )
+        self.logger.info("Delta de %s: %d inserções, %d alterações, %d remoções",
+                         tipo_cvu, delta.inserts, delta.updates, delta.deletes)
+        return delta
+
+    def commit(self, tipo_cvu: str, df: pd.DataFrame, delta: Optional[CvuDelta] = None):
+        if delta is None:
+            key_hash, row_hash = self.fingerprint(df)
+        else:
+            key_hash, row_hash = delta.key_hash, delta.row_hash
+
+        with self._connect() as conn:
+            conn.execute("DELETE FROM fingerprints WHERE tipo_cvu = ?", (tipo_cvu,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (tipo_cvu, key_hash, row_hash) VALUES (?, ?, ?)",
+                zip([tipo_cvu] * len(key_hash), key_hash.tolist(), row_hash.tolist()),
+            )
+        self.logger.info("Snapshot de %s registrado com %d linhas", tipo_cvu, len(key_hash))
+
+    def clear(self, tipo_cvu: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM fingerprints WHERE tipo_cvu = ?", (tipo_cvu,))
+
+    @staticmethod
+    def fingerprint(df: pd.DataFrame):
+        key_columns = [col for col in KEY_COLUMNS if col in df.columns]
+        value_columns = [col for col in df.columns if col not in IGNORED_COLUMNS]
+        # uint64 reinterpretado como int64 para caber em INTEGER do SQLite
+        key_hash = pd.util.hash_pandas_object(df[key_columns], index=False).to_numpy().view(np.int64)
+        row_hash = pd.util.hash_pandas_object(df[value_columns], index=False).to_numpy().view(np.int64)
+        return key_hash, row_hash
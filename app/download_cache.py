@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Optional
+import requests
+from requests.compat import chardet
+from middle.utils import setup_logger
+from http_client import get_client
+from constants import CVU_CACHE_DIR, CVU_CACHE_MAX_BYTES
+logger = setup_logger()
+
+CHUNK_SIZE = 1024 * 1024
+# Prefixo usado para detectar o encoding quando o servidor não informa charset
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+
+@dataclass
+class CachedDownload:
+    url: str
+    path: str
+    sha256: str
+    encoding: Optional[str]
+    size: int
+    from_cache: bool
+    # Bytes efetivamente trafegados nesta busca (0 quando o servidor responde 304)
+    transferred: int = 0
+
+
+class DownloadCache:
+    # Cache em disco endereçado por conteúdo (sha256), revalidado com ETag/Last-Modified
+
+    def __init__(self, cache_dir: str = CVU_CACHE_DIR, max_bytes: int = CVU_CACHE_MAX_BYTES):
+        self.logger = logger
+        self.client = get_client()
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def fetch(self, url: str) -> CachedDownload:
+        with self._lock:
+            entry = self._index.get(url)
+        if entry and not os.path.exists(self._object_path(entry["sha256"])):
+            entry = None
+
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        with self.client.get(url, headers=headers, stream=True) as res:
+            if res.status_code == 304 and entry:
+                self.logger.info("Download em cache ainda válido (304) para %s", url)
+                return self._hit(url, entry, transferred=0)
+            res.raise_for_status()
+
+            sha256, size, tmp_path = self._stream_to_tmp(res)
+            encoding = res.encoding
+            etag = res.headers.get("ETag")
+            last_modified = res.headers.get("Last-Modified")
+
+        if entry and entry["sha256"] == sha256:
+            os.remove(tmp_path)
+            entry.update({"etag": etag, "last_modified": last_modified})
+            self.logger.info("Conteúdo baixado idêntico ao cache (sha256 %s) para %s", sha256[:12], url)
+            return self._hit(url, entry, transferred=size)
+
+        object_path = self._object_path(sha256)
+        if os.path.exists(object_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, object_path)
+
+        if encoding is None:
+            # Mesmo critério de requests.Response.text quando o servidor não informa charset, sobre um prefixo
+            # cortado na última quebra de linha para não partir um caractere multibyte
+            with open(object_path, "rb") as f:
+                amostra = f.read(ENCODING_SAMPLE_SIZE)
+            if len(amostra) == ENCODING_SAMPLE_SIZE:
+                amostra = amostra[:amostra.rfind(b"\n") + 1] or amostra
+            encoding = chardet.detect(amostra)["encoding"]
+
+        entry = {
+            "sha256": sha256,
+            "etag": etag,
+            "last_modified": last_modified,
+            "encoding": encoding,
+            "size": size,
+            "last_access": time.time(),
+        }
+        with self._lock:
+            self.misses += 1
+            previous = self._index.get(url)
+            self._index[url] = entry
+            if previous and previous["sha256"] != sha256:
+                self._remove_object_if_unused(previous["sha256"])
+            self._evict(keep=url)
+            self._save_index()
+        self.logger.info("Download armazenado em cache para %s: %d bytes (hits=%d, misses=%d)",
+                         url, size, self.hits, self.misses)
+        return self._to_download(url, entry, from_cache=False, transferred=size)
+
+    def _hit(self, url: str, entry: dict, transferred: int) -> CachedDownload:
+        with self._lock:
+            self.hits += 1
+            entry["last_access"] = time.time()
+            self._index[url] = entry
+            self._save_index()
+        return self._to_download(url, entry, from_cache=True, transferred=transferred)
+
+    def _to_download(self, url: str, entry: dict, from_cache: bool, transferred: int) -> CachedDownload:
+        return CachedDownload(
+            url=url,
+            path=self._object_path(entry["sha256"]),
+            sha256=entry["sha256"],
+            encoding=entry.get("encoding"),
+            size=entry["size"],
+            from_cache=from_cache,
+            transferred=transferred,
+        )
+
+    def _stream_to_tmp(self, res: requests.Response):
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return digest.hexdigest(), size, tmp_path
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256)
+
+    def _evict(self, keep: str):
+        # LRU por último acesso; o download recém-gravado nunca é removido
+        total = sum(self._object_sizes().values())
+        for url, entry in sorted(self._index.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if url == keep:
+                continue
+            del self._index[url]
+            if self._remove_object_if_unused(entry["sha256"]):
+                total -= entry["size"]
+            self.logger.info("Removido do cache de downloads: %s", url)
+
+    def _object_sizes(self) -> dict:
+        return {entry["sha256"]: entry["size"] for entry in self._index.values()}
+
+    def _remove_object_if_unused(self, sha256: str) -> bool:
+        if sha256 in self._object_sizes():
+            return False
+        try:
+            os.remove(self._object_path(sha256))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            self.logger.warning("Índice do cache de downloads corrompido, recriando: %s", str(e))
+            return {}
+
+    def _save_index(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
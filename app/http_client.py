@@ -0,0 +1,179 @@
+import time
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from middle.utils import setup_logger, get_auth_header
+from constants import (
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF, HTTP_POOL_MAXSIZE, HTTP_AUTH_TTL,
+    HTTP_HOST_MIN_INTERVAL, HTTP_HOST_MIN_INTERVAL_POR_HOST,
+)
+logger = setup_logger()
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class HostRateLimiter:
+    # Intervalo mínimo entre o início de requisições ao mesmo host, compartilhado por todas as threads;
+    # cada chamada reserva o próximo horário livre do host e dorme fora do lock até ele
+
+    def __init__(self, intervalo: float = HTTP_HOST_MIN_INTERVAL, por_host: dict = None):
+        self.intervalo = intervalo
+        self.por_host = dict(HTTP_HOST_MIN_INTERVAL_POR_HOST if por_host is None else por_host)
+        self._proximo = {}
+        self._lock = threading.Lock()
+
+    def set_interval(self, host: str, intervalo: float):
+        with self._lock:
+            self.por_host[host] = intervalo
+
+    def wait(self, url: str) -> float:
+        host = urlparse(url).netloc
+        with self._lock:
+            intervalo = self.por_host.get(host, self.intervalo)
+            if intervalo <= 0:
+                return 0.0
+            agora = time.monotonic()
+            inicio = max(agora, self._proximo.get(host, 0.0))
+            self._proximo[host] = inicio + intervalo
+        espera = inicio - agora
+        if espera > 0:
+            time.sleep(espera)
+        return espera
+
+
+class HttpClient:
+    # Sessão compartilhada: pool de conexões keep-alive por host, timeouts padrão,
+    # retry com backoff (status só para métodos idempotentes) e cabeçalho de auth em cache
+
+    def __init__(
+        self,
+        timeout: tuple = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+        retries: int = HTTP_RETRIES,
+        backoff: float = HTTP_BACKOFF,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+        auth_ttl: float = HTTP_AUTH_TTL,
+    ):
+        self.logger = logger
+        self.timeout = timeout
+        self.auth_ttl = auth_ttl
+        self._auth_header = None
+        self._auth_expira = 0.0
+        self._auth_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._latencias = defaultdict(list)
+        self.rate_limiter = HostRateLimiter()
+
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_maxsize,
+            pool_maxsize=pool_maxsize,
+            max_retries=self._retry(retries, backoff),
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.session.hooks["response"].append(self._registrar_latencia)
+
+    @staticmethod
+    def _retry(retries: int, backoff: float) -> Retry:
+        kwargs = dict(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        try:
+            return Retry(backoff_jitter=backoff, **kwargs)
+        except TypeError:
+            # urllib3 < 2 não tem backoff_jitter
+            return Retry(**kwargs)
+
+    def auth_header(self) -> dict:
+        with self._auth_lock:
+            if self._auth_header is None or time.monotonic() >= self._auth_expira:
+                self._auth_header = get_auth_header()
+                self._auth_expira = time.monotonic() + self.auth_ttl
+            return dict(self._auth_header)
+
+    def invalidate_auth(self):
+        with self._auth_lock:
+            self._auth_header = None
+
+    def request(self, method: str, url: str, auth: bool = False, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        self.rate_limiter.wait(url)
+        extra_headers = kwargs.pop("headers", None) or {}
+        if not auth:
+            return self.session.request(method, url, headers=extra_headers, **kwargs)
+
+        res = self.session.request(method, url, headers={**self.auth_header(), **extra_headers}, **kwargs)
+        if res.status_code == 401:
+            # Token expirado antes do TTL: renova e repete uma vez
+            self.logger.info("Resposta 401 de %s, renovando cabeçalho de autenticação", urlparse(url).netloc)
+            self.invalidate_auth()
+            res.close()
+            self.rate_limiter.wait(url)
+            res = self.session.request(method, url, headers={**self.auth_header(), **extra_headers}, **kwargs)
+        return res
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def _registrar_latencia(self, res: requests.Response, *args, **kwargs):
+        with self._stats_lock:
+            self._latencias[urlparse(res.url).netloc].append(res.elapsed.total_seconds())
+
+    def stats(self) -> dict:
+        stats = {}
+        with self._stats_lock:
+            for host, latencias in self._latencias.items():
+                stats[host] = {
+                    "requisicoes": len(latencias),
+                    "latencia_media_s": sum(latencias) / len(latencias),
+                    "latencia_max_s": max(latencias),
+                    "conexoes_novas": 0,
+                    "conexoes_reutilizadas": 0,
+                }
+
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            host_stats = stats.setdefault(host, {"requisicoes": 0, "latencia_media_s": 0.0,
+                                                 "latencia_max_s": 0.0, "conexoes_novas": 0,
+                                                 "conexoes_reutilizadas": 0})
+            host_stats["conexoes_novas"] += pool.num_connections
+            host_stats["conexoes_reutilizadas"] += max(pool.num_requests - pool.num_connections, 0)
+        return stats
+
+    def log_stats(self):
+        for host, host_stats in self.stats().items():
+            self.logger.info(
+                "HTTP %s: %d requisições, latência média %.3fs (máx %.3fs), conexões novas %d, reutilizadas %d",
+                host, host_stats["requisicoes"], host_stats["latencia_media_s"], host_stats["latencia_max_s"],
+                host_stats["conexoes_novas"], host_stats["conexoes_reutilizadas"],
+            )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
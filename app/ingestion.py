@@ -0,0 +1,248 @@
+import os
+import sqlite3
+import datetime
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import pandas as pd
+from middle.utils import setup_logger, sanitize_string, convert_date_columns
+from constants import (
+    MAPEAMENTO_DATASETS, INGESTAO_MAX_WORKERS, INGESTAO_DATASETS, CVU_CHUNK_SIZE, CVU_STATE_DIR,
+    CCEE_DADOS_ABERTOS_URL, CVU_COMPACT_DTYPES,
+)
+from datasets import DatasetSpec, load_specs, get_package, get_data_atualizacao_ckan
+from schema import compact_frame, constant_column
+from http_client import get_client
+from download_cache import DownloadCache
+from uploader import BatchUploader
+from tracing import get_tracer
+logger = setup_logger()
+
+# sanitize_string troca o "ç" de "preço" por "a" em alguns CSVs da CCEE
+CORRECOES_CABECALHO = {'codigo_modelo_preao': 'codigo_modelo_preco'}
+
+DATE_KEY_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def iter_dataset_chunks(download, spec: DatasetSpec, data_atualizacao: datetime.datetime,
+                        chunksize: Optional[int] = None, span: Callable = nullcontext,
+                        compacto: bool = CVU_COMPACT_DTYPES):
+    # O cabeçalho é lido antes para que os tipos de texto já sejam aplicados pelo parser,
+    # evitando inferência de colunas object; '-' é tratado como nulo na leitura. Colunas de texto
+    # seguem como no CSV: o CNPJ mantém os zeros à esquerda ('00000000000001', e não '1')
+    header = pd.read_csv(download.path, sep=",", nrows=0, encoding=download.encoding).columns
+    sanitized = {col: sanitize_string(col, '_').lower() for col in header}
+    sanitized = {col: CORRECOES_CABECALHO.get(name, name) for col, name in sanitized.items()}
+    text_columns = spec.text_columns
+    dtype = {col: str for col, name in sanitized.items() if name in text_columns}
+
+    reader = pd.read_csv(
+        download.path,
+        sep=",",
+        na_values=['-'],
+        dtype=dtype,
+        encoding=download.encoding,
+        chunksize=chunksize,
+    )
+    if chunksize is None:
+        reader = [reader]
+
+    # O span cobre leitura e transformação de cada bloco, não o consumidor do yield
+    blocos = iter(reader)
+    while True:
+        with span() as atual:
+            df = next(blocos, None)
+            if df is None:
+                break
+            df.columns = [sanitized[col] for col in df.columns]
+            df = transform_dataset(df, spec, data_atualizacao, compacto)
+            if atual is not None:
+                atual.linhas = len(df)
+                atual.atributos['memoria_frame_bytes'] = int(df.memory_usage(deep=True, index=False).sum())
+        # Um bloco só com notas de rodapé ('*') fica vazio após o filtro e não gera envio
+        if chunksize is not None and df.empty:
+            continue
+        yield df
+
+
+def transform_dataset(df: pd.DataFrame, spec: DatasetSpec, data_atualizacao: datetime.datetime,
+                      compacto: bool = CVU_COMPACT_DTYPES) -> pd.DataFrame:
+    for col, prefixo in spec.ignorar_prefixo.items():
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df = df.loc[~df[col].str.startswith(prefixo, na=False)].copy()
+
+    df = df.astype(spec.columns)
+    df = convert_date_columns(df)
+    df.columns = [col.lower() for col in df.columns]
+    df.rename(columns=spec.renames, errors='ignore', inplace=True)
+
+    # Nulos e infinitos seguem como NaN; a serialização os envia como null
+    if spec.decimais is not None:
+        df = df.round(spec.decimais)
+
+    for col, valor in spec.derivadas.items():
+        valor = valor(df, data_atualizacao) if callable(valor) else valor
+        if compacto and pd.api.types.is_scalar(valor):
+            valor = constant_column(valor, len(df))
+        df[col] = valor
+
+    if compacto:
+        df = compact_frame(df, spec.categoricas)
+    return df
+
+
+class IngestionState:
+    # Versões (data de atualização) de cada dataset já enviadas com sucesso
+
+    def __init__(self, path: str = os.path.join(CVU_STATE_DIR, "ingestao.sqlite")):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ingestoes ("
+                " dataset TEXT NOT NULL,"
+                " data_atualizacao TEXT NOT NULL,"
+                " linhas INTEGER NOT NULL,"
+                " concluido_em TEXT NOT NULL,"
+                " PRIMARY KEY (dataset, data_atualizacao))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def processado(self, dataset: str, data_atualizacao: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM ingestoes WHERE dataset = ? AND data_atualizacao = ?", (dataset, data_atualizacao)
+            ).fetchone()
+        return row is not None
+
+    def registrar(self, dataset: str, data_atualizacao: str, linhas: int):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingestoes (dataset, data_atualizacao, linhas, concluido_em)"
+                " VALUES (?, ?, ?, ?)",
+                (dataset, data_atualizacao, linhas, datetime.datetime.now().isoformat(timespec='seconds')),
+            )
+
+
+class IngestionEngine:
+    # Um pipeline para vários datasets declarativos: concorrência global limitada por max_workers,
+    # limite por host no cliente HTTP compartilhado e cache de downloads, uploader e package_show
+    # compartilhados entre os datasets da execução
+
+    def __init__(
+        self,
+        specs: dict = None,
+        max_workers: int = INGESTAO_MAX_WORKERS,
+        chunksize: Optional[int] = CVU_CHUNK_SIZE,
+        state: IngestionState = None,
+        base_url: str = CCEE_DADOS_ABERTOS_URL,
+    ):
+        self.logger = logger
+        self.specs = specs if specs is not None else load_specs(MAPEAMENTO_DATASETS)
+        self.max_workers = max(1, max_workers)
+        self.chunksize = chunksize
+        self.base_url = base_url
+        self.client = get_client()
+        self.download_cache = DownloadCache()
+        self.uploader = BatchUploader()
+        self.state = state or IngestionState()
+        self._packages = {}
+        self._package_locks = {}
+        self._lock = threading.Lock()
+        # Datasets que falharam na última execução
+        self.falhas = []
+
+    def run(self, nomes: list = None) -> list:
+        nomes = self._selecionar(nomes)
+        self.clear_metadata_cache()
+        self.falhas = []
+        self.logger.info("Ingerindo %d datasets (max_workers=%d)", len(nomes), self.max_workers)
+        processados = [nome for nome in self._map(self._processar, nomes) if nome]
+        self.logger.info("Ingestão concluída: %d de %d datasets atualizados", len(processados), len(nomes))
+        return processados
+
+    def get_datas_atualizacao(self, nomes: list = None) -> dict:
+        nomes = self._selecionar(nomes)
+        self.clear_metadata_cache()
+        datas = self._map(self.data_atualizacao, nomes)
+        return {nome: data.strftime(DATE_KEY_FORMAT) for nome, data in zip(nomes, datas)}
+
+    def data_atualizacao(self, nome: str) -> datetime.datetime:
+        # A versão é a do recurso: vários datasets do mesmo pacote compartilham metadata_modified, que muda
+        # com qualquer um deles; pacotes sem last_modified no recurso usam a data do pacote
+        spec = self.specs[nome]
+        package = self._get_package(spec.nome_ccee)
+        datas = get_data_atualizacao_ckan(self.client, self.base_url, spec, package)
+        return datas['resource_last_modified'] or datas['data_atualizacao']
+
+    def clear_metadata_cache(self):
+        with self._lock:
+            self._packages = {}
+            self._package_locks = {}
+
+    def _selecionar(self, nomes: Optional[list]) -> list:
+        nomes = list(nomes or INGESTAO_DATASETS or self.specs)
+        desconhecidos = [nome for nome in nomes if nome not in self.specs]
+        if desconhecidos:
+            raise ValueError(f"Datasets não mapeados: {desconhecidos}")
+        return nomes
+
+    def _map(self, func, itens: list) -> list:
+        if self.max_workers <= 1 or len(itens) <= 1:
+            return [func(item) for item in itens]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(itens))) as executor:
+            return list(executor.map(func, itens))
+
+    def _get_package(self, nome_ccee: str) -> dict:
+        # Vários datasets podem ser recursos do mesmo pacote: uma consulta por pacote e execução
+        with self._lock:
+            if nome_ccee in self._packages:
+                return self._packages[nome_ccee]
+            package_lock = self._package_locks.setdefault(nome_ccee, threading.Lock())
+
+        with package_lock:
+            if nome_ccee not in self._packages:
+                with get_tracer().span("IngestionEngine.package_show", pacote=nome_ccee):
+                    package = get_package(self.client, self.base_url, nome_ccee)
+                with self._lock:
+                    self._packages[nome_ccee] = package
+            return self._packages[nome_ccee]
+
+    def _processar(self, nome: str) -> Optional[str]:
+        spec = self.specs[nome]
+        tracer = get_tracer()
+        try:
+            with tracer.span("IngestionEngine.processar", nome) as span:
+                data_atualizacao = self.data_atualizacao(nome)
+                chave = data_atualizacao.strftime(DATE_KEY_FORMAT)
+                if self.state.processado(nome, chave):
+                    self.logger.info("Dataset %s já ingerido para %s", nome, chave)
+                    return None
+
+                with tracer.span("IngestionEngine.download", nome) as download_span:
+                    download = self.download_cache.fetch(spec.url)
+                    download_span.bytes_recebidos = download.transferred
+                    download_span.atributos['cache'] = download.from_cache
+
+                linhas = 0
+                blocos = iter_dataset_chunks(download, spec, data_atualizacao, self.chunksize,
+                                             span=lambda: tracer.span("IngestionEngine.parse", nome))
+                for df in blocos:
+                    with tracer.span("IngestionEngine.upload", nome) as upload_span:
+                        result = self.uploader.upload(spec.endpoint, df)
+                        upload_span.linhas = result.linhas
+                        upload_span.bytes_enviados = result.bytes
+                    linhas += result.linhas
+
+                span.linhas = linhas
+                self.state.registrar(nome, chave, linhas)
+            self.logger.info("Dataset %s ingerido: %d linhas (atualização %s)", nome, linhas, chave)
+            return nome
+
+        except Exception as e:
+            self.logger.error("Falha ao ingerir dataset %s: %s", nome, str(e), exc_info=True)
+            self.falhas.append(nome)
+            return None
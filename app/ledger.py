@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+from middle.utils import setup_logger
+from constants import CVU_STATE_DIR
+logger = setup_logger()
+
+DATE_KEY_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+@dataclass
+class LedgerEntry:
+    tipo_cvu: str
+    data_atualizacao: str
+    id_check: Optional[int]
+
+
+class ProcessingLedger:
+    # Versões (tipo_cvu, data_atualizacao) já processadas, espelho local do check-cvu do backend;
+    # sincronizado = 0 marca as que ainda precisam do PATCH de status no backend
+
+    def __init__(self, path: str = os.path.join(CVU_STATE_DIR, "ledger.sqlite")):
+        self.logger = logger
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS processados ("
+                " tipo_cvu TEXT NOT NULL,"
+                " data_atualizacao TEXT NOT NULL,"
+                " id_check INTEGER,"
+                " sincronizado INTEGER NOT NULL,"
+                " atualizado_em TEXT NOT NULL,"
+                " PRIMARY KEY (tipo_cvu, data_atualizacao))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def processado(self, tipo_cvu: str, data_atualizacao: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM processados WHERE tipo_cvu = ? AND data_atualizacao = ?", (tipo_cvu, data_atualizacao)
+            ).fetchone()
+        return row is not None
+
+    def registrar(self, tipo_cvu: str, data_atualizacao: str, id_check: Optional[int] = None,
+                  sincronizado: bool = True):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO processados"
+                " (tipo_cvu, data_atualizacao, id_check, sincronizado, atualizado_em) VALUES (?, ?, ?, ?, ?)",
+                (tipo_cvu, data_atualizacao, id_check, int(sincronizado), _agora()),
+            )
+
+    def registrar_varios(self, versoes: list):
+        # Reconciliação: versões já processadas segundo o backend; não sobrescreve pendências locais
+        with self._connect() as conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO processados"
+                " (tipo_cvu, data_atualizacao, id_check, sincronizado, atualizado_em) VALUES (?, ?, NULL, 1, ?)",
+                [(tipo_cvu, data_atualizacao, _agora()) for tipo_cvu, data_atualizacao in versoes],
+            )
+        return cursor.rowcount
+
+    def pendentes(self) -> list:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT tipo_cvu, data_atualizacao, id_check FROM processados WHERE sincronizado = 0"
+            ).fetchall()
+        return [LedgerEntry(*row) for row in rows]
+
+    def marcar_sincronizado(self, tipo_cvu: str, data_atualizacao: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE processados SET sincronizado = 1, atualizado_em = ? WHERE tipo_cvu = ? AND data_atualizacao = ?",
+                (_agora(), tipo_cvu, data_atualizacao),
+            )
+
+
+def normalizar_data(valor) -> Optional[str]:
+    # Datas do backend vêm como "2025-01-10T14:32:00", "2025-01-10 14:32:00" ou com fuso
+    try:
+        data = valor if isinstance(valor, datetime.datetime) else datetime.datetime.fromisoformat(str(valor))
+    except ValueError:
+        return None
+    return data.replace(tzinfo=None).strftime(DATE_KEY_FORMAT)
+
+
+def _agora() -> str:
+    return datetime.datetime.now().isoformat(timespec='seconds')
@@ -1,9 +1,20 @@
-from typing import Dict, Type
-from app.TasksInterface import TasksInterface
-from middle.utils import Constants
-from app.tasks import Cvu
-
-constants = Constants()
-PRODUCT_MAPPING: Dict[str, Type[TasksInterface]] = {
-    "cvu": Cvu,
-}
\ No newline at end of file
+from __future__ import annotations
+import importlib
+from typing import TYPE_CHECKING, Dict, Type
+
+if TYPE_CHECKING:
+    from app.TasksInterface import TasksInterface
+
+# Caminho pontuado "modulo:Classe" por produto; o módulo só é importado quando o produto é executado,
+# então adicionar produtos não aumenta o tempo de inicialização dos demais
+PRODUCT_MAPPING: Dict[str, str] = {
+    "cvu": "app.tasks.cvu:Cvu",
+    "dados_abertos": "app.tasks.dados_abertos:DadosAbertos",
+}
+
+
+def load_handler(nome: str) -> Type[TasksInterface]:
+    if nome not in PRODUCT_MAPPING:
+        raise KeyError(nome)
+    modulo, _, classe = PRODUCT_MAPPING[nome].partition(":")
+    return getattr(importlib.import_module(modulo), classe)
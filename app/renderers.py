@@ -0,0 +1,131 @@
+import io
+from abc import ABC, abstractmethod
+import pandas as pd
+from middle.utils import setup_logger
+from constants import CVU_TABLE_RENDERER
+logger = setup_logger()
+
+HEADER_COLOR = "#E0E0E0"
+
+TABLE_CSS = (
+    '<style type="text/css">'
+    'caption {background-color: #E0E0E0; color: black;}'
+    'th {background-color: #E0E0E0; color: black; min-width: 80px;}'
+    'td {min-width: 80px;}'
+    'table {text-align: center; border-collapse: collapse; border 2px solid black !important}'
+    '</style>'
+)
+
+
+class TableRenderer(ABC):
+
+    @abstractmethod
+    def render(self, df: pd.DataFrame, caption: str) -> bytes:
+        pass
+
+
+class HtmlTableRenderer(TableRenderer):
+    # Caminho original: Styler -> HTML com CSS -> middle.utils.html_to_image
+
+    def render(self, df: pd.DataFrame, caption: str) -> bytes:
+        from middle.utils import html_to_image
+
+        styler = df.style.format(na_rep='', precision=0)
+        styler.set_caption(caption)
+        html = styler.to_html()
+        html = html.replace('<style type="text/css">\n</style>\n', TABLE_CSS)
+        return html_to_image(html)
+
+
+class PillowTableRenderer(TableRenderer):
+    # Desenha a tabela direto em PNG no processo; fontes carregadas uma vez e reutilizadas
+
+    def __init__(self, font_size: int = 14, padding: int = 6, min_width: int = 80):
+        from PIL import Image, ImageDraw, ImageFont
+
+        self._image = Image
+        self._draw = ImageDraw
+        self.padding = padding
+        self.min_width = min_width
+        self.font = self._load_font(ImageFont, "DejaVuSans.ttf", font_size)
+        self.font_bold = self._load_font(ImageFont, "DejaVuSans-Bold.ttf", font_size)
+        ascent, descent = self.font.getmetrics()
+        self.row_height = ascent + descent + 2 * padding
+
+    @staticmethod
+    def _load_font(image_font, nome: str, size: int):
+        try:
+            return image_font.truetype(nome, size)
+        except OSError:
+            try:
+                return image_font.load_default(size=size)
+            except TypeError:
+                # Pillow < 10.1 só tem a fonte bitmap sem tamanho configurável
+                return image_font.load_default()
+
+    def render(self, df: pd.DataFrame, caption: str) -> bytes:
+        header = [str(df.columns.name or '')] + [str(col) for col in df.columns]
+        body = [[_format_cell(indice)] + [_format_cell(valor) for valor in linha]
+                for indice, linha in zip(df.index, df.itertuples(index=False, name=None))]
+
+        larguras = [
+            max([self.min_width] + [int(self.font_bold.getlength(header[j])) + 2 * self.padding]
+                + [int(self.font.getlength(linha[j])) + 2 * self.padding for linha in body])
+            for j in range(len(header))
+        ]
+        largura_total = sum(larguras) + 1
+        altura_total = self.row_height * (len(body) + 2) + 1
+
+        imagem = self._image.new("RGB", (largura_total, altura_total), "white")
+        draw = self._draw.Draw(imagem)
+
+        draw.rectangle([0, 0, largura_total - 1, self.row_height], fill=HEADER_COLOR)
+        self._text(draw, caption.strip(), 0, 0, largura_total, self.font_bold)
+
+        y = self.row_height
+        self._row(draw, header, larguras, y, self.font_bold, fill=HEADER_COLOR)
+        for linha in body:
+            y += self.row_height
+            # A primeira coluna (índice) é cabeçalho de linha, como no HTML do Styler
+            self._row(draw, linha, larguras, y, self.font, fill=None, index_fill=HEADER_COLOR)
+
+        buffer = io.BytesIO()
+        imagem.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def _row(self, draw, valores: list, larguras: list, y: int, font, fill=None, index_fill=None):
+        x = 0
+        for j, (valor, largura) in enumerate(zip(valores, larguras)):
+            cor = index_fill if j == 0 and index_fill else fill
+            draw.rectangle([x, y, x + largura, y + self.row_height], fill=cor, outline="black")
+            self._text(draw, valor, x, y, largura, self.font_bold if cor and j == 0 else font)
+            x += largura
+
+    def _text(self, draw, texto: str, x: int, y: int, largura: int, font):
+        largura_texto = font.getlength(texto)
+        draw.text((x + (largura - largura_texto) / 2, y + self.padding), texto, fill="black", font=font)
+
+
+def _format_cell(valor) -> str:
+    # Mesmo formato do Styler: na_rep='' e precisão 0 para números
+    if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+        return ''
+    if isinstance(valor, float):
+        return f"{valor:.0f}"
+    return str(valor)
+
+
+RENDERERS = {
+    "html": HtmlTableRenderer,
+    "pillow": PillowTableRenderer,
+}
+
+
+def get_renderer(nome: str = CVU_TABLE_RENDERER) -> TableRenderer:
+    if nome not in RENDERERS:
+        raise ValueError(f"Renderizador de tabela desconhecido: {nome}")
+    try:
+        return RENDERERS[nome]()
+    except ImportError as e:
+        logger.warning("Renderizador %s indisponível (%s), usando html", nome, str(e))
+        return HtmlTableRenderer()
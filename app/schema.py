@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+
+def compact_frame(df: pd.DataFrame, categoricas: list = ()) -> pd.DataFrame:
+    # Aplicado sobre os tipos Python de MAPEAMENTO_CVU: inteiros no menor tipo anulável que comporta
+    # os valores, floats como Float64 anulável (Float32 não representa exatamente valores com duas
+    # casas) e chaves de baixa cardinalidade como category (códigos int8/int16 em vez de uma str por linha)
+    for col in df.columns:
+        dtype = df[col].dtype
+        if col in categoricas:
+            if not isinstance(dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        elif pd.api.types.is_integer_dtype(dtype):
+            df[col] = pd.to_numeric(df[col].astype("Int64"), downcast="integer")
+        elif pd.api.types.is_float_dtype(dtype) and not isinstance(dtype, pd.Float64Dtype):
+            df[col] = df[col].astype("Float64")
+    return df
+
+
+def constant_column(valor, linhas: int) -> pd.Categorical:
+    # Coluna constante (tipo_cvu, fonte, dt_atualizacao): uma categoria e códigos int8 zerados
+    return pd.Categorical.from_codes(np.zeros(linhas, dtype=np.int8), categories=[valor])
+
+
+def memory_report(df: pd.DataFrame) -> dict:
+    por_coluna = df.memory_usage(deep=True, index=False)
+    return {
+        "linhas": len(df),
+        "bytes": int(por_coluna.sum()),
+        "bytes_por_linha": float(por_coluna.sum() / len(df)) if len(df) else 0.0,
+        "colunas": {col: {"dtype": str(df[col].dtype), "bytes": int(bytes_)} for col, bytes_ in por_coluna.items()},
+    }
@@ -0,0 +1,81 @@
+from itertools import repeat
+from json import dumps
+from json.encoder import encode_basestring_ascii
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def dataframe_to_json(df: pd.DataFrame, date_format: str = DATE_FORMAT) -> bytes:
+    # Cada coluna vira um vetor de fragmentos JSON já codificados; as linhas são montadas
+    # intercalando os fragmentos com os prefixos fixos '{"coluna":', sem criar um dict por linha
+    if df.empty:
+        return b'[]'
+
+    parts = []
+    for i, col in enumerate(df.columns):
+        prefix = '{' if i == 0 else ','
+        parts.append(repeat(f'{prefix}{encode_basestring_ascii(str(col))}:'))
+        parts.append(encode_column(df[col], date_format))
+    parts.append(repeat('}'))
+
+    rows = map(''.join, zip(*parts))
+    return ('[' + ','.join(rows) + ']').encode('utf-8')
+
+
+def encode_column(col: pd.Series, date_format: str = DATE_FORMAT) -> list:
+    dtype = col.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Cada categoria é codificada uma única vez e expandida pelos códigos
+        categories = np.array(encode_column(pd.Series(dtype.categories), date_format) + ['null'], dtype=object)
+        codes = col.cat.codes.to_numpy()
+        return categories[np.where(codes < 0, len(categories) - 1, codes)].tolist()
+
+    mask = col.isna().to_numpy()
+
+    if pd.api.types.is_bool_dtype(dtype):
+        values = col.to_numpy(dtype=bool, na_value=False)
+        fragments = np.where(values, 'true', 'false').astype(object)
+    elif pd.api.types.is_integer_dtype(dtype):
+        fragments = col.to_numpy(dtype=np.int64, na_value=0).astype(str).astype(object)
+    elif pd.api.types.is_float_dtype(dtype):
+        values = col.to_numpy(dtype=np.float64, na_value=np.nan)
+        mask = ~np.isfinite(values)
+        fragments = np.where(mask, 0.0, values).astype(str).astype(object)
+    else:
+        # Texto, datas e valores mistos: codifica apenas os valores distintos
+        # (factorize é vetorizado) e expande pelos códigos; -1 marca nulo
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            col = col.dt.strftime(date_format)
+        codes, uniques = pd.factorize(col.to_numpy(dtype=object), use_na_sentinel=True)
+        encoded = [_encode_value(value, date_format) for value in uniques] + ['null']
+        return np.array(encoded, dtype=object)[codes].tolist()
+
+    if mask.any():
+        fragments[mask] = 'null'
+    return fragments.tolist()
+
+
+def _quote_string(value: str) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return encode_basestring_ascii(value)
+
+
+def _encode_value(value, date_format: str = DATE_FORMAT) -> str:
+    if isinstance(value, str):
+        return _quote_string(value)
+    if isinstance(value, float) and not np.isfinite(value):
+        return 'null'
+    if hasattr(value, 'strftime'):
+        return _quote_string(value.strftime(date_format))
+    if isinstance(value, np.generic):
+        value = value.item()
+    return dumps(value)
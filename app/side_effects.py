@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import datetime
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from middle.utils import setup_logger
+from constants import (
+    CVU_STATE_DIR, CVU_EFEITOS_MAX_WORKERS, CVU_EFEITOS_TENTATIVAS, CVU_EFEITOS_BACKOFF, CVU_EFEITOS_RETENCAO_DIAS,
+)
+from tracing import get_tracer
+logger = setup_logger()
+
+
+@dataclass
+class SideEffect:
+    id: int
+    acao: str
+    tipo_cvu: str
+    dt_produto: str
+    revisao: str
+    payload: dict
+    tentativas: int
+
+
+class SideEffectQueue:
+    # Fila durável dos efeitos pós-ingestão; (acao, tipo_cvu, dt_produto, revisao) é único, então
+    # reenfileirar o mesmo efeito não duplica o trigger nem a mensagem, mas uma segunda revisão
+    # publicada no mesmo dia (outra data_atualizacao) gera os seus
+
+    def __init__(self, path: str = os.path.join(CVU_STATE_DIR, "efeitos.sqlite")):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(efeitos)")}
+            if colunas and "revisao" not in colunas:
+                # Fila criada antes da revisão na chave: os efeitos existentes ficam com revisão vazia
+                conn.execute("ALTER TABLE efeitos RENAME TO efeitos_sem_revisao")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS efeitos ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " acao TEXT NOT NULL,"
+                " tipo_cvu TEXT NOT NULL,"
+                " dt_produto TEXT NOT NULL,"
+                " revisao TEXT NOT NULL DEFAULT '',"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'pendente',"
+                " tentativas INTEGER NOT NULL DEFAULT 0,"
+                " erro TEXT,"
+                " atualizado_em TEXT NOT NULL,"
+                " UNIQUE (acao, tipo_cvu, dt_produto, revisao))"
+            )
+            if colunas and "revisao" not in colunas:
+                conn.execute(
+                    "INSERT INTO efeitos (id, acao, tipo_cvu, dt_produto, payload, status, tentativas, erro,"
+                    " atualizado_em) SELECT id, acao, tipo_cvu, dt_produto, payload, status, tentativas, erro,"
+                    " atualizado_em FROM efeitos_sem_revisao"
+                )
+                conn.execute("DROP TABLE efeitos_sem_revisao")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def enqueue(self, acao: str, tipo_cvu: str, dt_produto: str, revisao: str, payload: dict) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO efeitos (acao, tipo_cvu, dt_produto, revisao, payload, atualizado_em)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (acao, tipo_cvu, dt_produto, revisao, json.dumps(payload, ensure_ascii=False), _agora()),
+            )
+        return cursor.rowcount > 0
+
+    def pending(self, max_tentativas: int = CVU_EFEITOS_TENTATIVAS) -> list:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, acao, tipo_cvu, dt_produto, revisao, payload, tentativas FROM efeitos"
+                " WHERE status != 'concluido' AND tentativas < ? ORDER BY id",
+                (max_tentativas,),
+            ).fetchall()
+        return [SideEffect(id, acao, tipo_cvu, dt_produto, revisao, json.loads(payload), tentativas)
+                for id, acao, tipo_cvu, dt_produto, revisao, payload, tentativas in rows]
+
+    def mark(self, efeito_id: int, status: str, erro: str = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE efeitos SET status = ?, erro = ?, tentativas = tentativas + 1, atualizado_em = ?"
+                " WHERE id = ?",
+                (status, erro, _agora(), efeito_id),
+            )
+
+    def prune(self, dias: int = CVU_EFEITOS_RETENCAO_DIAS):
+        limite = (datetime.datetime.now() - datetime.timedelta(days=dias)).isoformat(timespec='seconds')
+        with self._connect() as conn:
+            conn.execute("DELETE FROM efeitos WHERE status = 'concluido' AND atualizado_em < ?", (limite,))
+
+
+class SideEffectDispatcher:
+    # Executa os efeitos pendentes da fila em paralelo, com retry e backoff por efeito; efeitos que
+    # não concluíram (inclusive por queda do processo) são retomados na próxima execução até
+    # somarem max_tentativas
+
+    def __init__(
+        self,
+        queue: SideEffectQueue = None,
+        max_workers: int = CVU_EFEITOS_MAX_WORKERS,
+        max_tentativas: int = CVU_EFEITOS_TENTATIVAS,
+        backoff: float = CVU_EFEITOS_BACKOFF,
+    ):
+        self.logger = logger
+        self.queue = queue or SideEffectQueue()
+        self.max_workers = max(1, max_workers)
+        self.max_tentativas = max_tentativas
+        self.backoff = backoff
+        self.handlers = {}
+
+    def register(self, acao: str, handler: Callable[[dict], object]):
+        self.handlers[acao] = handler
+
+    def enqueue(self, acao: str, tipo_cvu: str, dt_produto: str, revisao: str, payload: dict):
+        if acao not in self.handlers:
+            raise ValueError(f"Efeito sem handler registrado: {acao}")
+        if not self.queue.enqueue(acao, tipo_cvu, dt_produto, revisao, payload):
+            self.logger.info("Efeito %s para %s em %s (revisão %s) já enfileirado", acao, tipo_cvu, dt_produto, revisao)
+
+    def drain(self) -> dict:
+        efeitos = [efeito for efeito in self.queue.pending(self.max_tentativas) if efeito.acao in self.handlers]
+        if not efeitos:
+            return {"concluidos": 0, "falhas": 0}
+
+        # Revisões pendentes juntas com o mesmo payload (ex.: conjuntural e conjuntural_revisado)
+        # disparam o efeito uma vez; as cópias são concluídas com ele
+        grupos = {}
+        for efeito in efeitos:
+            chave = (efeito.acao, json.dumps(efeito.payload, sort_keys=True))
+            grupos.setdefault(chave, []).append(efeito)
+        grupos = list(grupos.values())
+
+        self.logger.info("Executando %d efeitos pendentes (max_workers=%d)", len(grupos), self.max_workers)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(grupos))) as executor:
+            resultados = list(executor.map(self._executar_grupo, grupos))
+        self.queue.prune()
+
+        resumo = {"concluidos": sum(resultados), "falhas": len(resultados) - sum(resultados)}
+        self.logger.info("Efeitos concluídos: %d, com falha: %d", resumo["concluidos"], resumo["falhas"])
+        return resumo
+
+    def _executar_grupo(self, grupo: list) -> bool:
+        if not self._executar(grupo[0]):
+            return False
+        for copia in grupo[1:]:
+            self.queue.mark(copia.id, 'concluido')
+        return True
+
+    def _executar(self, efeito: SideEffect) -> bool:
+        tentativas = efeito.tentativas
+        while tentativas < self.max_tentativas:
+            try:
+                with get_tracer().span(f"SideEffectDispatcher.{efeito.acao}", efeito.tipo_cvu):
+                    self.handlers[efeito.acao](efeito.payload)
+            except Exception as e:
+                tentativas += 1
+                self.queue.mark(efeito.id, 'falhou', f"{type(e).__name__}: {e}")
+                if tentativas >= self.max_tentativas:
+                    self.logger.error("Efeito %s para %s esgotou %d tentativas: %s",
+                                      efeito.acao, efeito.tipo_cvu, tentativas, str(e), exc_info=True)
+                    break
+                espera = self.backoff * (2 ** (tentativas - efeito.tentativas - 1)) * (1 + random.random())
+                self.logger.warning("Falha no efeito %s para %s (%s), nova tentativa em %.1fs",
+                                    efeito.acao, efeito.tipo_cvu, str(e), espera)
+                time.sleep(espera)
+            else:
+                self.queue.mark(efeito.id, 'concluido')
+                return True
+        return False
+
+
+def _agora() -> str:
+    return datetime.datetime.now().isoformat(timespec='seconds')
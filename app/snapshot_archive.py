@@ -0,0 +1,184 @@
+import os
+import uuid
+import shutil
+import datetime
+from typing import Optional
+import pandas as pd
+from middle.utils import setup_logger
+from constants import CVU_ARCHIVE_DIR
+logger = setup_logger()
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs
+except ImportError:
+    pa = None
+
+# Colunas de partição: ficam só no caminho (tipo_cvu=.../dt_atualizacao=...), não nos arquivos.
+# tipo_cvu é o tipo da fonte, com "_revisado"
+PARTITION_COLUMNS = ["tipo_cvu", "dt_atualizacao"]
+# Tipos fixos no arquivo para que partições de tipos diferentes formem um único dataset
+# (conjuntural e merchant derivam ano_horizonte como texto)
+FIXED_TYPES = {"cd_usina": "int64", "ano_horizonte": "int64"}
+
+
+class SnapshotArchive:
+    # Arquivo local de snapshots em Parquet particionado por tipo_cvu e dt_atualizacao. As leituras
+    # filtram partições pelo caminho (pushdown) e usam memory map no sistema de arquivos local
+
+    def __init__(self, root: str = CVU_ARCHIVE_DIR):
+        if pa is None:
+            raise ImportError("pyarrow não instalado, arquivo de snapshots indisponível")
+        self.logger = logger
+        self.root = root
+        self.filesystem = fs.LocalFileSystem(use_mmap=True)
+        self.partitioning = ds.partitioning(
+            pa.schema([("tipo_cvu", pa.string()), ("dt_atualizacao", pa.string())]), flavor="hive"
+        )
+        os.makedirs(root, exist_ok=True)
+
+    def writer(self, tipo_cvu: str, dt_atualizacao) -> "SnapshotWriter":
+        return SnapshotWriter(self, tipo_cvu, _date_key(dt_atualizacao))
+
+    def write(self, tipo_cvu: str, dt_atualizacao, df: pd.DataFrame):
+        with self.writer(tipo_cvu, dt_atualizacao) as writer:
+            writer.write(df)
+
+    def partition_path(self, tipo_cvu: str, dt_atualizacao) -> str:
+        return os.path.join(self.root, f"tipo_cvu={tipo_cvu}", f"dt_atualizacao={_date_key(dt_atualizacao)}")
+
+    def has(self, tipo_cvu: str, dt_atualizacao) -> bool:
+        return os.path.isdir(self.partition_path(tipo_cvu, dt_atualizacao))
+
+    def snapshots(self, tipo_cvu: str) -> list:
+        # Datas arquivadas do tipo, da mais recente para a mais antiga
+        tipo_dir = os.path.join(self.root, f"tipo_cvu={tipo_cvu}")
+        if not os.path.isdir(tipo_dir):
+            return []
+        datas = [nome.split("=", 1)[1] for nome in os.listdir(tipo_dir) if nome.startswith("dt_atualizacao=")]
+        return sorted(datas, reverse=True)
+
+    def read(self, tipo_cvu: str, dt_atualizacao, columns: list = None) -> Optional[pd.DataFrame]:
+        if not self.has(tipo_cvu, dt_atualizacao):
+            return None
+        # Uma partição só: abre o diretório direto, sem descobrir o restante do arquivo
+        dataset = ds.dataset(self.partition_path(tipo_cvu, dt_atualizacao), format="parquet",
+                             filesystem=self.filesystem, exclude_invalid_files=True)
+        if columns is not None:
+            columns = [col for col in columns if col in dataset.schema.names]
+        return dataset.to_table(columns=columns).to_pandas()
+
+    def scan(self, tipos_cvu: list = None, desde=None, ate=None, columns: list = None,
+             filtro=None) -> pd.DataFrame:
+        # Histórico de vários tipos e datas de uma vez; os filtros de partição descartam diretórios
+        # sem abri-los e filtro (expressão pyarrow.dataset) é aplicado sobre as linhas
+        dataset = self._dataset()
+        if dataset is None:
+            return pd.DataFrame(columns=columns or [])
+
+        expressao = None
+        if tipos_cvu:
+            expressao = _and(expressao, ds.field("tipo_cvu").isin(list(tipos_cvu)))
+        if desde is not None:
+            expressao = _and(expressao, ds.field("dt_atualizacao") >= _date_key(desde))
+        if ate is not None:
+            expressao = _and(expressao, ds.field("dt_atualizacao") <= _date_key(ate))
+        if filtro is not None:
+            expressao = _and(expressao, filtro)
+
+        if columns is not None:
+            columns = [col for col in columns if col in dataset.schema.names]
+        return dataset.to_table(columns=columns, filter=expressao).to_pandas()
+
+    def _dataset(self):
+        arquivos = ds.dataset(self.root, format="parquet", partitioning=self.partitioning,
+                              filesystem=self.filesystem, exclude_invalid_files=True)
+        fragments = list(arquivos.get_fragments())
+        if not fragments:
+            return None
+        # Tipos têm colunas diferentes (merchant, estrutural): esquema unificado de todos os arquivos
+        schema = pa.unify_schemas([fragment.physical_schema for fragment in fragments] + [self.partitioning.schema])
+        return ds.dataset(self.root, schema=schema, format="parquet", partitioning=self.partitioning,
+                          filesystem=self.filesystem, exclude_invalid_files=True)
+
+
+class SnapshotWriter:
+    # Grava as partes de um snapshot num diretório temporário e só substitui a partição no commit,
+    # então uma falha no meio do envio não deixa snapshot parcial no arquivo
+
+    def __init__(self, archive: SnapshotArchive, tipo_cvu: str, dt_atualizacao: str):
+        self.archive = archive
+        self.tipo_cvu = tipo_cvu
+        self.dt_atualizacao = dt_atualizacao
+        self.destino = archive.partition_path(tipo_cvu, dt_atualizacao)
+        self.tmp_dir = os.path.join(archive.root, f".tmp-{uuid.uuid4().hex}")
+        self.partes = 0
+        self.linhas = 0
+
+    def write(self, df: pd.DataFrame):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        table = _to_arrow(df.drop(columns=[col for col in PARTITION_COLUMNS if col in df.columns]))
+        pq.write_table(table, os.path.join(self.tmp_dir, f"part-{self.partes:05d}.parquet"), compression="zstd")
+        self.partes += 1
+        self.linhas += len(df)
+
+    def commit(self):
+        if not self.partes:
+            return
+        os.makedirs(os.path.dirname(self.destino), exist_ok=True)
+        antigo = None
+        if os.path.isdir(self.destino):
+            antigo = self.tmp_dir + "-antigo"
+            os.replace(self.destino, antigo)
+        os.replace(self.tmp_dir, self.destino)
+        if antigo:
+            shutil.rmtree(antigo, ignore_errors=True)
+        logger.info("Snapshot %s de %s arquivado: %d linhas em %d partes",
+                    self.tipo_cvu, self.dt_atualizacao, self.linhas, self.partes)
+
+    def abort(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def _to_arrow(df: pd.DataFrame):
+    # Categorias e inteiros reduzidos variam entre blocos e tipos: o arquivo guarda os tipos de valor
+    # (o Parquet já codifica por dicionário) para que todas as partes tenham o mesmo esquema
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.cast(pa.schema([pa.field(field.name, _tipo_arquivo(field.type)) for field in table.schema]))
+    return table.cast(pa.schema([
+        pa.field(field.name, pa.type_for_alias(FIXED_TYPES[field.name]) if field.name in FIXED_TYPES else field.type)
+        for field in table.schema
+    ]))
+
+
+def _tipo_arquivo(tipo):
+    if pa.types.is_dictionary(tipo):
+        tipo = tipo.value_type
+    if pa.types.is_integer(tipo):
+        return pa.int64()
+    if pa.types.is_floating(tipo):
+        return pa.float64()
+    if pa.types.is_large_string(tipo):
+        return pa.string()
+    return tipo
+
+
+def _date_key(valor) -> str:
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.strftime("%Y-%m-%d")
+    return str(valor)[:10]
+
+
+def _and(expressao, outra):
+    return outra if expressao is None else expressao & outra
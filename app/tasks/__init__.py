@@ -1,5 +1,18 @@
-from .cvu import Cvu
+import importlib
+
+# Import sob demanda: "from app.tasks import Cvu" continua funcionando sem carregar todos os produtos
+_HANDLERS = {
+    "Cvu": ".cvu",
+    "DadosAbertos": ".dados_abertos",
+}
 
 __all__ = [
     "Cvu",
-]
\ No newline at end of file
+    "DadosAbertos",
+]
+
+
+def __getattr__(nome: str):
+    if nome not in _HANDLERS:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    return getattr(importlib.import_module(_HANDLERS[nome], __name__), nome)
@@ -1,55 +1,168 @@
+from __future__ import annotations
 import os
 import sys
-import requests
-import pandas as pd
-import numpy as np
-from io import StringIO
-from bs4 import BeautifulSoup
+import time
 import datetime
-from middle.utils import html_to_image
-from middle.message import send_whatsapp_message
-from middle.utils import setup_logger, Constants, get_auth_header, sanitize_string, convert_date_columns
-from middle.airflow import trigger_dag
+import threading
+from functools import cached_property
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable
+from middle.utils import setup_logger
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from constants import MAPEAMENTO_CVU
+from constants import (
+    MAPEAMENTO_CVU, CVU_MAX_WORKERS, CVU_CHUNK_SIZE, CVU_DELTA_MODE, CVU_DELTA_BACKEND_ULTIMO_VALOR, CVU_FULL_RESYNC,
+    CVU_REFERENCE_TTL, CVU_LEDGER, CVU_ARCHIVE, CVU_TREND_INDEX, CCEE_DADOS_ABERTOS_URL, constants,
+)
 from TasksInterface import TasksInterface
+from datasets import load_specs, get_data_atualizacao_ckan
+from http_client import get_client
+from download_cache import DownloadCache
+from side_effects import SideEffectDispatcher
+from ledger import ProcessingLedger, normalizar_data
+from tracing import traced
 logger = setup_logger()
-constants = Constants()
+
+# pandas, renderização e mensageria são importados só nas etapas que os usam: a verificação
+# de datas (daemon e execuções sem novidade) não carrega nenhum deles
+if TYPE_CHECKING:
+    import pandas as pd
+    from renderers import TableRenderer
+
+
+def trigger_dag(*args, **kwargs):
+    from middle.airflow import trigger_dag as _trigger_dag
+    return _trigger_dag(*args, **kwargs)
+
+
+def send_whatsapp_message(*args, **kwargs):
+    from middle.message import send_whatsapp_message as _send_whatsapp_message
+    return _send_whatsapp_message(*args, **kwargs)
+
+
+# Colunas lidas do arquivo de snapshots para a tabela de revisão
+COLUNAS_ARQUIVO = ['cd_usina', 'mes_referencia', 'ano_horizonte', 'vl_cvu', 'vl_cvu_cf']
+
+
+def _open_archive():
+    from snapshot_archive import SnapshotArchive
+    try:
+        return SnapshotArchive()
+    except ImportError as e:
+        logger.warning("Arquivo de snapshots desativado: %s", str(e))
+        return None
+
 
 class Cvu(TasksInterface):
     
     def __init__(self):
-        self.read_cvu = ReadCvu()  
         self.trigger_dag = trigger_dag      
-        self.generate_table = GenerateTable()
+        # Trigger da DAG e tabela no WhatsApp saem do caminho da ingestão: ficam numa fila local
+        # e são executados depois, em paralelo e com retry
+        self.efeitos = SideEffectDispatcher()
+        self.efeitos.register("trigger_dag", lambda payload: self.trigger_dag(**payload))
+        self.efeitos.register("tabela_cvu", lambda payload: self.generate_table.run_process([payload["tipo_cvu"]]))
+        self.read_cvu = ReadCvu(ao_processar=self.enfileirar_efeitos)  
         logger.info("CVU inicializado com payload")
     
+    @cached_property
+    def generate_table(self) -> GenerateTable:
+        # Criado só quando há tabela a gerar
+        return GenerateTable()
+    
     def run_workflow(self):
         logger.info("Iniciando workflow para CVU")
-        self.run_process()
+        return self.run_process()
+    
+    def get_freshness(self) -> dict:
+        return self.read_cvu.get_datas_atualizacao()
+    
+    def run_pending(self):
+        # Entre execuções do workflow: PATCHes de status e efeitos que ficaram para trás
+        if self.read_cvu.ledger is not None:
+            self.read_cvu.sincronizar_ledger()
+        self.drenar_efeitos()
+    
+    def drenar_efeitos(self):
+        # Cada drenagem é uma execução para GenerateTable: o histórico e os nomes das usinas são consultados
+        # de novo (uma vez, compartilhados pelas tabelas em paralelo), mesmo com o handler mantido pelo daemon
+        if 'generate_table' in self.__dict__:
+            self.generate_table.clear_cache()
+        self.efeitos.drain()
+    
+    def enfileirar_efeitos(self, tipo_cvu: str, data_atualizacao: str):
+        # Chamado por ReadCvu para cada tipo enviado, antes de a versão constar como processada
+        # (ledger ou PATCH): uma queda entre os dois não perde o trigger nem a tabela
+        tipo = tipo_cvu.replace('_revisado', '')
+        dt_produto = datetime.datetime.now().strftime('%d/%m/%Y')
+        logger.info("Enfileirando DAG 1.18-PROSPEC_UPDATE e tabela para o CVU %s", tipo)
+        # A revisão (data_atualizacao da CCEE) entra na chave: uma segunda publicação no mesmo dia notifica de novo
+        revisao = f"{tipo_cvu}@{data_atualizacao}"
+        self.efeitos.enqueue("trigger_dag", tipo, dt_produto, revisao, {
+            "dag_id": "1.18-PROSPEC_UPDATE",
+            "conf": {"produto": "CVU", "tipo_cvu": tipo, "dt_produto": dt_produto},
+        })
+        self.efeitos.enqueue("tabela_cvu", tipo, dt_produto, revisao, {"tipo_cvu": tipo})
     
+    @traced()
     def run_process(self):
         logger.info("Executando processo para CVU")
         cvus_processados = self.read_cvu.run_workflow()
         
         if cvus_processados:
-            logger.info("Acionando DAG 1.18-PROSPEC_UPDATE com conf: {'produto': 'CVU'}")
-            for tipo in cvus_processados:
-                logger.info("Tipo de CVU processado: %s", tipo)
-                self.trigger_dag(dag_id="1.18-PROSPEC_UPDATE", 
-                conf={"produto": "CVU", "tipo_cvu": tipo, 'dt_produto':datetime.datetime.now().strftime('%d/%m/%Y')})
-            
-            logger.info("Gerando tabelas para os CVUs processados: %s", cvus_processados)
-            self.generate_table.run_workflow(cvus_processados)
+            logger.info("Ingestão de CVU concluída: %s", cvus_processados)
         else:
             logger.info("Nenhum CVU foi processado, pulando DAG e geração de tabelas")
+        if self.read_cvu.falhas:
+            logger.warning("CVUs com falha, reprocessados na próxima execução: %s", self.read_cvu.falhas)
+        
+        # Inclui efeitos de execuções anteriores interrompidas entre o envio e a notificação
+        self.drenar_efeitos()
+        get_client().log_stats()
+        return list(self.read_cvu.falhas)
      
      
 class ReadCvu(TasksInterface):
     
-    def __init__(self):
+    def __init__(
+        self,
+        max_workers: int = CVU_MAX_WORKERS,
+        chunksize: int = CVU_CHUNK_SIZE,
+        delta_mode: bool = CVU_DELTA_MODE,
+        delta_backend_ultimo_valor: bool = CVU_DELTA_BACKEND_ULTIMO_VALOR,
+        full_resync: bool = CVU_FULL_RESYNC,
+        ledger: bool = CVU_LEDGER,
+        archive: bool = CVU_ARCHIVE,
+        trend_index: bool = CVU_TREND_INDEX,
+        ao_processar: Callable[[str, str], None] = None,
+    ):
+        if delta_mode and not delta_backend_ultimo_valor:
+            # Um backend que lê por dt_atualizacao perderia as linhas sem mudança de cada revisão
+            raise ValueError("CVU_DELTA_MODE requer um backend com o último valor por chave "
+                             "(CVU_DELTA_BACKEND_ULTIMO_VALOR=true)")
+        if delta_mode and chunksize:
+            # O diff precisa do snapshot inteiro; em blocos cada um seria enviado completo, ignorando o modo
+            raise ValueError("CVU_DELTA_MODE não é compatível com CVU_CHUNK_SIZE: desative um dos dois")
         self.logger = logger
         self.constants = constants
+        self.client = get_client()
+        self.specs = load_specs(MAPEAMENTO_CVU)
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+        self.delta_mode = delta_mode
+        self.full_resync = full_resync
+        self._metadata_cache = {}
+        self._metadata_locks = {}
+        self._metadata_lock = threading.Lock()
+        self.download_cache = DownloadCache()
+        self._parsed_frames = {}
+        self.ledger = ProcessingLedger() if ledger else None
+        self._ledger_reconciliado = False
+        self.archive_enabled = archive
+        self.trend_index_enabled = trend_index
+        self.ao_processar = ao_processar
+        # Tipos que falharam na última execução (verificação ou envio)
+        self.falhas = []
         self.pt_to_en_month = {
             "janeiro": "January", "fevereiro": "February", "março": "March",
             "abril": "April", "maio": "May", "junho": "June",
@@ -58,6 +171,29 @@ class ReadCvu(TasksInterface):
         }
         self.logger.info("ReadCvu inicializado")
     
+    @cached_property
+    def uploader(self):
+        from uploader import BatchUploader
+        return BatchUploader()
+    
+    @cached_property
+    def delta_store(self):
+        if not self.delta_mode:
+            return None
+        from delta_store import DeltaStore
+        return DeltaStore()
+    
+    @cached_property
+    def archive(self):
+        return _open_archive() if self.archive_enabled else None
+    
+    @cached_property
+    def trend_index(self):
+        if not self.trend_index_enabled:
+            return None
+        from trend_index import TrendIndex
+        return TrendIndex()
+    
     def run_workflow(
         self,
         tipos_cvu:list = ['conjuntural', 'estrutural', 'conjuntural_revisado', 'merchant']
@@ -66,131 +202,353 @@ class ReadCvu(TasksInterface):
         cvus_processados = self.run_process(tipos_cvu)
         return cvus_processados
       
+    @traced()
     def run_process(
         self,
         tipos_cvu:list = ['conjuntural', 'estrutural', 'conjuntural_revisado', 'merchant']
     ):
-        self.logger.info("Iniciando verificação e processamento de CVUs")
+        self.logger.info("Iniciando verificação e processamento de CVUs (max_workers=%d)", self.max_workers)
+        self.clear_metadata_cache()
+        self.falhas = []
+        if self.ledger is not None:
+            self._reconciliar_se_necessario(tipos_cvu)
         
-        cvus_to_process = []
-        cvus_processados = []
+        cvus_to_process = [
+            cvu_info for cvu_info in self._map_tipos(self._verificar_tipo_cvu, tipos_cvu)
+            if cvu_info is not None
+        ]
         
-        for tipo_cvu in tipos_cvu:
-            try:
-                self.logger.debug("Verificando tipo de CVU: %s", tipo_cvu)
-                
-                data_atualizacao_result = self.get_data_atualizacao_cvu(tipo_cvu)
-                data_atualizacao_str = data_atualizacao_result['data_atualizacao'].strftime('%Y-%m-%dT%H:%M:%S')
-                
-                status_result = self.check_cvu_status_processamento(tipo_cvu, data_atualizacao_str)
-                
-                if status_result.get('status') == 'processando':
-                    cvus_to_process.append({
-                        'tipo_cvu': tipo_cvu,
-                        'data_atualizacao': data_atualizacao_result['data_atualizacao'],
-                        'id_check': status_result.get('id')
-                    })
-                    self.logger.info("CVU %s precisa ser processado", tipo_cvu)
-                else:
-                    self.logger.info("CVU %s já foi processado", tipo_cvu)
-                    
-            except Exception as e:
-                self.logger.error("Erro ao verificar tipo de CVU %s: %s", tipo_cvu, str(e), exc_info=True)
-                continue
-        
-        for cvu_info in cvus_to_process:
-            try:
-                tipo_cvu = cvu_info['tipo_cvu']
-                self.logger.info("Processando tipo de CVU: %s", tipo_cvu)
-                
-                df = self.get_cvu_from_csv(tipo_cvu)
-                self.post_data(df, tipo_cvu)
-                
-                self.mark_cvu_as_processed(cvu_info['id_check'])
-                
-                tipo_cvu_clean = tipo_cvu.replace('_revisado', '')
-                if tipo_cvu_clean not in cvus_processados:
-                    cvus_processados.append(tipo_cvu_clean)
-                
-                self.logger.info("Tipo de CVU processado com sucesso: %s", tipo_cvu)
-                
-            except Exception as e:
-                self.logger.error("Falha ao processar tipo de CVU %s: %s", tipo_cvu, str(e), exc_info=True)
+        cvus_processados = []
+        tipos_ok = self._map_tipos(self._processar_tipo_cvu, cvus_to_process)
+        for tipo_cvu in tipos_ok:
+            if tipo_cvu is None:
                 continue
+            tipo_cvu_clean = tipo_cvu.replace('_revisado', '')
+            if tipo_cvu_clean not in cvus_processados:
+                cvus_processados.append(tipo_cvu_clean)
         
         if not cvus_to_process:
             self.logger.info("Nenhum CVU precisava ser processado")
         else:
             self.logger.info("Processamento concluído para %d CVUs", len(cvus_to_process))
+            self.logger.info("Cache de downloads: hits=%d, misses=%d, taxa de acerto=%.0f%%",
+                             self.download_cache.hits, self.download_cache.misses,
+                             self.download_cache.hit_ratio * 100)
         
+        if self.ledger is not None:
+            self.sincronizar_ledger()
         return cvus_processados
     
-    def get_cvu_from_csv(self, tipo_cvu: str) -> pd.DataFrame:
-        self.logger.info("Baixando dados CVU para tipo: %s", tipo_cvu)
-        
-        if tipo_cvu not in MAPEAMENTO_CVU:
-            raise ValueError(f"Tipo de CVU inválido: {tipo_cvu}")
-        
-        url = MAPEAMENTO_CVU[tipo_cvu]['url']
-        
+    @traced()
+    def get_datas_atualizacao(
+        self,
+        tipos_cvu:list = ['conjuntural', 'estrutural', 'conjuntural_revisado', 'merchant']
+    ) -> dict:
+        # Só as datas de atualização (package_show), sem tocar no backend nem baixar CSV
+        self.clear_metadata_cache()
+        resultados = self._map_tipos(self.get_data_atualizacao_cvu, tipos_cvu)
+        return {
+            resultado['tipo_cvu']: resultado['data_atualizacao'].strftime('%Y-%m-%dT%H:%M:%S')
+            for resultado in resultados
+        }
+    
+    def _map_tipos(self, func, itens: list) -> list:
+        # executor.map devolve os resultados na ordem de entrada
+        if self.max_workers <= 1 or len(itens) <= 1:
+            return [func(item) for item in itens]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(itens))) as executor:
+            return list(executor.map(func, itens))
+    
+    @traced("ReadCvu.verificar")
+    def _verificar_tipo_cvu(self, tipo_cvu: str):
         try:
-            res = requests.get(url)
-            res.raise_for_status()
+            self.logger.debug("Verificando tipo de CVU: %s", tipo_cvu)
             
-            df = pd.read_csv(StringIO(res.text), sep=",", na_values=None)
-            df = df.replace('-', None)
-            
-            df.columns = [sanitize_string(col, '_').lower() for col in df.columns]
+            data_atualizacao_result = self.get_data_atualizacao_cvu(tipo_cvu)
+            data_atualizacao_str = data_atualizacao_result['data_atualizacao'].strftime('%Y-%m-%dT%H:%M:%S')
             
-            if df['mes_referencia'].dtype == 'object':
-                df = df.loc[df['mes_referencia'].str[0] != '*'].copy()
+            if self.ledger is not None and self.ledger.processado(tipo_cvu, data_atualizacao_str):
+                self.logger.info("CVU %s já foi processado (ledger local)", tipo_cvu)
+                return None
             
-            df.rename(
-                columns={'codigo_modelo_preao': 'codigo_modelo_preco'},
-                errors='ignore',
-                inplace=True,
-            )
+            status_result = self.check_cvu_status_processamento(tipo_cvu, data_atualizacao_str)
             
-            df = df.astype(MAPEAMENTO_CVU[tipo_cvu]['columns'])
-            df = convert_date_columns(df)
+            if status_result.get('status') == 'processando':
+                self.logger.info("CVU %s precisa ser processado", tipo_cvu)
+                return {
+                    'tipo_cvu': tipo_cvu,
+                    'data_atualizacao': data_atualizacao_result['data_atualizacao'],
+                    'id_check': status_result.get('id')
+                }
+            self.logger.info("CVU %s já foi processado", tipo_cvu)
+            if self.ledger is not None:
+                self.ledger.registrar(tipo_cvu, data_atualizacao_str, status_result.get('id'))
+            return None
+                
+        except Exception as e:
+            self.logger.error("Erro ao verificar tipo de CVU %s: %s", tipo_cvu, str(e), exc_info=True)
+            self.falhas.append(tipo_cvu)
+            return None
+    
+    def _reconciliar_se_necessario(self, tipos_cvu: list):
+        # Só quando algum tipo tem data desconhecida pelo ledger: sem novidades, nenhuma chamada ao backend
+        if self._ledger_reconciliado:
+            return
+        datas = self._map_tipos(self._data_atualizacao_str, tipos_cvu)
+        if any(data and not self.ledger.processado(tipo_cvu, data) for tipo_cvu, data in zip(tipos_cvu, datas)):
+            self.reconciliar_ledger()
+    
+    def _data_atualizacao_str(self, tipo_cvu: str):
+        try:
+            return self.get_data_atualizacao_cvu(tipo_cvu)['data_atualizacao'].strftime('%Y-%m-%dT%H:%M:%S')
+        except Exception as e:
+            # O erro é tratado (e logado) de novo na verificação do tipo
+            self.logger.debug("Data de atualização indisponível para %s: %s", tipo_cvu, str(e))
+            return None
+    
+    @traced()
+    def reconciliar_ledger(self):
+        # Uma consulta ao histórico do backend registra de uma vez as versões já processadas
+        try:
+            res = self.client.get(self.constants.GET_HISTORICO_CVU, auth=True)
+            res.raise_for_status()
+            historico = res.json()['data']
+        except Exception as e:
+            self.logger.warning("Falha ao reconciliar ledger com o backend, seguindo com check-cvu: %s", str(e))
+            return
+        
+        # O histórico lista a revisão assim que o check-cvu cria o registro 'processando': só o status
+        # explícito 'processado' prova a ingestão; sem status, as datas seguem para o check-cvu
+        self._ledger_reconciliado = True
+        if not any('status' in item for item in historico):
+            self.logger.info("Histórico do backend sem status de processamento, ledger não reconciliado")
+            return
+        versoes = [
+            (item['tipo_cvu'], normalizar_data(item['data_atualizacao']))
+            for item in historico
+            if item.get('status') == 'processado' and item.get('tipo_cvu')
+        ]
+        versoes = [(tipo_cvu, data) for tipo_cvu, data in versoes if data]
+        novas = self.ledger.registrar_varios(versoes)
+        self.logger.info("Ledger reconciliado com o backend: %d versões no histórico, %d novas", len(versoes), novas)
+    
+    @traced()
+    def sincronizar_ledger(self):
+        # PATCH de status das versões processadas localmente, inclusive de execuções interrompidas
+        pendentes = self.ledger.pendentes()
+        if not pendentes:
+            return
+        self.logger.info("Sincronizando %d status de processamento com o backend", len(pendentes))
+        
+        def sincronizar(entrada):
+            try:
+                if entrada.id_check is not None:
+                    self.mark_cvu_as_processed(entrada.id_check)
+                self.ledger.marcar_sincronizado(entrada.tipo_cvu, entrada.data_atualizacao)
+            except Exception as e:
+                self.logger.warning("Status de %s (%s) fica pendente para a próxima execução: %s",
+                                    entrada.tipo_cvu, entrada.data_atualizacao, str(e))
+        
+        self._map_tipos(sincronizar, pendentes)
+    
+    def _processar_tipo_cvu(self, cvu_info: dict):
+        tipo_cvu = cvu_info['tipo_cvu']
+        try:
+            self.logger.info("Processando tipo de CVU: %s", tipo_cvu)
             
-            data_atualizacao_result = self.get_data_atualizacao_cvu(tipo_cvu)
-            df['dt_atualizacao'] = data_atualizacao_result['data_atualizacao'].date()
+            with self.span("processar", tipo_cvu):
+                with self.arquivar(tipo_cvu) as arquivar, self.indexar(tipo_cvu) as indexar:
+                    if self.chunksize:
+                        for df in self.iter_cvu_chunks(tipo_cvu):
+                            self.post_data(df, tipo_cvu)
+                            arquivar(df)
+                            indexar(df)
+                    else:
+                        df = self.get_cvu_from_csv(tipo_cvu)
+                        self.post_snapshot(df, tipo_cvu)
+                        arquivar(df)
+                        indexar(df)
+                
+                data_atualizacao_str = cvu_info['data_atualizacao'].strftime('%Y-%m-%dT%H:%M:%S')
+                if self.ao_processar is not None:
+                    self.ao_processar(tipo_cvu, data_atualizacao_str)
+                if self.ledger is None:
+                    self.mark_cvu_as_processed(cvu_info['id_check'])
+                else:
+                    # O PATCH no backend sai no fim da execução, em sincronizar_ledger
+                    self.ledger.registrar(tipo_cvu, data_atualizacao_str, cvu_info['id_check'], sincronizado=False)
             
-            df.columns = [col.lower() for col in df.columns]
+            self.logger.info("Tipo de CVU processado com sucesso: %s", tipo_cvu)
+            return tipo_cvu
             
-            rename_dict = {
-                "cvu_cf": "vl_cvu_cf",
-                "cvu_scf": "vl_cvu_scf",
-                "cvu_conjuntural": "vl_cvu",
-                "cvu_estrutural": "vl_cvu",
-                "codigo_modelo_preco": "cd_usina"
-            }
-            df.rename(columns=rename_dict, errors='ignore', inplace=True)
+        except Exception as e:
+            self.logger.error("Falha ao processar tipo de CVU %s: %s", tipo_cvu, str(e), exc_info=True)
+            self.falhas.append(tipo_cvu)
+            return None
+    
+    @contextmanager
+    def arquivar(self, tipo_cvu: str):
+        # Grava no arquivo local o snapshot completo enviado (todos os blocos), publicado só se o
+        # processamento terminar; falhas do arquivo geram aviso sem interromper a ingestão
+        writer = None
+        if self.archive is not None:
+            data_atualizacao = self.get_data_atualizacao_cvu(tipo_cvu)['data_atualizacao']
+            writer = self.archive.writer(tipo_cvu, data_atualizacao)
+        
+        def gravar(df):
+            nonlocal writer
+            if writer is None:
+                return
+            try:
+                writer.write(df)
+            except Exception as e:
+                self.logger.warning("Falha ao arquivar snapshot de %s: %s", tipo_cvu, str(e))
+                writer.abort()
+                writer = None
+        
+        try:
+            yield gravar
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        if writer is not None:
+            try:
+                writer.commit()
+            except Exception as e:
+                self.logger.warning("Falha ao publicar snapshot arquivado de %s: %s", tipo_cvu, str(e))
+                writer.abort()
+    
+    @contextmanager
+    def indexar(self, tipo_cvu: str):
+        # Reduz cada bloco a soma e contagem por chave (memória limitada ao número de chaves, não ao
+        # tamanho do arquivo) e atualiza o índice de tendência quando o processamento termina; falhas
+        # do índice só geram aviso
+        if self.trend_index is None:
+            yield lambda df: None
+            return
+        
+        from trend_index import ValoresSnapshot
+        
+        valores = ValoresSnapshot()
+        yield valores.adicionar
+        try:
+            data_atualizacao = self.get_data_atualizacao_cvu(tipo_cvu)['data_atualizacao']
+            with self.span("indice_tendencia", tipo_cvu) as span:
+                span.linhas = valores.linhas
+                span.atributos['alteradas'] = self.trend_index.atualizar_valores(
+                    tipo_cvu, data_atualizacao, valores.valores()
+                )
+        except Exception as e:
+            self.logger.warning("Falha ao atualizar índice de tendência de %s: %s", tipo_cvu, str(e))
+    
+    def get_cvu_from_csv(self, tipo_cvu: str) -> pd.DataFrame:
+        self.logger.info("Baixando dados CVU para tipo: %s", tipo_cvu)
+        
+        try:
+            download, data_atualizacao = self._download_cvu(tipo_cvu)
             
-            df = df.round(2)
-            df.replace({np.nan: None, np.inf: None, -np.inf: None}, inplace=True)
+            # Mesmo conteúdo e mesma data de atualização produzem o mesmo DataFrame
+            parse_key = (download.sha256, data_atualizacao)
+            cached = self._parsed_frames.get(tipo_cvu)
+            if cached and cached[0] == parse_key:
+                self.logger.info("Reutilizando dados CVU já processados para tipo: %s", tipo_cvu)
+                return cached[1].copy()
             
-            df['tipo_cvu'] = tipo_cvu.replace('_revisado', '')
-            df['fonte'] = "CCEE_" + tipo_cvu
+            df = next(self._read_cvu_chunks(download, tipo_cvu, data_atualizacao, chunksize=None))
             
-            if 'ano_horizonte' not in df.columns or df['ano_horizonte'].isnull().all():
-                df['ano_horizonte'] = df['mes_referencia'].astype(str).str[:4]
+            self.logger.info("Dados CVU processados com sucesso para tipo: %s, linhas: %d, memória: %.1f MB",
+                             tipo_cvu, len(df), df.memory_usage(deep=True, index=False).sum() / 2 ** 20)
+            self._parsed_frames[tipo_cvu] = (parse_key, df)
+            return df.copy()
             
-            self.logger.info("Dados CVU processados com sucesso para tipo: %s, linhas: %d", tipo_cvu, len(df))
-            return df
+        except Exception as e:
+            self.logger.error("Falha ao baixar/processar dados CVU para tipo %s: %s", tipo_cvu, str(e))
+            raise
+    
+    def iter_cvu_chunks(self, tipo_cvu: str, chunksize: int = None):
+        chunksize = chunksize or self.chunksize
+        self.logger.info("Baixando dados CVU em blocos de %d linhas para tipo: %s", chunksize, tipo_cvu)
+        
+        try:
+            download, data_atualizacao = self._download_cvu(tipo_cvu)
+            total = 0
+            for df in self._read_cvu_chunks(download, tipo_cvu, data_atualizacao, chunksize=chunksize):
+                total += len(df)
+                yield df
+            self.logger.info("Dados CVU processados com sucesso para tipo: %s, linhas: %d", tipo_cvu, total)
             
         except Exception as e:
             self.logger.error("Falha ao baixar/processar dados CVU para tipo %s: %s", tipo_cvu, str(e))
             raise
     
+    def _download_cvu(self, tipo_cvu: str):
+        if tipo_cvu not in self.specs:
+            raise ValueError(f"Tipo de CVU inválido: {tipo_cvu}")
+        
+        with self.span("download", tipo_cvu) as span:
+            download = self.download_cache.fetch(self.specs[tipo_cvu].url)
+            span.bytes_recebidos = download.transferred
+            span.atributos['cache'] = download.from_cache
+        data_atualizacao = self.get_data_atualizacao_cvu(tipo_cvu)['data_atualizacao']
+        return download, data_atualizacao
+    
+    def _read_cvu_chunks(self, download, tipo_cvu: str, data_atualizacao: datetime.datetime, chunksize: int = None):
+        # Leitura e transformação genéricas, guiadas pela entrada do tipo em MAPEAMENTO_CVU
+        from ingestion import iter_dataset_chunks
+        
+        return iter_dataset_chunks(download, self.specs[tipo_cvu], data_atualizacao, chunksize,
+                                   span=lambda: self.span("parse", tipo_cvu))
+    
     def get_data_atualizacao_cvu(self, tipo_cvu: str) -> dict:
-        self.logger.info("Obtendo data de atualização para tipo CVU: %s", tipo_cvu)
+        with self._metadata_lock:
+            if tipo_cvu in self._metadata_cache:
+                return self._metadata_cache[tipo_cvu]
+            tipo_lock = self._metadata_locks.setdefault(tipo_cvu, threading.Lock())
         
-        search_url = f"https://dadosabertos.ccee.org.br/dataset/custo_variavel_unitario_{tipo_cvu}"
+        # Um lock por tipo garante no máximo uma busca por dataset, mesmo com threads concorrentes
+        with tipo_lock:
+            if tipo_cvu in self._metadata_cache:
+                return self._metadata_cache[tipo_cvu]
+            
+            self.logger.info("Obtendo data de atualização para tipo CVU: %s", tipo_cvu)
+            with self.span("data_atualizacao", tipo_cvu) as span:
+                try:
+                    result = self._get_data_atualizacao_ckan(tipo_cvu)
+                    span.atributos['fonte'] = 'package_show'
+                except Exception as e:
+                    self.logger.warning("Falha ao consultar package_show para %s (%s), usando página HTML",
+                                        tipo_cvu, str(e))
+                    result = self._get_data_atualizacao_html(tipo_cvu)
+                    span.atributos['fonte'] = 'html'
+            
+            self._metadata_cache[tipo_cvu] = result
+            return result
+    
+    def clear_metadata_cache(self):
+        with self._metadata_lock:
+            self._metadata_cache = {}
+            self._metadata_locks = {}
+            # Frames já lidos valem só para a execução: o daemon mantém a instância entre consultas e,
+            # sem isso, guardaria o último snapshot completo de cada tipo indefinidamente
+            self._parsed_frames = {}
+    
+    def _get_data_atualizacao_ckan(self, tipo_cvu: str) -> dict:
+        if tipo_cvu not in self.specs:
+            raise ValueError(f"Tipo de CVU inválido: {tipo_cvu}")
+        
+        result = get_data_atualizacao_ckan(self.client, CCEE_DADOS_ABERTOS_URL, self.specs[tipo_cvu])
+        self.logger.info("Data de atualização encontrada via package_show para %s: %s",
+                         tipo_cvu, result['data_atualizacao'])
+        return {"tipo_cvu": tipo_cvu, **result}
+    
+    def _get_data_atualizacao_html(self, tipo_cvu: str) -> dict:
+        from bs4 import BeautifulSoup
+        
+        search_url = f"{CCEE_DADOS_ABERTOS_URL}/dataset/custo_variavel_unitario_{tipo_cvu}"
         
         try:
-            response = requests.get(search_url)
+            response = self.client.get(search_url)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.text, "html.parser")
@@ -223,23 +581,24 @@ class ReadCvu(TasksInterface):
             self.logger.error("Falha ao obter data de atualização para tipo CVU %s: %s", tipo_cvu, str(e))
             raise
     
+    @traced()
     def check_cvu_status_processamento(self, tipo_cvu: str, data_atualizacao: str):
         print()
         self.logger.info("Verificando status de processamento para %s", tipo_cvu)
         try:
-            res = requests.get(
+            res = self.client.get(
                 f"{self.constants.BASE_URL}/api/v2/decks/check-cvu",
                 params={'tipo_cvu': tipo_cvu, 'data_atualizacao': data_atualizacao},
-                headers=get_auth_header()
+                auth=True
             )
             
             if res.status_code == 404:
                 # Criar novo registro de status
                 self.logger.info("Criando novo registro de status para %s", tipo_cvu)
-                res = requests.post(
+                res = self.client.post(
                     f"{self.constants.BASE_URL}/api/v2/decks/check-cvu",
                     json={'tipo_cvu': tipo_cvu, 'data_atualizacao': data_atualizacao, 'status': 'processando'},
-                    headers=get_auth_header()
+                    auth=True
                 )
                 return res.json()
             
@@ -248,43 +607,58 @@ class ReadCvu(TasksInterface):
             self.logger.error("Erro ao verificar status de processamento: %s", str(e))
             raise
 
+    @traced()
     def mark_cvu_as_processed(self, id_check_cvu: int):
         self.logger.info("Marcando CVU como processado: %s", id_check_cvu)
         try:
-            res = requests.patch(
+            res = self.client.patch(
                 f"{self.constants.BASE_URL}/api/v2/decks/check-cvu/{id_check_cvu}/status",
                 params={'status': 'processado'},
-                headers=get_auth_header()
+                auth=True
             )
+            res.raise_for_status()
             return res.json()
         except Exception as e:
             self.logger.error("Erro ao marcar CVU como processado: %s", str(e))
             raise
 
+    def post_snapshot(self, df: pd.DataFrame, tipo_cvu: str):
+        if not self.delta_mode:
+            return self.post_data(df, tipo_cvu)
+        
+        delta = None if self.full_resync else self.delta_store.diff(tipo_cvu, df)
+        if delta is not None and delta.deletes:
+            # A API não expõe remoção de linhas; um snapshot com remoções é reenviado por completo
+            self.logger.warning("Snapshot de %s tem %d remoções, enviando completo", tipo_cvu, delta.deletes)
+            delta = None
+        
+        if delta is None:
+            result = self.post_data(df, tipo_cvu)
+        elif not delta.changed.any():
+            self.logger.info("Nenhuma linha alterada para %s, nada a enviar", tipo_cvu)
+            result = None
+        else:
+            result = self.post_data(df.loc[delta.changed], tipo_cvu)
+        
+        self.delta_store.commit(tipo_cvu, df, delta)
+        return result
+    
     def post_data(self, data_in: pd.DataFrame, tipo_cvu: str) -> dict:
         self.logger.info("Enviando dados CVU para banco de dados para tipo: %s, linhas: %d", tipo_cvu, len(data_in))
         try:
-            url = f'{self.constants.BASE_URL}/api/v2/decks/cvu'
-            if tipo_cvu == 'merchant':
-                url += '/merchant'
+            url = self.specs[tipo_cvu].endpoint
             
-            for col in data_in.columns:
-                if data_in[col].dtype == 'object':
-                    data_in[col] = data_in[col].apply(lambda x: x.strftime('%Y-%m-%d') if hasattr(x, 'strftime') else x)
+            with self.span("upload", tipo_cvu) as span:
+                result = self.uploader.upload(url, data_in)
+                span.linhas = result.linhas
+                span.bytes_enviados = result.bytes
+                span.atributos['lotes'] = result.lotes
             
-            res = requests.post(
-                url,
-                json=data_in.to_dict('records'),
-                headers=get_auth_header()
-            )
-            
-            if res.status_code >= 300:
-                self.logger.error("Falha ao enviar dados CVU: status %d, resposta: %s",
-                                res.status_code, res.text)
-                raise Exception(f"Erro ao postar CVU: {res.status_code} - {res.text}")
-            
-            self.logger.info("Dados CVU enviados com sucesso, status da resposta: %d", res.status_code)
-            return res.json()
+            self.logger.info("Dados CVU enviados com sucesso para tipo: %s, %.0f linhas/s",
+                             tipo_cvu, result.linhas_por_segundo)
+            if len(result.respostas) == 1:
+                return result.respostas[0]
+            return result.respostas
         
         except Exception as e:
             self.logger.error("Falha ao enviar dados CVU: %s", str(e), exc_info=True)
@@ -293,14 +667,37 @@ class ReadCvu(TasksInterface):
     
 class GenerateTable(TasksInterface):
     
-    def __init__(self):
+    def __init__(self, cache_ttl: float = CVU_REFERENCE_TTL, renderer: TableRenderer = None,
+                 archive: bool = CVU_ARCHIVE):
+        from renderers import get_renderer
+        
         self.logger = logger
+        self.client = get_client()
+        # Um único renderizador por instância, reaproveitado entre os tipos
+        self.renderer = renderer or get_renderer()
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._cache_locks = {}
+        self._cache_lock = threading.Lock()
+        self.archive_enabled = archive
         self.logger.info("GenerateTable inicializado")
     
+    @cached_property
+    def archive(self):
+        return _open_archive() if self.archive_enabled else None
+    
     def run_workflow(self, tipo_cvu=None):
         self.logger.info("Iniciando run_workflow para GenerateTable")
+        self.clear_cache()
         self.run_process(tipo_cvu)
+    
+    def clear_cache(self):
+        # O cache de referência vale por execução; quem mantém a instância limpa-o no início de cada uma
+        with self._cache_lock:
+            self._cache = {}
+            self._cache_locks = {}
 
+    @traced()
     def run_process(self, tipo_cvu):
         self.logger.info("Gerando tabela para tipos de CVU: %s", tipo_cvu)
         df_dt = self.get_datas_atualizacao()
@@ -310,10 +707,13 @@ class GenerateTable(TasksInterface):
         self.logger.info("Geração de tabela concluída")
     
     
+    @traced()
     def get_datas_atualizacao(self) -> pd.DataFrame:
+        import pandas as pd
+        
         self.logger.info("Recuperando dados históricos de CVU")
         try:
-            df_hist = pd.DataFrame(self.get_data(constants.GET_HISTORICO_CVU,'')['data'])
+            df_hist = pd.DataFrame(self.get_data_cached(constants.GET_HISTORICO_CVU,'')['data'])
             self.logger.debug("Dados históricos de CVU recuperados, linhas: %d", len(df_hist))
             df_hist['tipo_cvu'] = df_hist['tipo_cvu'].replace('conjuntural_revisado', 'conjuntural')
             self.logger.debug("Substituído 'conjuntural_revisado' por 'conjuntural'")
@@ -328,55 +728,26 @@ class GenerateTable(TasksInterface):
     
         
     def generate_table(self, df_dt):
+        import pandas as pd
+        from cvu_diff import diff_cvu
+        
         self.logger.info("Gerando tabela para dados CVU")
      
-        date = pd.to_datetime(df_dt['data_atualizacao'].values[0]).strftime('%Y-%m-%d')
         tipo_cvu = df_dt['tipo_cvu'].values[0]
-        self.logger.debug("Processando dados CVU para data: %s, tipo: %s", date, tipo_cvu)
-        df_atu = pd.DataFrame(self.get_data(constants.GET_CVU,{'dt_atualizacao':date, 'fonte':tipo_cvu}))
-        if df_atu.empty:
-            self.logger.warning("Nenhum dado encontrado para %s, tentando versão revisada", tipo_cvu)
-            tipo_cvu = tipo_cvu + '_revisado'
-            df_atu = pd.DataFrame(self.get_data(constants.GET_CVU,{'dt_atualizacao':date, 'fonte':tipo_cvu}))
-            self.logger.debug("Dados recuperados para tipo CVU revisado: %s", tipo_cvu)
+        with self.span("snapshots", tipo_cvu) as span:
+            df_atu, df_ant, df_nome = self._fetch_snapshots(df_dt)
+            span.linhas = len(df_atu) + len(df_ant)
         mes_ref = max(df_atu['mes_referencia']) 
         df_atu = df_atu[df_atu['mes_referencia']==max(df_atu['mes_referencia'])]
-        df_atu = df_atu.sort_values('cd_usina').reset_index(drop=True)
-        
-        date = pd.to_datetime(df_dt['data_atualizacao'].values[1]).strftime('%Y-%m-%d')
-        tipo_cvu = df_dt['tipo_cvu'].values[1]
-        self.logger.debug("Processando dados CVU anteriores para data: %s, tipo: %s", date, tipo_cvu)
-        df_ant = pd.DataFrame(self.get_data(constants.GET_CVU,{'dt_atualizacao':date, 'fonte':tipo_cvu}))
-        if df_ant.empty:
-            self.logger.warning("Nenhum dado encontrado para %s, tentando versão revisada", tipo_cvu)
-            tipo_cvu = tipo_cvu + '_revisado'
-            df_ant = pd.DataFrame(self.get_data(constants.GET_CVU,{'dt_atualizacao':date, 'fonte':tipo_cvu}))
-            self.logger.debug("Dados recuperados para tipo CVU revisado: %s", tipo_cvu)
-        
-        df_nome = pd.DataFrame(self.get_data(constants.GET_NOME_UTE,{'dt_atualizacao':'', 'fonte':''}))
+        
         df_nome = df_nome.rename(columns={'sigla_parcela':'NOME'})
         df_nome['NOME'] = df_nome['NOME'].str.replace('UTE ','')
-        tipo_cvu = tipo_cvu.replace('_revisado', '')   
         df_ant = df_ant[df_ant['mes_referencia']==max(df_ant['mes_referencia'])]
-        df_ant = df_ant.sort_values('cd_usina').reset_index(drop=True)
-        df_ant = df_ant[df_ant['cd_usina'].isin(df_atu['cd_usina'])].reset_index(drop=True)
-        ant_pivot = df_ant.pivot_table(index='cd_usina', columns='ano_horizonte', values='vl_cvu')
-        atu_pivot = df_atu.pivot_table(index='cd_usina', columns='ano_horizonte', values='vl_cvu')
-        ant_pivot.columns = [f'{col}_old' for col in ant_pivot.columns]
-        atu_pivot.columns = [f'{col}_new' for col in atu_pivot.columns]
-
-        df_merged = pd.concat([ant_pivot, atu_pivot], axis=1)
-        self.logger.debug("Merged ant_pivot e atu_pivot")
-        for col in atu_pivot.columns:
-            ano = col.split('_')[0]
-            col_ant = f'{ano}_old'
-            col_atu = f'{ano}_new'
-            df_merged[f'{ano}_dif'] = (df_merged[col_atu] - df_merged[col_ant])
-            self.logger.debug("Calculada diferença para ano: %s", ano)
-              
-        cols_dif = [col for col in df_merged.columns if col.endswith('_dif')]
-        df_filtrado = df_merged[(df_merged[cols_dif] != 0).any(axis=1)]
-        df_merged = df_filtrado.reset_index()
+        
+        with self.span("diff", tipo_cvu) as span:
+            df_merged = diff_cvu(df_ant, df_atu).to_frame().reset_index()
+            span.linhas = len(df_merged)
+        self.logger.debug("Calculada diferença entre snapshots: %d usinas alteradas", len(df_merged))
         df_merged = pd.merge(df_merged, df_nome, on='cd_usina', how='left') 
         df_merged = df_merged.sort_values(df_merged.filter(like='_new').columns[0]).reset_index(drop=True)
         df_merged = df_merged.set_index("cd_usina")
@@ -385,31 +756,110 @@ class GenerateTable(TasksInterface):
         
         colunas = ['NOME'] + [col for col in df_merged.columns if col != 'NOME']
         df_merged = df_merged[colunas]     
-        df_merged_html = df_merged.style.format(na_rep='', precision=0)     
-        df_merged_html.set_caption(f"ATUALIZAÇÃO DE CVU {tipo_cvu.upper()} ")
-        self.logger.debug("Definido caption da tabela para tipo CVU: %s", tipo_cvu.upper())
-
-        css = '<style type="text/css">'
-        css += 'caption {background-color: #E0E0E0; color: black;}'
-        css += 'th {background-color: #E0E0E0; color: black; min-width: 80px;}'
-        css += 'td {min-width: 80px;}'
-        css += 'table {text-align: center; border-collapse: collapse; border 2px solid black !important}'
-        css += '</style>'
-
-        html = df_merged_html.to_html() 
-        self.logger.debug("Gerado HTML para tabela")
-        html = html.replace('<style type="text/css">\n</style>\n', css)
-        self.logger.debug("Aplicado CSS customizado ao HTML")
-        image_binary = html_to_image(html)
-        self.logger.debug("Convertido HTML para imagem")
-        
-        send_whatsapp_message(constants.WHATSAPP_DECKS, f'REVISÃO DE CVU\nTIPO: {tipo_cvu.upper()}\nMÊS REF:{mes_ref} ', image_binary)
+        caption = f"ATUALIZAÇÃO DE CVU {tipo_cvu.upper()} "
+        with self.span("render", tipo_cvu, renderizador=type(self.renderer).__name__) as span:
+            image_binary = self.renderer.render(df_merged, caption)
+            span.atributos['bytes_imagem'] = len(image_binary)
+        self.logger.debug("Renderizada tabela %s com %s", caption.strip(), type(self.renderer).__name__)
+        
+        with self.span("whatsapp", tipo_cvu) as span:
+            send_whatsapp_message(constants.WHATSAPP_DECKS, f'REVISÃO DE CVU\nTIPO: {tipo_cvu.upper()}\nMÊS REF:{mes_ref} ', image_binary)
+            span.bytes_enviados = len(image_binary)
         self.logger.info("Enviada mensagem WhatsApp com tabela CVU para tipo: %s", tipo_cvu.upper())
 
+    def _fetch_snapshots(self, df_dt):
+        import pandas as pd
+        
+        # Snapshot atual e anterior, com as versões revisadas de fallback, numa única rodada concorrente
+        consultas = []
+        for i in (0, 1):
+            date = pd.to_datetime(df_dt['data_atualizacao'].values[i]).strftime('%Y-%m-%d')
+            tipo_cvu = df_dt['tipo_cvu'].values[i]
+            self.logger.debug("Consultando dados CVU para data: %s, tipo: %s", date, tipo_cvu)
+            consultas.append({'dt_atualizacao': date, 'fonte': tipo_cvu})
+            consultas.append({'dt_atualizacao': date, 'fonte': tipo_cvu + '_revisado'})
+        
+        # Snapshots já arquivados localmente não passam pela API; a revisada só é necessária sem a base
+        resultados = [None] * len(consultas)
+        for i in range(0, len(consultas), 2):
+            df_base = self.read_archived(consultas[i])
+            if df_base is not None and not df_base.empty:
+                resultados[i], resultados[i + 1] = df_base, pd.DataFrame()
+            else:
+                resultados[i + 1] = self.read_archived(consultas[i + 1])
+        faltantes = [i for i, resultado in enumerate(resultados) if resultado is None]
+        self.logger.debug("Snapshots do arquivo local: %d de %d", len(consultas) - len(faltantes), len(consultas))
+        
+        with ThreadPoolExecutor(max_workers=len(faltantes) + 1) as executor:
+            futures = {i: executor.submit(self.get_data, constants.GET_CVU, consultas[i]) for i in faltantes}
+            future_nome = executor.submit(self.get_nome_ute)
+            for i, future in futures.items():
+                resultados[i] = pd.DataFrame(future.result())
+            df_nome = future_nome.result()
+        
+        snapshots = []
+        for i, (df_base, df_revisado) in enumerate(zip(resultados[0::2], resultados[1::2])):
+            if df_base.empty:
+                self.logger.warning("Nenhum dado encontrado para %s, usando versão revisada",
+                                    consultas[2 * i]['fonte'])
+                df_base = df_revisado
+            snapshots.append(df_base)
+        
+        return snapshots[0], snapshots[1], df_nome
+    
+    def read_archived(self, consulta: dict):
+        # Snapshot no layout da API ou None quando a partição não está no arquivo local
+        if self.archive is None:
+            return None
+        fonte, dt_atualizacao = consulta['fonte'], consulta['dt_atualizacao']
+        try:
+            with self.span("arquivo", fonte) as span:
+                df = self.archive.read(fonte, dt_atualizacao, columns=COLUNAS_ARQUIVO)
+                span.linhas = 0 if df is None else len(df)
+        except Exception as e:
+            self.logger.warning("Falha ao ler snapshot arquivado %s de %s: %s", fonte, dt_atualizacao, str(e))
+            return None
+        if df is None:
+            return None
+        if 'vl_cvu' not in df.columns and 'vl_cvu_cf' in df.columns:
+            # Merchant: a API expõe o CVU com frete como vl_cvu
+            df['vl_cvu'] = df['vl_cvu_cf']
+        return df
+    
+    def get_nome_ute(self) -> pd.DataFrame:
+        import pandas as pd
+        
+        return pd.DataFrame(self.get_data_cached(constants.GET_NOME_UTE, {'dt_atualizacao':'', 'fonte':''}))
+    
+    def get_data_cached(self, url, date) -> dict:
+        # Dados de referência (histórico, nomes das usinas) valem para todos os tipos da execução
+        chave = (url, tuple(sorted(date.items())) if isinstance(date, dict) else date)
+        with self._cache_lock:
+            cached = self._cache.get(chave)
+            if cached and cached[0] > time.monotonic():
+                self.logger.debug("Usando dados em cache para %s", url)
+                return cached[1]
+            chave_lock = self._cache_locks.setdefault(chave, threading.Lock())
+        
+        # Um lock por chave: tipos gerados em paralelo esperam a mesma consulta em vez de repeti-la
+        with chave_lock:
+            with self._cache_lock:
+                cached = self._cache.get(chave)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+            
+            data = self.get_data(url, date)
+            with self._cache_lock:
+                self._cache[chave] = (time.monotonic() + self.cache_ttl, data)
+            return data
+    
     def get_data(self, url, date) -> dict:
         self.logger.info("Recuperando dados do banco de dados com parâmetros: %s", date)
+        fonte = date.get('fonte') if isinstance(date, dict) else None
         try:
-            res = requests.get(url, params=date, headers=get_auth_header())
+            with self.span("consulta", fonte or None) as span:
+                res = self.client.get(url, params=date, auth=True)
+                span.bytes_recebidos = len(res.content)
             if res.status_code != 200:
                 self.logger.error("Falha ao obter dados do banco de dados: status %d, resposta: %s",
                                 res.status_code, res.text)
@@ -0,0 +1,33 @@
+import os
+import sys
+from middle.utils import setup_logger
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from TasksInterface import TasksInterface
+from http_client import get_client
+from tracing import traced
+logger = setup_logger()
+
+
+class DadosAbertos(TasksInterface):
+    # Datasets declarados em MAPEAMENTO_DATASETS, todos pelo mesmo IngestionEngine
+
+    def __init__(self, datasets: list = None):
+        from ingestion import IngestionEngine
+
+        self.engine = IngestionEngine()
+        self.datasets = datasets
+        logger.info("DadosAbertos inicializado com %d datasets", len(self.engine.specs))
+
+    def run_workflow(self):
+        logger.info("Iniciando workflow para dados abertos")
+        self.run_process()
+        return list(self.engine.falhas)
+
+    def get_freshness(self) -> dict:
+        return self.engine.get_datas_atualizacao(self.datasets)
+
+    @traced()
+    def run_process(self):
+        processados = self.engine.run(self.datasets)
+        get_client().log_stats()
+        return processados
@@ -0,0 +1,256 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import tempfile
+import threading
+import functools
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+from middle.utils import setup_logger
+from constants import CVU_TRACE_OUTPUT, CVU_TRACE_FORMAT, CVU_PROFILE, CVU_PROFILE_DIR
+logger = setup_logger()
+
+PROMETHEUS_PREFIX = "ccee_dados_abertos"
+
+
+@dataclass
+class Span:
+    nome: str
+    tipo_cvu: Optional[str] = None
+    pai: Optional[str] = None
+    inicio: float = 0.0
+    segundos: float = 0.0
+    bytes_recebidos: int = 0
+    bytes_enviados: int = 0
+    linhas: int = 0
+    memoria_delta_bytes: int = 0
+    heap_delta_bytes: Optional[int] = None
+    erro: Optional[str] = None
+    atributos: dict = field(default_factory=dict)
+
+
+class Tracer:
+    # Spans por etapa e tipo_cvu; a pilha de spans ativos é por thread, já que os tipos
+    # são processados em paralelo pelo ThreadPoolExecutor do ReadCvu
+
+    def __init__(self):
+        self.logger = logger
+        self.inicio = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _pilha(self) -> list:
+        if not hasattr(self._local, "pilha"):
+            self._local.pilha = []
+        return self._local.pilha
+
+    @contextmanager
+    def span(self, nome: str, tipo_cvu: Optional[str] = None, **atributos):
+        pilha = self._pilha()
+        pai = pilha[-1] if pilha else None
+        if tipo_cvu is None and pai is not None:
+            tipo_cvu = pai.tipo_cvu
+        span = Span(nome=nome, tipo_cvu=tipo_cvu, pai=pai.nome if pai else None,
+                    inicio=time.time(), atributos=atributos)
+
+        rss_inicial = _rss_bytes()
+        heap_inicial = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        inicio = time.perf_counter()
+        pilha.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.erro = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            pilha.pop()
+            span.segundos = time.perf_counter() - inicio
+            span.memoria_delta_bytes = _rss_bytes() - rss_inicial
+            if heap_inicial is not None and tracemalloc.is_tracing():
+                span.heap_delta_bytes = tracemalloc.get_traced_memory()[0] - heap_inicial
+            with self._lock:
+                self.spans.append(span)
+
+    def current(self) -> Optional[Span]:
+        pilha = self._pilha()
+        return pilha[-1] if pilha else None
+
+    def reset(self):
+        with self._lock:
+            self.inicio = time.time()
+            self.spans = []
+
+    def summary(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+
+        etapas = defaultdict(lambda: {
+            "execucoes": 0, "erros": 0, "segundos": 0.0, "segundos_max": 0.0, "bytes_recebidos": 0,
+            "bytes_enviados": 0, "linhas": 0, "memoria_delta_bytes": 0,
+        })
+        for span in spans:
+            etapa = etapas[(span.nome, span.tipo_cvu or "")]
+            etapa["execucoes"] += 1
+            etapa["erros"] += span.erro is not None
+            etapa["segundos"] += span.segundos
+            etapa["segundos_max"] = max(etapa["segundos_max"], span.segundos)
+            etapa["bytes_recebidos"] += span.bytes_recebidos
+            etapa["bytes_enviados"] += span.bytes_enviados
+            etapa["linhas"] += span.linhas
+            etapa["memoria_delta_bytes"] += span.memoria_delta_bytes
+
+        return {
+            "inicio": self.inicio,
+            "segundos": time.time() - self.inicio,
+            "rss_pico_bytes": _rss_pico_bytes(),
+            "etapas": [
+                {"etapa": nome, "tipo_cvu": tipo_cvu or None, **valores}
+                for (nome, tipo_cvu), valores in sorted(etapas.items())
+            ],
+            "spans": [asdict(span) for span in sorted(spans, key=lambda span: span.inicio)],
+        }
+
+    def write(self, path: str = CVU_TRACE_OUTPUT, formato: str = CVU_TRACE_FORMAT):
+        if not path:
+            return
+        if formato == "prometheus" or path.endswith(".prom"):
+            conteudo = self.to_prometheus()
+        else:
+            conteudo = json.dumps(self.summary(), ensure_ascii=False, indent=2, default=str)
+        _write_atomic(path, conteudo)
+        self.logger.info("Resumo da execução gravado em %s", path)
+
+    def to_prometheus(self) -> str:
+        # Formato textfile do node_exporter: uma série por (etapa, tipo_cvu)
+        resumo = self.summary()
+        metricas = [
+            ("etapa_execucoes", "execucoes", "Spans concluídos por etapa"),
+            ("etapa_erros", "erros", "Spans encerrados com exceção"),
+            ("etapa_duracao_segundos", "segundos", "Tempo total da etapa"),
+            ("etapa_duracao_max_segundos", "segundos_max", "Maior duração de um span da etapa"),
+            ("etapa_bytes_recebidos", "bytes_recebidos", "Bytes baixados na etapa"),
+            ("etapa_bytes_enviados", "bytes_enviados", "Bytes enviados na etapa"),
+            ("etapa_linhas", "linhas", "Linhas processadas na etapa"),
+            ("etapa_memoria_delta_bytes", "memoria_delta_bytes", "Variação de RSS na etapa"),
+        ]
+        linhas = []
+        for metrica, chave, ajuda in metricas:
+            linhas.append(f"# HELP {PROMETHEUS_PREFIX}_{metrica} {ajuda}")
+            linhas.append(f"# TYPE {PROMETHEUS_PREFIX}_{metrica} gauge")
+            for etapa in resumo["etapas"]:
+                rotulos = f'etapa="{etapa["etapa"]}",tipo_cvu="{etapa["tipo_cvu"] or ""}"'
+                linhas.append(f"{PROMETHEUS_PREFIX}_{metrica}{{{rotulos}}} {etapa[chave]}")
+
+        for metrica, valor, ajuda in [
+            ("execucao_inicio_timestamp_segundos", resumo["inicio"], "Início da execução"),
+            ("execucao_duracao_segundos", resumo["segundos"], "Duração total da execução"),
+            ("execucao_rss_pico_bytes", resumo["rss_pico_bytes"], "Pico de RSS do processo"),
+        ]:
+            linhas.append(f"# HELP {PROMETHEUS_PREFIX}_{metrica} {ajuda}")
+            linhas.append(f"# TYPE {PROMETHEUS_PREFIX}_{metrica} gauge")
+            linhas.append(f"{PROMETHEUS_PREFIX}_{metrica} {valor}")
+        return "\n".join(linhas) + "\n"
+
+
+def traced(nome: Optional[str] = None):
+    # Decorador para métodos: o span leva o qualname do método e o tipo_cvu do argumento, se houver
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tipo_cvu = kwargs.get("tipo_cvu")
+            if tipo_cvu is None:
+                tipo_cvu = next((arg for arg in args[1:] if isinstance(arg, str)), None)
+            with get_tracer().span(nome or func.__qualname__, tipo_cvu=tipo_cvu):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile(modo: str = CVU_PROFILE, saida_dir: str = CVU_PROFILE_DIR, top: int = 25):
+    # Captura opcional da execução inteira: "cprofile" grava .prof (pstats/snakeviz) e
+    # "tracemalloc" grava as linhas que mais alocaram; com tracemalloc ativo os spans
+    # também passam a registrar heap_delta_bytes
+    if not modo:
+        yield
+        return
+    if modo not in ("cprofile", "tracemalloc"):
+        raise ValueError(f"Modo de perfil desconhecido: {modo}")
+
+    os.makedirs(saida_dir, exist_ok=True)
+    prefixo = os.path.join(saida_dir, time.strftime("perfil_%Y%m%d_%H%M%S"))
+
+    if modo == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(prefixo + ".prof")
+            texto = io.StringIO()
+            pstats.Stats(profiler, stream=texto).sort_stats("cumulative").print_stats(top)
+            logger.info("Perfil cProfile gravado em %s.prof\n%s", prefixo, texto.getvalue())
+        return
+
+    ja_ativo = tracemalloc.is_tracing()
+    if not ja_ativo:
+        tracemalloc.start(25)
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        atual, pico = tracemalloc.get_traced_memory()
+        if not ja_ativo:
+            tracemalloc.stop()
+        estatisticas = snapshot.statistics("lineno")[:top]
+        texto = "\n".join(str(estatistica) for estatistica in estatisticas)
+        _write_atomic(prefixo + ".tracemalloc.txt", texto + "\n")
+        logger.info("Perfil tracemalloc gravado em %s.tracemalloc.txt (atual %.1f MB, pico %.1f MB)\n%s",
+                    prefixo, atual / 2 ** 20, pico / 2 ** 20, texto)
+
+
+def _rss_bytes() -> int:
+    # RSS atual via /proc (Linux); fora dele, cai para o pico reportado por getrusage
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return _rss_pico_bytes()
+
+
+def _rss_pico_bytes() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # ru_maxrss vem em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _write_atomic(path: str, conteudo: str):
+    diretorio = os.path.dirname(os.path.abspath(path))
+    os.makedirs(diretorio, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+    os.replace(tmp_path, path)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
@@ -0,0 +1,374 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+import pandas as pd
+from middle.utils import setup_logger
+from constants import CVU_STATE_DIR
+from cvu_diff import _differs
+from snapshot_archive import _date_key
+logger = setup_logger()
+
+KEY_COLUMNS = ['cd_usina', 'ano_horizonte']
+# Colunas do snapshot usadas pelo índice
+COLUNAS_SNAPSHOT = ['cd_usina', 'mes_referencia', 'ano_horizonte', 'vl_cvu', 'vl_cvu_cf']
+
+
+@dataclass
+class TrendSeries:
+    # Histórico de um tipo_cvu em formato de pontos de mudança: para cada chave (usina, ano), ordenada,
+    # as entradas inicio[k]:inicio[k + 1] guardam as revisões em que o valor mudou e o novo valor
+    # (NaN quando a chave saiu do snapshot). O valor numa revisão é o da última mudança até ela
+    tipo_cvu: str
+    datas: np.ndarray
+    usinas: np.ndarray
+    anos: np.ndarray
+    inicio: np.ndarray
+    revisoes: np.ndarray
+    valores: np.ndarray
+    chave_entrada: np.ndarray = field(init=False, repr=False)
+    codigos: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Código (chave, revisão) de cada entrada, crescente porque as entradas seguem essa ordem:
+        # o valor de qualquer chave em qualquer revisão sai de uma busca binária
+        self.chave_entrada = np.repeat(np.arange(len(self.usinas)), np.diff(self.inicio))
+        self.codigos = self.chave_entrada * self.n_revisoes + self.revisoes
+
+    @classmethod
+    def from_entries(cls, tipo_cvu: str, datas: np.ndarray, usinas: np.ndarray, anos: np.ndarray,
+                     revisoes: np.ndarray, valores: np.ndarray) -> "TrendSeries":
+        # Entradas soltas (usina, ano, revisão, valor), em qualquer ordem
+        ordem = np.lexsort((revisoes, anos, usinas))
+        usinas, anos = usinas[ordem], anos[ordem]
+        novas = np.ones(len(ordem), dtype=bool)
+        novas[1:] = (usinas[1:] != usinas[:-1]) | (anos[1:] != anos[:-1])
+        primeiras = np.flatnonzero(novas)
+        return cls(
+            tipo_cvu=tipo_cvu,
+            datas=datas,
+            usinas=usinas[primeiras],
+            anos=anos[primeiras],
+            inicio=np.append(primeiras, len(ordem)).astype(np.int64),
+            revisoes=revisoes[ordem].astype(np.int64),
+            valores=valores[ordem].astype(np.float64),
+        )
+
+    def com_revisao(self, datas: np.ndarray, revisao: int, usinas: np.ndarray, anos: np.ndarray,
+                    valores: np.ndarray) -> "TrendSeries":
+        # Série com as entradas de uma nova revisão (ou substituta da última), chaves únicas e ordenadas.
+        # A revisão é a maior de cada chave, então cada entrada vai para o fim do bloco da sua chave:
+        # inserção nos arrays já ordenados, sem reordenar o histórico
+        serie = self if revisao == self.n_revisoes else self._sem_revisao(revisao)
+        chaves = _chave_composta(serie.usinas, serie.anos)
+        novas = _chave_composta(usinas, anos)
+        pos = np.searchsorted(chaves, novas)
+        existe = np.zeros(len(novas), dtype=bool)
+        if len(chaves):
+            existe = chaves[np.minimum(pos, len(chaves) - 1)] == novas
+
+        contagens = np.diff(serie.inicio)
+        np.add.at(contagens, pos[existe], 1)
+        contagens = np.insert(contagens, pos[~existe], 1)
+        pontos = serie.inicio[pos + existe]
+        return TrendSeries(
+            tipo_cvu=self.tipo_cvu,
+            datas=datas,
+            usinas=np.insert(serie.usinas, pos[~existe], usinas[~existe]),
+            anos=np.insert(serie.anos, pos[~existe], anos[~existe]),
+            inicio=np.concatenate([[0], np.cumsum(contagens)]).astype(np.int64),
+            revisoes=np.insert(serie.revisoes, pontos, revisao),
+            valores=np.insert(serie.valores, pontos, valores.astype(np.float64)),
+        )
+
+    def _sem_revisao(self, revisao: int) -> "TrendSeries":
+        # Remove as entradas da revisão (a última de cada chave que a tem) e as chaves que ficam vazias
+        manter = self.revisoes != revisao
+        contagens = np.bincount(self.chave_entrada[manter], minlength=len(self.usinas))
+        chaves = contagens > 0
+        return TrendSeries(
+            tipo_cvu=self.tipo_cvu,
+            datas=self.datas,
+            usinas=self.usinas[chaves],
+            anos=self.anos[chaves],
+            inicio=np.concatenate([[0], np.cumsum(contagens[chaves])]).astype(np.int64),
+            revisoes=self.revisoes[manter],
+            valores=self.valores[manter],
+        )
+
+    @property
+    def n_revisoes(self) -> int:
+        return len(self.datas)
+
+    def ultimos_valores(self) -> np.ndarray:
+        return self.valores[self.inicio[1:] - 1]
+
+    def valores_em(self, revisao: int) -> np.ndarray:
+        chaves = np.arange(len(self.usinas))
+        return self._valores(chaves, np.full(len(chaves), revisao))
+
+    def revisao_em(self, data) -> int:
+        # Última revisão publicada até a data (-1 se nenhuma)
+        return int(np.searchsorted(self.datas, np.datetime64(_date_key(data)), side='right')) - 1
+
+    def ultimas_revisoes(self, cd_usina: int, n: int = 5) -> pd.DataFrame:
+        # Valores da usina nas últimas n revisões: uma linha por revisão, uma coluna por ano
+        chaves = np.arange(np.searchsorted(self.usinas, cd_usina, side='left'),
+                           np.searchsorted(self.usinas, cd_usina, side='right'))
+        revisoes = np.arange(max(self.n_revisoes - n, 0), self.n_revisoes)
+        valores = self._valores(np.repeat(chaves, len(revisoes)), np.tile(revisoes, len(chaves)))
+        return pd.DataFrame(valores.reshape(len(chaves), len(revisoes)).T,
+                            index=pd.Index(self.datas[revisoes], name='dt_atualizacao'),
+                            columns=pd.Index(self.anos[chaves], name='ano_horizonte'))
+
+    def maiores_variacoes(self, dias: int = 30, top: int = 10) -> pd.DataFrame:
+        # Maiores variações absolutas entre a revisão vigente há `dias` dias e a última
+        colunas = ['cd_usina', 'ano_horizonte', 'anterior', 'atual', 'delta', 'dt_anterior', 'dt_atual']
+        if not self.n_revisoes:
+            return pd.DataFrame(columns=colunas)
+        atual = self.n_revisoes - 1
+        anterior = max(self.revisao_em(self.datas[atual] - np.timedelta64(dias, 'D')), 0)
+
+        antes, depois = self.valores_em(anterior), self.valores_em(atual)
+        delta = depois - antes
+        validas = np.flatnonzero(~np.isnan(delta) & (delta != 0))
+        ordem = validas[np.argsort(-np.abs(delta[validas]), kind='stable')[:top]]
+        return pd.DataFrame({
+            'cd_usina': self.usinas[ordem],
+            'ano_horizonte': self.anos[ordem],
+            'anterior': antes[ordem],
+            'atual': depois[ordem],
+            'delta': delta[ordem],
+            'dt_anterior': self.datas[anterior],
+            'dt_atual': self.datas[atual],
+        }, columns=colunas)
+
+    def primeira_alteracao(self, cd_usina: int = None, desde=None) -> pd.DataFrame:
+        # Primeira revisão (depois de `desde`) em que o valor de cada chave mudou; a primeira
+        # aparição da chave não conta como mudança
+        colunas = ['cd_usina', 'ano_horizonte', 'dt_alteracao', 'anterior', 'novo']
+        chaves = np.arange(len(self.usinas))
+        if cd_usina is not None:
+            chaves = chaves[self.usinas == cd_usina]
+        mudancas = np.ones(len(self.revisoes), dtype=bool)
+        mudancas[self.inicio[:-1]] = False
+        entradas = np.flatnonzero(mudancas)
+        if not len(chaves) or not len(entradas):
+            return pd.DataFrame(columns=colunas)
+
+        minima = 0 if desde is None else self.revisao_em(desde) + 1
+        pos = np.searchsorted(self.codigos[entradas], chaves * self.n_revisoes + minima, side='left')
+        pos = np.minimum(pos, len(entradas) - 1)
+        achou = self.chave_entrada[entradas[pos]] == chaves
+        entrada = entradas[pos[achou]]
+        return pd.DataFrame({
+            'cd_usina': self.usinas[chaves[achou]],
+            'ano_horizonte': self.anos[chaves[achou]],
+            'dt_alteracao': self.datas[self.revisoes[entrada]],
+            'anterior': self.valores[entrada - 1],
+            'novo': self.valores[entrada],
+        }, columns=colunas)
+
+    def _valores(self, chaves: np.ndarray, revisoes: np.ndarray) -> np.ndarray:
+        # Valor de cada par (chave, revisão): última entrada da chave com revisão até a pedida
+        if not len(chaves):
+            return np.empty(0)
+        pos = np.searchsorted(self.codigos, chaves * self.n_revisoes + revisoes, side='right') - 1
+        validos = (pos >= self.inicio[chaves]) & (revisoes >= 0)
+        return np.where(validos, self.valores[np.maximum(pos, 0)], np.nan)
+
+
+class TrendIndex:
+    # Índice de tendência dos CVU por (cd_usina, ano_horizonte) em todas as revisões de cada tipo_cvu.
+    # Só as células alteradas em cada revisão são gravadas, e as consultas usam TrendSeries carregadas
+    # uma vez por processo em vez de recarregar e pivotar o histórico
+
+    def __init__(self, path: str = os.path.join(CVU_STATE_DIR, "tendencias.sqlite")):
+        self.logger = logger
+        self.path = path
+        self._series = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS revisoes ("
+                " tipo_cvu TEXT NOT NULL,"
+                " revisao INTEGER NOT NULL,"
+                " dt_atualizacao TEXT NOT NULL,"
+                " linhas INTEGER NOT NULL,"
+                " alteradas INTEGER NOT NULL,"
+                " PRIMARY KEY (tipo_cvu, revisao))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alteracoes ("
+                " tipo_cvu TEXT NOT NULL,"
+                " cd_usina INTEGER NOT NULL,"
+                " ano_horizonte INTEGER NOT NULL,"
+                " revisao INTEGER NOT NULL,"
+                " valor REAL,"
+                " PRIMARY KEY (tipo_cvu, cd_usina, ano_horizonte, revisao))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def series(self, tipo_cvu: str) -> TrendSeries:
+        with self._lock:
+            series = self._series.get(tipo_cvu)
+        if series is None:
+            series = self._carregar(tipo_cvu)
+            with self._lock:
+                self._series[tipo_cvu] = series
+        return series
+
+    def atualizar(self, tipo_cvu: str, dt_atualizacao, df: pd.DataFrame) -> Optional[int]:
+        return self.atualizar_valores(tipo_cvu, dt_atualizacao, valores_snapshot(df))
+
+    def atualizar_valores(self, tipo_cvu: str, dt_atualizacao, atual: pd.Series) -> Optional[int]:
+        # Acrescenta o snapshot (valores por chave, como em valores_snapshot) como nova revisão e grava só
+        # as células que mudaram em relação à anterior. A mesma data substitui a última revisão
+        # (republicação); datas antigas são ignoradas
+        data = _date_key(dt_atualizacao)
+        series = self.series(tipo_cvu)
+        revisao = series.n_revisoes
+        if revisao and data < str(series.datas[-1]):
+            self.logger.warning("Revisão %s de %s anterior à última indexada (%s), ignorada",
+                                data, tipo_cvu, series.datas[-1])
+            return None
+
+        with self._connect() as conn:
+            if revisao and data == str(series.datas[-1]):
+                revisao -= 1
+                conn.execute("DELETE FROM alteracoes WHERE tipo_cvu = ? AND revisao = ?", (tipo_cvu, revisao))
+                conn.execute("DELETE FROM revisoes WHERE tipo_cvu = ? AND revisao = ?", (tipo_cvu, revisao))
+                anteriores = series.valores_em(revisao - 1)
+            else:
+                anteriores = series.ultimos_valores()
+
+            indice = pd.MultiIndex.from_arrays([series.usinas, series.anos], names=KEY_COLUMNS).union(atual.index)
+            antes = pd.Series(anteriores, index=pd.MultiIndex.from_arrays([series.usinas, series.anos],
+                                                                          names=KEY_COLUMNS))
+            antes = antes.reindex(indice).to_numpy(dtype=np.float64)
+            depois = atual.reindex(indice).to_numpy(dtype=np.float64)
+            alteradas = np.flatnonzero(_differs(antes, depois))
+
+            usinas = indice.get_level_values('cd_usina')[alteradas]
+            anos = indice.get_level_values('ano_horizonte')[alteradas]
+            valores = [None if np.isnan(valor) else float(valor) for valor in depois[alteradas]]
+            conn.execute(
+                "INSERT INTO revisoes (tipo_cvu, revisao, dt_atualizacao, linhas, alteradas) VALUES (?, ?, ?, ?, ?)",
+                (tipo_cvu, revisao, data, len(atual), len(alteradas)),
+            )
+            conn.executemany(
+                "INSERT INTO alteracoes (tipo_cvu, cd_usina, ano_horizonte, revisao, valor) VALUES (?, ?, ?, ?, ?)",
+                zip([tipo_cvu] * len(alteradas), usinas.tolist(), anos.tolist(), [revisao] * len(alteradas), valores),
+            )
+
+        # A série em memória recebe só as entradas novas, sem reler o histórico do SQLite
+        datas = np.append(series.datas[:revisao], np.datetime64(data, 'D'))
+        with self._lock:
+            self._series[tipo_cvu] = series.com_revisao(
+                datas, revisao, usinas.to_numpy(dtype=np.int64), anos.to_numpy(dtype=np.int64), depois[alteradas]
+            )
+        self.logger.info("Índice de tendência de %s: revisão %s com %d células alteradas de %d",
+                         tipo_cvu, data, len(alteradas), len(atual))
+        return len(alteradas)
+
+    def reconstruir(self, tipo_cvu: str, archive) -> int:
+        # Refaz o índice do tipo a partir dos snapshots do arquivo local, em ordem cronológica
+        self.limpar(tipo_cvu)
+        datas = sorted(archive.snapshots(tipo_cvu))
+        for data in datas:
+            self.atualizar(tipo_cvu, data, archive.read(tipo_cvu, data, columns=COLUNAS_SNAPSHOT))
+        return len(datas)
+
+    def limpar(self, tipo_cvu: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM alteracoes WHERE tipo_cvu = ?", (tipo_cvu,))
+            conn.execute("DELETE FROM revisoes WHERE tipo_cvu = ?", (tipo_cvu,))
+        with self._lock:
+            self._series.pop(tipo_cvu, None)
+
+    def _carregar(self, tipo_cvu: str) -> TrendSeries:
+        with self._connect() as conn:
+            datas = conn.execute(
+                "SELECT dt_atualizacao FROM revisoes WHERE tipo_cvu = ? ORDER BY revisao", (tipo_cvu,)
+            ).fetchall()
+            rows = conn.execute(
+                "SELECT cd_usina, ano_horizonte, revisao, valor FROM alteracoes WHERE tipo_cvu = ?"
+                " ORDER BY cd_usina, ano_horizonte, revisao", (tipo_cvu,)
+            ).fetchall()
+
+        entradas = np.array(rows, dtype=np.float64).reshape(-1, 4)
+        return TrendSeries.from_entries(
+            tipo_cvu,
+            np.array([data for data, in datas], dtype='datetime64[D]'),
+            entradas[:, 0].astype(np.int64),
+            entradas[:, 1].astype(np.int64),
+            entradas[:, 2].astype(np.int64),
+            entradas[:, 3],
+        )
+
+
+def valores_snapshot(df: pd.DataFrame) -> pd.Series:
+    # Valor por (cd_usina, ano_horizonte) no mês de referência mais recente do snapshot, como na tabela
+    # de revisão; merchant usa o CVU com frete
+    valores = ValoresSnapshot()
+    valores.adicionar(df)
+    return valores.valores()
+
+
+class ValoresSnapshot:
+    # valores_snapshot acumulado bloco a bloco: soma e contagem por chave no mês de referência mais
+    # recente visto até agora, então a memória depende do número de chaves e não do tamanho do arquivo
+
+    def __init__(self):
+        self.linhas = 0
+        self._mes = None
+        self._parciais = None
+
+    def adicionar(self, df: pd.DataFrame):
+        self.linhas += len(df)
+        mes = None
+        if 'mes_referencia' in df.columns and len(df):
+            meses = df['mes_referencia'].astype(str)
+            mes = meses.max()
+            if self._mes is not None and mes < self._mes:
+                return
+            df = df[(meses == mes).to_numpy()]
+        coluna = 'vl_cvu' if 'vl_cvu' in df.columns else 'vl_cvu_cf'
+        valores = pd.DataFrame({
+            'cd_usina': _inteiros(df['cd_usina']),
+            'ano_horizonte': _inteiros(df['ano_horizonte']),
+            'valor': df[coluna].to_numpy(dtype=np.float64, na_value=np.nan),
+        })
+        parciais = valores.groupby(KEY_COLUMNS, sort=True)['valor'].agg(['sum', 'count'])
+        if self._parciais is None or (mes is not None and mes != self._mes):
+            self._mes, self._parciais = mes, parciais
+        elif len(parciais):
+            self._parciais = self._parciais.add(parciais, fill_value=0)
+
+    def valores(self) -> pd.Series:
+        if self._parciais is None:
+            return pd.Series([], index=pd.MultiIndex.from_arrays([[], []], names=KEY_COLUMNS),
+                             dtype=np.float64, name='valor')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            valores = self._parciais['sum'] / self._parciais['count'].where(self._parciais['count'] > 0)
+        return valores.rename('valor')
+
+
+def _inteiros(serie: pd.Series) -> np.ndarray:
+    # ano_horizonte chega como inteiro, texto (derivado do mês de referência) ou category de qualquer um dos dois
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = _inteiros(pd.Series(serie.cat.categories))
+        return categorias[serie.cat.codes.to_numpy()]
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        return serie.to_numpy(dtype=np.int64)
+    return pd.to_numeric(serie.astype(str)).to_numpy(dtype=np.int64)
+
+
+def _chave_composta(usinas: np.ndarray, anos: np.ndarray) -> np.ndarray:
+    # (cd_usina, ano_horizonte) num inteiro com a mesma ordem do par, para busca binária
+    return (usinas.astype(np.int64) << 32) + anos.astype(np.int64)
@@ -0,0 +1,116 @@
+import gzip
+import time
+import random
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Optional
+import requests
+import pandas as pd
+from middle.utils import setup_logger
+from serialization import dataframe_to_json
+from http_client import get_client
+from constants import (
+    CVU_POST_BATCH_SIZE, CVU_POST_GZIP, CVU_POST_MAX_IN_FLIGHT, CVU_POST_RETRIES, CVU_POST_BACKOFF
+)
+logger = setup_logger()
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class UploadError(Exception):
+    pass
+
+
+@dataclass
+class UploadResult:
+    linhas: int = 0
+    lotes: int = 0
+    bytes: int = 0
+    segundos: float = 0.0
+    respostas: list = field(default_factory=list)
+
+    @property
+    def linhas_por_segundo(self) -> float:
+        return self.linhas / self.segundos if self.segundos else 0.0
+
+
+class BatchUploader:
+    # Envia um DataFrame em lotes JSON (opcionalmente gzip), com lotes paralelos limitados e retry por lote
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = CVU_POST_BATCH_SIZE,
+        gzip_body: bool = CVU_POST_GZIP,
+        max_in_flight: int = CVU_POST_MAX_IN_FLIGHT,
+        retries: int = CVU_POST_RETRIES,
+        backoff: float = CVU_POST_BACKOFF,
+        serializer: Callable[[pd.DataFrame], bytes] = dataframe_to_json,
+    ):
+        self.logger = logger
+        self.client = get_client()
+        self.batch_size = batch_size
+        self.gzip_body = gzip_body
+        self.max_in_flight = max(1, max_in_flight)
+        self.retries = retries
+        self.backoff = backoff
+        self.serializer = serializer
+
+    def upload(self, url: str, df: pd.DataFrame) -> UploadResult:
+        result = UploadResult()
+        inicio = time.perf_counter()
+        batch_size = self.batch_size or max(len(df), 1)
+        offsets = iter(range(0, max(len(df), 1), batch_size))
+
+        # Os lotes são serializados dentro das threads e submetidos sob demanda,
+        # então a memória fica limitada a max_in_flight lotes simultâneos
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            pending = {}
+            for offset in offsets:
+                if len(pending) >= self.max_in_flight:
+                    self._collect(wait(pending, return_when=FIRST_COMPLETED).done, pending, result)
+                batch = df.iloc[offset:offset + batch_size]
+                pending[executor.submit(self._post_batch, url, batch)] = (offset, len(batch))
+            self._collect(wait(pending).done, pending, result)
+
+        result.segundos = time.perf_counter() - inicio
+        result.respostas = [resposta for _, resposta in sorted(result.respostas, key=lambda item: item[0])]
+        self.logger.info("Envio concluído: %d linhas em %d lotes, %.1fs (%.0f linhas/s)",
+                         result.linhas, result.lotes, result.segundos, result.linhas_por_segundo)
+        return result
+
+    def _collect(self, done, pending: dict, result: UploadResult):
+        for future in done:
+            offset, linhas = pending.pop(future)
+            resposta, tamanho = future.result()
+            result.linhas += linhas
+            result.lotes += 1
+            result.bytes += tamanho
+            result.respostas.append((offset, resposta))
+
+    def _post_batch(self, url: str, batch: pd.DataFrame):
+        body = self.serializer(batch)
+        request_headers = {'Content-Type': 'application/json'}
+        if self.gzip_body:
+            body = gzip.compress(body)
+            request_headers['Content-Encoding'] = 'gzip'
+
+        for tentativa in range(self.retries + 1):
+            try:
+                res = self.client.post(url, data=body, headers=request_headers, auth=True)
+            except requests.RequestException as e:
+                erro = str(e)
+            else:
+                if res.status_code < 300:
+                    return res.json(), len(body)
+                erro = f"{res.status_code} - {res.text}"
+                if res.status_code not in RETRY_STATUS:
+                    break
+
+            if tentativa < self.retries:
+                espera = self.backoff * (2 ** tentativa) * (1 + random.random())
+                self.logger.warning("Falha ao enviar lote de %d linhas (%s), nova tentativa em %.1fs",
+                                    len(batch), erro, espera)
+                time.sleep(espera)
+
+        self.logger.error("Falha ao enviar lote de %d linhas: %s", len(batch), erro)
+        raise UploadError(f"Erro ao postar CVU: {erro}")
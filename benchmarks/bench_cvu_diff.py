@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from cvu_diff import diff_cvu
+
+
+def synthetic_snapshot(usinas: int, anos: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    cd_usina = np.repeat(np.arange(1, usinas + 1), anos)
+    ano_horizonte = np.tile(np.arange(2025, 2025 + anos), usinas)
+    return pd.DataFrame({
+        'cd_usina': cd_usina,
+        'ano_horizonte': ano_horizonte,
+        'vl_cvu': rng.uniform(0, 2000, len(cd_usina)).round(2),
+    })
+
+
+def revisao(df: pd.DataFrame, fracao: float, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    alteradas = rng.random(len(df)) < fracao
+    df.loc[alteradas, 'vl_cvu'] += rng.uniform(-50, 50, alteradas.sum()).round(2)
+    return df
+
+
+def esparso(df: pd.DataFrame, seed: int, deslocar: bool = False) -> pd.DataFrame:
+    # Como publicado pela CCEE: valores '-' (nulos), usinas que entram ou saem e, no snapshot atual, o
+    # horizonte sem o primeiro ano (um ano novo no atual quebra o caminho por pivot, então não é comparado)
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    df.loc[rng.random(len(df)) < 0.05, 'vl_cvu'] = np.nan
+    usinas = df['cd_usina'].unique()
+    df = df[~df['cd_usina'].isin(rng.choice(usinas, max(len(usinas) // 50, 1), replace=False))]
+    novas = df[df['cd_usina'] == df['cd_usina'].iloc[0]].assign(cd_usina=usinas.max() + 1)
+    df = pd.concat([df, novas], ignore_index=True)
+    return df[df['ano_horizonte'] != df['ano_horizonte'].min()] if deslocar else df
+
+
+def conferir(df_ant: pd.DataFrame, df_atu: pd.DataFrame) -> pd.DataFrame:
+    esperado = legacy_diff(df_ant, df_atu)
+    obtido = diff_cvu(df_ant, df_atu).to_frame()
+    # A ordem das linhas não é comparada: o concat do pivot põe no fim as usinas de um lado só, e
+    # generate_table reordena a tabela pelo valor novo
+    pd.testing.assert_frame_equal(obtido[esperado.columns].sort_index(), esperado.sort_index(), check_names=False)
+    return obtido
+
+
+def legacy_diff(df_ant: pd.DataFrame, df_atu: pd.DataFrame) -> pd.DataFrame:
+    # Caminho anterior de GenerateTable.generate_table
+    df_ant = df_ant[df_ant['cd_usina'].isin(df_atu['cd_usina'])]
+    ant_pivot = df_ant.pivot_table(index='cd_usina', columns='ano_horizonte', values='vl_cvu')
+    atu_pivot = df_atu.pivot_table(index='cd_usina', columns='ano_horizonte', values='vl_cvu')
+    ant_pivot.columns = [f'{col}_old' for col in ant_pivot.columns]
+    atu_pivot.columns = [f'{col}_new' for col in atu_pivot.columns]
+    df_merged = pd.concat([ant_pivot, atu_pivot], axis=1)
+    for col in atu_pivot.columns:
+        ano = col.split('_')[0]
+        df_merged[f'{ano}_dif'] = df_merged[f'{ano}_new'] - df_merged[f'{ano}_old']
+    cols_dif = [col for col in df_merged.columns if col.endswith('_dif')]
+    return df_merged[(df_merged[cols_dif] != 0).any(axis=1)]
+
+
+def medir(func, repeticoes: int) -> float:
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do diff de revisões de CVU")
+    parser.add_argument('--tamanhos', nargs='+', default=['500x5', '2000x30', '10000x60'],
+                        help="usinas x anos de horizonte")
+    parser.add_argument('--fracao', type=float, default=0.05, help="fração de células alteradas")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    for tamanho in args.tamanhos:
+        usinas, anos = (int(v) for v in tamanho.split('x'))
+        df_ant = synthetic_snapshot(usinas, anos, seed=0)
+        df_atu = revisao(df_ant, args.fracao, seed=1)
+
+        obtido = conferir(df_ant, df_atu)
+        # Equivalência também com nulos e chaves ausentes de um dos lados (não entra na medição)
+        for seed in range(5):
+            conferir(esparso(df_ant, seed), esparso(df_atu, seed + 100, deslocar=seed % 2 == 1))
+
+        legado = medir(lambda: legacy_diff(df_ant, df_atu), args.repeticoes)
+        novo = medir(lambda: diff_cvu(df_ant, df_atu).to_frame(), args.repeticoes)
+        print(f"{usinas:>6} usinas x {anos:>3} anos  pivot {legado:7.3f}s  matriz {novo:7.3f}s  "
+              f"({legado / novo:5.1f}x, {len(obtido)} usinas alteradas)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import argparse
+import subprocess
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Cenários de inicialização a frio: o ponto de entrada e o módulo do produto já resolvido,
+# que é o que o caminho de verificação (daemon ou execução sem novidade) carrega
+CENARIOS = {
+    'main': "import main",
+    'cvu': "import main; main.load_handler('cvu')",
+}
+
+# Dependências pesadas que só devem ser carregadas nas etapas de ingestão, tabela e envio
+PROIBIDOS = ['pandas', 'numpy', 'bs4', 'PIL', 'pyarrow', 'middle.message', 'middle.airflow']
+
+
+def medir_importacao(codigo: str) -> list:
+    # -X importtime escreve em stderr: "import time: self [us] | cumulative | pacote",
+    # com o nome indentado conforme a profundidade do import
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo],
+                         cwd=RAIZ, capture_output=True, text=True)
+    if res.returncode != 0:
+        raise SystemExit(f"Falha ao importar ({codigo}):\n{res.stderr[-2000:]}")
+
+    modulos = []
+    for linha in res.stderr.splitlines():
+        if not linha.startswith('import time:') or 'cumulative' in linha:
+            continue
+        proprio, acumulado, nome = linha.split(':', 1)[1].split('|')
+        # Um espaço separa a coluna; cada nível de profundidade acrescenta mais dois
+        profundidade = (len(nome) - len(nome.lstrip()) - 1) // 2
+        modulos.append((nome.strip(), profundidade, int(proprio), int(acumulado)))
+    return modulos
+
+
+def total_ms(modulos: list) -> float:
+    return sum(acumulado for _, profundidade, _, acumulado in modulos if profundidade == 0) / 1000
+
+
+def avaliar(nome: str, codigo: str, orcamento_ms: float, repeticoes: int) -> bool:
+    # Melhor de N medidas: a primeira também paga a compilação dos .pyc
+    modulos = min((medir_importacao(codigo) for _ in range(max(repeticoes, 1))), key=total_ms)
+    total = total_ms(modulos)
+    carregados = {modulo for modulo, *_ in modulos}
+    proibidos = [modulo for modulo in PROIBIDOS if modulo in carregados]
+
+    print(f"{nome:>6}: {total:8.1f} ms  ({len(modulos)} módulos, orçamento {orcamento_ms:.0f} ms)")
+    mais_lentos = sorted((m for m in modulos if m[1] == 0), key=lambda m: m[3], reverse=True)[:8]
+    for modulo, _, _, acumulado in mais_lentos:
+        print(f"        {acumulado / 1000:8.1f} ms  {modulo}")
+    for modulo in proibidos:
+        print(f"        ERRO: {modulo} carregado na inicialização")
+
+    return total <= orcamento_ms and not proibidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Orçamento de tempo de import do ponto de entrada (-X importtime)")
+    parser.add_argument('--orcamento-ms', type=float, default=400.0)
+    parser.add_argument('--cenarios', nargs='+', default=list(CENARIOS), choices=list(CENARIOS))
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    resultados = [avaliar(nome, CENARIOS[nome], args.orcamento_ms, args.repeticoes) for nome in args.cenarios]
+    if not all(resultados):
+        raise SystemExit("Orçamento de import excedido ou dependência pesada carregada na inicialização")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import io
+import os
+import sys
+import time
+import argparse
+import statistics
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from renderers import RENDERERS, HEADER_COLOR
+
+
+def synthetic_table(usinas: int, anos: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {'NOME': [f'USINA {i}' for i in range(usinas)]}
+    for sufixo in ('old', 'new', 'dif'):
+        for ano in range(2025, 2025 + anos):
+            valores = rng.uniform(0, 2000, usinas)
+            valores[rng.random(usinas) < 0.1] = np.nan
+            data[f'{ano}_{sufixo}'] = valores
+    df = pd.DataFrame(data, index=pd.Index(rng.integers(1, 999, usinas)))
+    df.columns.name = 'USINA'
+    return df
+
+
+def verificar_png(png: bytes):
+    # Sanidade em nível de pixel: PNG válido, faixa do título sombreada e algum texto escuro desenhado
+    from PIL import Image
+
+    imagem = Image.open(io.BytesIO(png)).convert('RGB')
+    largura, altura = imagem.size
+    if largura < 80 or altura < 40:
+        raise AssertionError(f"Imagem pequena demais: {imagem.size}")
+    esperado = tuple(int(HEADER_COLOR[i:i + 2], 16) for i in (1, 3, 5))
+    if imagem.getpixel((2, 2)) != esperado:
+        raise AssertionError(f"Cabeçalho sem sombreamento {HEADER_COLOR}: {imagem.getpixel((2, 2))}")
+    pixels = np.asarray(imagem)
+    if not (pixels.sum(axis=2) < 200).any():
+        raise AssertionError("Nenhum texto desenhado na imagem")
+    return imagem.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência e sanidade dos renderizadores de tabela")
+    parser.add_argument('--renderers', nargs='+', default=list(RENDERERS))
+    parser.add_argument('--usinas', type=int, default=30)
+    parser.add_argument('--anos', type=int, default=5)
+    parser.add_argument('--repeticoes', type=int, default=10)
+    args = parser.parse_args()
+
+    df = synthetic_table(args.usinas, args.anos)
+    for nome in args.renderers:
+        inicio = time.perf_counter()
+        try:
+            renderer = RENDERERS[nome]()
+            png = renderer.render(df, "ATUALIZAÇÃO DE CVU ESTRUTURAL ")
+        except ImportError as e:
+            print(f"{nome:>8}: indisponível ({e})")
+            continue
+        frio = time.perf_counter() - inicio
+
+        tempos = []
+        for _ in range(args.repeticoes):
+            inicio = time.perf_counter()
+            png = renderer.render(df, "ATUALIZAÇÃO DE CVU ESTRUTURAL ")
+            tempos.append(time.perf_counter() - inicio)
+
+        tamanho = verificar_png(png)
+        print(f"{nome:>8}: frio {frio * 1000:8.1f}ms  quente mediana {statistics.median(tempos) * 1000:8.1f}ms  "
+              f"imagem {tamanho[0]}x{tamanho[1]}  {len(png) / 1024:.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import datetime
+import argparse
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from schema import compact_frame, constant_column, memory_report
+from serialization import dataframe_to_json
+
+CATEGORICAS = ["mes_referencia", "codigo_parcela_usina", "ano_horizonte"]
+CONSTANTES = {'dt_atualizacao': datetime.date(2025, 1, 10), 'tipo_cvu': 'estrutural', 'fonte': 'CCEE_estrutural'}
+
+
+def synthetic_estrutural(usinas: int, anos: int, seed: int = 0) -> pd.DataFrame:
+    # Mesmo layout que ReadCvu produz para o estrutural com os tipos Python de MAPEAMENTO_CVU
+    rng = np.random.default_rng(seed)
+    cd_usina = np.repeat(np.arange(1, usinas + 1), anos)
+    vl_cvu = rng.uniform(0, 2000, len(cd_usina)).round(2)
+    vl_cvu[rng.random(len(cd_usina)) < 0.05] = np.nan
+    df = pd.DataFrame({
+        'cd_usina': cd_usina,
+        'mes_referencia': np.array(['202501'] * len(cd_usina), dtype=object),
+        'vl_cvu': vl_cvu,
+        'ano_horizonte': np.tile(np.arange(2025, 2025 + anos), usinas),
+        'codigo_parcela_usina': np.array([f'UTE USINA {n}' for n in cd_usina], dtype=object),
+    })
+    for col, valor in CONSTANTES.items():
+        df[col] = valor
+    return df
+
+
+def compactar(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    for col, valor in CONSTANTES.items():
+        df[col] = constant_column(valor, len(df))
+    return compact_frame(df, CATEGORICAS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória do frame estrutural: tipos Python vs esquema compacto")
+    parser.add_argument('--usinas', type=int, nargs='+', default=[400, 4_000, 40_000])
+    parser.add_argument('--anos', type=int, default=5)
+    parser.add_argument('--meta', type=float, default=5.0, help="redução mínima exigida")
+    args = parser.parse_args()
+
+    falhou = False
+    for usinas in args.usinas:
+        legado = synthetic_estrutural(usinas, args.anos)
+        inicio = time.perf_counter()
+        compacto = compactar(legado)
+        segundos = time.perf_counter() - inicio
+
+        if json.loads(dataframe_to_json(legado)) != json.loads(dataframe_to_json(compacto)):
+            raise SystemExit(f"Serializações divergentes para {usinas} usinas")
+
+        antes, depois = memory_report(legado), memory_report(compacto)
+        reducao = antes['bytes'] / depois['bytes']
+        falhou |= reducao < args.meta
+        print(f"{len(legado):>9} linhas  {antes['bytes'] / 2 ** 20:8.2f} MB -> {depois['bytes'] / 2 ** 20:7.2f} MB  "
+              f"({reducao:4.1f}x, {depois['bytes_por_linha']:.1f} B/linha, conversão {segundos:.3f}s)")
+
+    print("\nbytes por coluna (último tamanho):")
+    for col, info in depois['colunas'].items():
+        print(f"  {col:<22} {str(info['dtype'])[:30]:<30} {info['bytes'] / len(compacto):6.2f} B/linha "
+              f"(antes {antes['colunas'][col]['bytes'] / len(legado):6.2f})")
+
+    if falhou:
+        raise SystemExit(f"Redução abaixo da meta de {args.meta}x")
+
+
+if __name__ == '__main__':
+    main()
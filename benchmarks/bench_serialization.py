@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import time
+import datetime
+import argparse
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from serialization import dataframe_to_json, orjson
+
+
+def synthetic_cvu(linhas: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    vl_cvu = rng.uniform(0, 2000, linhas).round(2)
+    vl_cvu[rng.random(linhas) < 0.05] = np.nan
+    return pd.DataFrame({
+        'mes_referencia': rng.choice(['202501', '202502', '202503'], linhas),
+        'cd_usina': rng.integers(1, 600, linhas),
+        'vl_cvu': vl_cvu,
+        'ano_horizonte': rng.integers(2025, 2030, linhas),
+        'codigo_parcela_usina': rng.choice(['UTE A', 'UTE B', 'UTE Ç'], linhas),
+        'dt_atualizacao': datetime.date(2025, 1, 10),
+        'tipo_cvu': 'estrutural',
+        'fonte': 'CCEE_estrutural',
+    })
+
+
+def legacy_to_json(df: pd.DataFrame) -> bytes:
+    # Caminho anterior: replace para None, apply com strftime linha a linha e to_dict('records')
+    df = df.replace({np.nan: None, np.inf: None, -np.inf: None})
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            df[col] = df[col].apply(lambda x: x.strftime('%Y-%m-%d') if hasattr(x, 'strftime') else x)
+    return json.dumps(df.to_dict('records')).encode('utf-8')
+
+
+def medir(func, df: pd.DataFrame, repeticoes: int) -> float:
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func(df)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark da serialização JSON de CVU")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"encoder de strings: {'orjson' if orjson else 'json'}")
+    for linhas in args.linhas:
+        df = synthetic_cvu(linhas)
+        # Com pandas >= 3 o replace não converte NaN de colunas float, e o legado emite NaN (JSON inválido)
+        legado_json = json.loads(legacy_to_json(df), parse_constant=lambda _: None)
+        if legado_json != json.loads(dataframe_to_json(df)):
+            raise SystemExit(f"Saídas divergentes para {linhas} linhas")
+        legado = medir(legacy_to_json, df, args.repeticoes)
+        novo = medir(dataframe_to_json, df, args.repeticoes)
+        print(f"{linhas:>9} linhas  legado {legado:8.3f}s  vetorizado {novo:8.3f}s  ({legado / novo:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import datetime
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from trend_index import TrendIndex, valores_snapshot
+
+
+def synthetic_history(usinas: int, anos: int, revisoes: int, fracao: float, seed: int = 0):
+    # Revisões semanais do estrutural com uma fração das células alterada a cada revisão
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'cd_usina': np.repeat(np.arange(1, usinas + 1), anos),
+        'mes_referencia': '202501',
+        'ano_horizonte': np.tile(np.arange(2025, 2025 + anos), usinas),
+        'vl_cvu': rng.uniform(0, 2000, usinas * anos).round(2),
+    })
+    inicio = datetime.date(2025, 1, 6)
+    for revisao in range(revisoes):
+        df = df.copy()
+        alteradas = rng.random(len(df)) < fracao
+        df.loc[alteradas, 'vl_cvu'] += rng.uniform(-50, 50, alteradas.sum()).round(2)
+        yield inicio + datetime.timedelta(days=7 * revisao), df
+
+
+def legacy_movers(historico: list, dias: int, top: int) -> pd.DataFrame:
+    # Sem índice: recarrega todas as revisões e pivota o histórico a cada consulta
+    pivot = pd.concat({dt: valores_snapshot(df) for dt, df in historico}, axis=1)
+    limite = historico[-1][0] - datetime.timedelta(days=dias)
+    anterior = max(i for i, (dt, _) in enumerate(historico) if dt <= limite)
+    delta = (pivot.iloc[:, -1] - pivot.iloc[:, anterior]).dropna()
+    delta = delta[delta != 0]
+    return delta.reindex(delta.abs().sort_values(ascending=False).index[:top])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice de tendência vs recarga do histórico de CVU")
+    parser.add_argument('--usinas', type=int, default=2000)
+    parser.add_argument('--anos', type=int, default=30)
+    parser.add_argument('--revisoes', type=int, default=52)
+    parser.add_argument('--fracao', type=float, default=0.02, help="fração de células alteradas por revisão")
+    args = parser.parse_args()
+
+    historico = list(synthetic_history(args.usinas, args.anos, args.revisoes, args.fracao))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tendencias.sqlite')
+        index = TrendIndex(path)
+        inicio = time.perf_counter()
+        alteradas = [index.atualizar('estrutural', dt, df) for dt, df in historico]
+        atualizacao = (time.perf_counter() - inicio) / len(historico)
+
+        inicio = time.perf_counter()
+        series = TrendIndex(path).series('estrutural')
+        carga = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        movers = series.maiores_variacoes(dias=30, top=20)
+        series.ultimas_revisoes(1, n=10)
+        series.primeira_alteracao(cd_usina=1)
+        consultas = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    legado = legacy_movers(historico, dias=30, top=20)
+    recarga = time.perf_counter() - inicio
+
+    if not np.allclose(np.sort(np.abs(movers['delta'].to_numpy())), np.sort(np.abs(legado.to_numpy()))):
+        raise SystemExit("Maiores variações divergentes entre índice e histórico completo")
+
+    celulas = args.usinas * args.anos
+    print(f"{celulas} células x {args.revisoes} revisões, {np.mean(alteradas[1:]):.0f} alteradas por revisão")
+    print(f"  entradas no índice    {len(series.revisoes):>10} ({len(series.revisoes) / (celulas * args.revisoes):.1%} "
+          f"do histórico completo)")
+    print(f"  atualização/revisão   {atualizacao * 1000:10.1f} ms")
+    print(f"  carga das séries      {carga * 1000:10.1f} ms (do SQLite, uma vez por processo)")
+    print(f"  3 consultas           {consultas * 1000:10.1f} ms")
+    print(f"  recarga + pivot       {recarga * 1000:10.1f} ms (por consulta, sem índice)")
+
+
+if __name__ == '__main__':
+    main()
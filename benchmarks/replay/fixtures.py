@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'app')))
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# Colunas como publicadas pela CCEE (antes de sanitize_string)
+CSV_COLUMNS = {
+    'conjuntural': ['MES_REFERENCIA', 'CODIGO_MODELO_PRECO', 'CVU_CONJUNTURAL', 'CNPJ_AGENTE_VENDEDOR'],
+    'conjuntural_revisado': ['MES_REFERENCIA', 'CODIGO_MODELO_PRECO', 'CVU_CONJUNTURAL', 'CNPJ_AGENTE_VENDEDOR'],
+    'estrutural': ['MES_REFERENCIA', 'CODIGO_MODELO_PRECO', 'ANO_HORIZONTE', 'CVU_ESTRUTURAL', 'CODIGO_PARCELA_USINA'],
+    'merchant': ['MES_REFERENCIA', 'CODIGO_MODELO_PRECO', 'CVU_CF', 'CVU_SCF', 'MES_REFERENCIA_COTACAO'],
+}
+
+DATASET_PAGE = """<html><body>
+<section class="additional-info"><table><tbody>
+<tr><th>Autor</th><td><span>CCEE</span></td></tr>
+<tr><th>Última Atualização</th><td><span>{data}</span></td></tr>
+</tbody></table></section>
+</body></html>
+"""
+
+PT_MONTHS = ["janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+             "agosto", "setembro", "outubro", "novembro", "dezembro"]
+
+
+def ccee_dir(base: str, tipo_cvu: str) -> str:
+    return os.path.join(base, 'ccee', tipo_cvu)
+
+
+def backend_dir(base: str) -> str:
+    return os.path.join(base, 'backend')
+
+
+def cvu_fixture_path(base: str, fonte: str, dt_atualizacao: str) -> str:
+    return os.path.join(backend_dir(base), 'cvu', f'{fonte}__{dt_atualizacao}.json')
+
+
+def _write(path: str, content, modo: str = 'w'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, modo, **({} if 'b' in modo else {'encoding': 'utf-8'})) as f:
+        if isinstance(content, (dict, list)):
+            json.dump(content, f)
+        else:
+            f.write(content)
+
+
+def synthetic_csv(tipo_cvu: str, usinas: int, anos: int, mes_referencia: str, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    columns = CSV_COLUMNS[tipo_cvu]
+    repeticoes = anos if 'ANO_HORIZONTE' in columns else 1
+    codigo = np.repeat(np.arange(1, usinas + 1), repeticoes)
+    data = {'MES_REFERENCIA': mes_referencia, 'CODIGO_MODELO_PRECO': codigo}
+    for col in columns[2:]:
+        if col == 'ANO_HORIZONTE':
+            data[col] = np.tile(np.arange(int(mes_referencia[:4]), int(mes_referencia[:4]) + anos), usinas)
+        elif col.startswith('CVU'):
+            data[col] = rng.uniform(0, 2000, len(codigo)).round(2)
+        elif col == 'CNPJ_AGENTE_VENDEDOR':
+            data[col] = [f'{n:014d}' for n in codigo]
+        elif col == 'CODIGO_PARCELA_USINA':
+            data[col] = [f'P{n}' for n in codigo]
+        else:
+            data[col] = mes_referencia
+    df = pd.DataFrame(data)
+    valor = value_column(tipo_cvu)
+    df[valor] = df[valor].astype(object)
+    df.loc[rng.random(len(df)) < 0.02, valor] = '-'
+    return df
+
+
+def value_column(tipo_cvu: str) -> str:
+    return next(col for col in CSV_COLUMNS[tipo_cvu] if col.startswith('CVU'))
+
+
+def generate_synthetic(base: str = FIXTURES_DIR, usinas: int = 400, anos: int = 5, seed: int = 0):
+    # Fixtures sintéticas: um snapshot anterior já aceito pelo backend e um novo publicado na CCEE
+    from constants import MAPEAMENTO_CVU, BRT
+
+    agora = datetime.datetime(2025, 1, 10, 14, 32)
+    anterior = agora - datetime.timedelta(days=7)
+    historico = []
+
+    for i, tipo_cvu in enumerate(MAPEAMENTO_CVU):
+        novo = synthetic_csv(tipo_cvu, usinas, anos, '202501', seed + i)
+        _write(os.path.join(ccee_dir(base, tipo_cvu), 'content.csv'), novo.to_csv(index=False))
+        _write(os.path.join(ccee_dir(base, tipo_cvu), 'dataset.html'), DATASET_PAGE.format(
+            data=f"{PT_MONTHS[agora.month - 1]} {agora.day:02d}, {agora.year}, {agora:%H:%M} (BRT)"))
+        _write(os.path.join(ccee_dir(base, tipo_cvu), 'package_show.json'), {
+            'success': True,
+            'result': {
+                'name': MAPEAMENTO_CVU[tipo_cvu]['nome_ccee'],
+                'metadata_modified': agora.replace(tzinfo=BRT).astimezone(datetime.timezone.utc)
+                                         .replace(tzinfo=None).isoformat(),
+                'resources': [{'id': MAPEAMENTO_CVU[tipo_cvu]['resource'],
+                               'last_modified': agora.isoformat()}],
+            },
+        })
+
+        # Snapshot anterior no formato devolvido pela API (já renomeado)
+        anterior_df = synthetic_csv(tipo_cvu, usinas, anos, '202501', seed + 100 + i)
+        rows = []
+        valor = value_column(tipo_cvu)
+        for _, linha in anterior_df.iterrows():
+            rows.append({
+                'cd_usina': int(linha['CODIGO_MODELO_PRECO']),
+                'mes_referencia': linha['MES_REFERENCIA'],
+                'ano_horizonte': int(linha.get('ANO_HORIZONTE', linha['MES_REFERENCIA'][:4])),
+                'vl_cvu': None if linha[valor] == '-' else float(linha[valor]),
+            })
+        _write(cvu_fixture_path(base, tipo_cvu, anterior.strftime('%Y-%m-%d')), rows)
+        historico.append({'tipo_cvu': tipo_cvu, 'data_atualizacao': anterior.isoformat()})
+
+    _write(os.path.join(backend_dir(base), 'historico.json'), {'data': historico})
+    _write(os.path.join(backend_dir(base), 'nome_ute.json'),
+           [{'cd_usina': n, 'sigla_parcela': f'UTE USINA {n}'} for n in range(1, usinas + 1)])
+
+
+def record(base: str = FIXTURES_DIR):
+    # Grava páginas, package_show e CSVs reais da CCEE e as respostas de referência do backend
+    from middle.utils import Constants
+    from http_client import get_client
+    from constants import MAPEAMENTO_CVU, CCEE_DADOS_ABERTOS_URL
+
+    client = get_client()
+    constants = Constants()
+
+    for tipo_cvu, mapeamento in MAPEAMENTO_CVU.items():
+        destino = ccee_dir(base, tipo_cvu)
+        res = client.get(f"{CCEE_DADOS_ABERTOS_URL}/dataset/{mapeamento['nome_ccee']}")
+        res.raise_for_status()
+        _write(os.path.join(destino, 'dataset.html'), res.text)
+        res = client.get(f"{CCEE_DADOS_ABERTOS_URL}/api/3/action/package_show",
+                         params={'id': mapeamento['nome_ccee']})
+        res.raise_for_status()
+        _write(os.path.join(destino, 'package_show.json'), res.json())
+        res = client.get(mapeamento['url'])
+        res.raise_for_status()
+        _write(os.path.join(destino, 'content.csv'), res.content, 'wb')
+        print(f"gravado {tipo_cvu}: {len(res.content)} bytes de CSV")
+
+    historico = client.get(constants.GET_HISTORICO_CVU, auth=True).json()
+    _write(os.path.join(backend_dir(base), 'historico.json'), historico)
+    nome_ute = client.get(constants.GET_NOME_UTE, params={'dt_atualizacao': '', 'fonte': ''}, auth=True).json()
+    _write(os.path.join(backend_dir(base), 'nome_ute.json'), nome_ute)
+
+    for item in historico['data']:
+        dt_atualizacao = pd.to_datetime(item['data_atualizacao']).strftime('%Y-%m-%d')
+        rows = client.get(constants.GET_CVU, params={'dt_atualizacao': dt_atualizacao, 'fonte': item['tipo_cvu']},
+                          auth=True).json()
+        _write(cvu_fixture_path(base, item['tipo_cvu'], dt_atualizacao), rows)
+    print(f"gravadas respostas do backend para {len(historico['data'])} revisões")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera ou grava as fixtures do replay offline de CVU")
+    parser.add_argument('modo', choices=['sintetico', 'gravar'])
+    parser.add_argument('--destino', default=FIXTURES_DIR)
+    parser.add_argument('--usinas', type=int, default=400)
+    parser.add_argument('--anos', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.modo == 'gravar':
+        record(args.destino)
+    else:
+        generate_synthetic(args.destino, args.usinas, args.anos)
+        print(f"fixtures sintéticas em {args.destino}")
+
+
+if __name__ == '__main__':
+    main()
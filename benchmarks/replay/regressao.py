@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+import tempfile
+import subprocess
+from collections import defaultdict
+
+from run import preparar_cvu, criar_tarefa
+from fixtures import generate_synthetic, ccee_dir
+from server import start_server
+
+# Cenários de regressão do workflow de CVU contra o backend simulado. Cada cenário roda num
+# processo próprio, com estado, cache e fixtures novos (a configuração é lida no import de constants)
+
+
+def _linhas_postadas(state, tipo_cvu: str) -> int:
+    return sum(len(linhas) for (fonte, _), linhas in state.postados.items() if fonte == tipo_cvu)
+
+
+def _status_check(state, tipo_cvu: str):
+    return [registro.get('status') for (tipo, _), registro in state.checks.items() if tipo == tipo_cvu]
+
+
+def falha_e_reexecucao(base_url: str, state):
+    # O POST do estrutural falha na primeira execução: o check-cvu já criou o registro 'processando'
+    # (e a revisão aparece no histórico), mas a versão não pode entrar no ledger como processada
+    efeitos = defaultdict(int)
+    cvu = preparar_cvu(base_url, efeitos)
+
+    state.falhar_post.add('estrutural')
+    criar_tarefa(cvu, efeitos).run_process()
+    assert _linhas_postadas(state, 'estrutural') == 0, "POST do estrutural deveria ter falhado"
+    assert _status_check(state, 'estrutural') == ['processando'], _status_check(state, 'estrutural')
+    dags = efeitos['trigger_dag']
+
+    state.falhar_post.clear()
+    criar_tarefa(cvu, efeitos).run_process()
+    assert _linhas_postadas(state, 'estrutural') > 0, "estrutural não foi reprocessado na segunda execução"
+    assert _status_check(state, 'estrutural') == ['processado'], _status_check(state, 'estrutural')
+    assert efeitos['trigger_dag'] == dags + 1, f"DAGs: {dags} -> {efeitos['trigger_dag']}"
+
+
+def queda_apos_ledger(base_url: str, state):
+    # O processo cai depois de registrar as versões no ledger e antes do PATCH: na execução seguinte
+    # o ledger pula os tipos, então os efeitos precisam ter entrado na fila antes do registro
+    efeitos = defaultdict(int)
+    cvu = preparar_cvu(base_url, efeitos)
+
+    tarefa = criar_tarefa(cvu, efeitos)
+
+    def queda():
+        raise RuntimeError("queda simulada")
+
+    tarefa.read_cvu.sincronizar_ledger = queda
+    try:
+        tarefa.run_process()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("a queda simulada não interrompeu a execução")
+    assert efeitos['trigger_dag'] == 0, efeitos
+
+    criar_tarefa(cvu, efeitos).run_process()
+    tipos = {tipo.replace('_revisado', '') for tipo, _ in state.checks}
+    assert efeitos['trigger_dag'] == len(tipos), f"DAGs: {efeitos['trigger_dag']}, tipos: {sorted(tipos)}"
+    assert all(r.get('status') == 'processado' for r in state.checks.values()), state.checks
+
+
+def segunda_revisao_no_dia(base_url: str, state):
+    # A CCEE republica o estrutural horas depois no mesmo dia: a nova revisão dispara DAG e tabela de novo
+    efeitos = defaultdict(int)
+    cvu = preparar_cvu(base_url, efeitos)
+
+    criar_tarefa(cvu, efeitos).run_process()
+    dags, tabelas = efeitos['trigger_dag'], efeitos['whatsapp']
+
+    _republicar(state, 'estrutural', horas=3)
+    criar_tarefa(cvu, efeitos).run_process()
+    assert len(_status_check(state, 'estrutural')) == 2, _status_check(state, 'estrutural')
+    assert efeitos['trigger_dag'] == dags + 1, f"DAGs: {dags} -> {efeitos['trigger_dag']}"
+    assert efeitos['whatsapp'] == tabelas + 1, f"tabelas: {tabelas} -> {efeitos['whatsapp']}"
+
+
+def segunda_revisao_handler_quente(base_url: str, state):
+    # Como no daemon, o mesmo Cvu processa as duas revisões: a tabela da segunda compara a revisão nova
+    # com a anterior, e não com o histórico em cache da primeira execução
+    efeitos = defaultdict(int)
+    cvu = preparar_cvu(base_url, efeitos)
+    tarefa = criar_tarefa(cvu, efeitos)
+    comparadas = []
+    fetch_snapshots = tarefa.generate_table._fetch_snapshots
+
+    def registrar(df_dt):
+        comparadas.append(tuple(df_dt['data_atualizacao'].dt.strftime('%Y-%m-%dT%H:%M:%S')))
+        return fetch_snapshots(df_dt)
+
+    tarefa.generate_table._fetch_snapshots = registrar
+    tarefa.run_process()
+    _republicar(state, 'estrutural', horas=3)
+    comparadas.clear()
+    tarefa.run_process()
+
+    anterior, nova = sorted(data for tipo, data in state.checks if tipo == 'estrutural')
+    assert comparadas == [(nova, anterior)], f"tabela comparou {comparadas}, esperado {(nova, anterior)}"
+
+
+def _republicar(state, tipo_cvu: str, horas: int):
+    # Nova revisão do tipo na CCEE, horas depois da atual
+    path = os.path.join(ccee_dir(state.fixtures_dir, tipo_cvu), 'package_show.json')
+    with open(path, encoding='utf-8') as f:
+        package = json.load(f)
+    resultado = package['result']
+    resultado['metadata_modified'] = _mais_horas(resultado['metadata_modified'], horas)
+    for recurso in resultado['resources']:
+        recurso['last_modified'] = _mais_horas(recurso['last_modified'], horas)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(package, f)
+
+
+def colunas_texto(base_url: str, state):
+    # Colunas de texto do mapeamento são lidas como texto: o CNPJ segue com os zeros à esquerda do CSV
+    # (a leitura por inferência enviava '1' para '00000000000001') e o mês de referência como 'AAAAMM'
+    import pandas as pd
+
+    efeitos = defaultdict(int)
+    cvu = preparar_cvu(base_url, efeitos)
+    criar_tarefa(cvu, efeitos).run_process()
+
+    csv = pd.read_csv(os.path.join(ccee_dir(state.fixtures_dir, 'conjuntural'), 'content.csv'), dtype=str)
+    linhas = [linha for (fonte, _), postadas in state.postados.items() if fonte == 'conjuntural' for linha in postadas]
+    assert linhas, "nenhuma linha de conjuntural postada"
+    enviados = {linha['cd_usina']: linha['cnpj_agente_vendedor'] for linha in linhas}
+    esperados = dict(zip(csv['CODIGO_MODELO_PRECO'].astype(int), csv['CNPJ_AGENTE_VENDEDOR']))
+    assert enviados == esperados, [(k, v, esperados.get(k)) for k, v in enviados.items() if v != esperados.get(k)][:5]
+    assert all(isinstance(cnpj, str) and len(cnpj) == 14 for cnpj in enviados.values()), list(enviados.values())[:5]
+    assert {linha['mes_referencia'] for linha in linhas} == set(csv['MES_REFERENCIA']), linhas[:2]
+
+
+def _mais_horas(data: str, horas: int) -> str:
+    return (datetime.datetime.fromisoformat(data) + datetime.timedelta(hours=horas)).isoformat()
+
+
+def daemon_com_falha(base_url: str, state):
+    # Um tipo falha no primeiro ciclo: a assinatura salva não pode avançar para ele, então o ciclo
+    # seguinte executa o workflow de novo e o envia; o terceiro, sem novidade, só drena pendências
+    from daemon import Daemon, PollSchedule
+
+    efeitos = defaultdict(int)
+    cvu = preparar_cvu(base_url, efeitos)
+    ciclos = []
+
+    class Ciclos(PollSchedule):
+        def proximo(self, mudou, erro=False, agora=None):
+            ciclos.append({'mudou': mudou, 'erro': erro, 'estrutural': _linhas_postadas(state, 'estrutural')})
+            state.falhar_post.clear()
+            if len(ciclos) == 3:
+                daemon.stop()
+            return 0
+
+    state.falhar_post.add('estrutural')
+    daemon = Daemon('cvu', lambda: criar_tarefa(cvu, efeitos), schedule=Ciclos(),
+                    state_dir=os.environ['CVU_STATE_DIR'])
+    daemon.run()
+    assert ciclos[0] == {'mudou': False, 'erro': True, 'estrutural': 0}, ciclos
+    assert ciclos[1]['estrutural'] > 0, ciclos
+    assert ciclos[2] == {'mudou': False, 'erro': False, 'estrutural': ciclos[1]['estrutural']}, ciclos
+    assert daemon._load_state() == daemon.handler.get_freshness(), daemon._load_state()
+
+
+CENARIOS = {
+    # Histórico sem status (como o backend atual): o ledger não é reconciliado a partir dele
+    'falha_e_reexecucao': (falha_e_reexecucao, {}),
+    # Histórico com status: só as revisões 'processado' entram no ledger
+    'falha_e_reexecucao_com_status': (falha_e_reexecucao, {'historico_status': True}),
+    'queda_apos_ledger': (queda_apos_ledger, {}),
+    'segunda_revisao_no_dia': (segunda_revisao_no_dia, {}),
+    'segunda_revisao_handler_quente': (segunda_revisao_handler_quente, {}),
+    'daemon_com_falha': (daemon_com_falha, {}),
+    'colunas_texto': (colunas_texto, {}),
+}
+
+
+def executar_cenario(nome: str, fixtures: str):
+    cenario, opcoes = CENARIOS[nome]
+    generate_synthetic(fixtures, usinas=30, anos=3)
+    server, state = start_server(fixtures, **opcoes)
+    try:
+        cenario(f'http://127.0.0.1:{server.server_port}', state)
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cenários de regressão do workflow de CVU")
+    parser.add_argument('cenarios', nargs='*', help=f"padrão: todos ({', '.join(CENARIOS)})")
+    parser.add_argument('--filho', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    desconhecidos = set(args.cenarios) - set(CENARIOS)
+    if desconhecidos:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+    if args.filho:
+        return executar_cenario(args.cenarios[0], os.environ['CVU_REPLAY_FIXTURES'])
+
+    falhas = []
+    for nome in args.cenarios or CENARIOS:
+        with tempfile.TemporaryDirectory(prefix='cvu-regressao-') as tmp:
+            env = dict(
+                os.environ,
+                CVU_STATE_DIR=os.path.join(tmp, 'state'),
+                CVU_CACHE_DIR=os.path.join(tmp, 'cache'),
+                CVU_REPLAY_FIXTURES=os.path.join(tmp, 'fixtures'),
+                CVU_POST_BACKOFF='0',
+                CVU_EFEITOS_BACKOFF='0',
+            )
+            resultado = subprocess.run([sys.executable, __file__, '--filho', nome], env=env,
+                                       capture_output=True, text=True)
+        if resultado.returncode == 0:
+            print(f"ok     {nome}")
+        else:
+            falhas.append(nome)
+            print(f"FALHOU {nome}\n{resultado.stderr[-4000:]}")
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == '__main__':
+    main()
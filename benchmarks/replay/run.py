@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import resource
+import tempfile
+import functools
+import tracemalloc
+import subprocess
+from collections import defaultdict
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'app'))
+
+from fixtures import FIXTURES_DIR, generate_synthetic
+from server import start_server, API_CVU, API_HISTORICO, API_NOME_UTE
+
+READ_CVU_STAGES = ['get_data_atualizacao_cvu', 'check_cvu_status_processamento', 'get_cvu_from_csv',
+                   'iter_cvu_chunks', 'post_snapshot', 'post_data', 'mark_cvu_as_processed']
+GENERATE_TABLE_STAGES = ['get_datas_atualizacao', '_fetch_snapshots', 'generate_table']
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.segundos = defaultdict(float)
+        self.chamadas = defaultdict(int)
+
+    def wrap(self, obj, nome: str, prefixo: str):
+        original = getattr(obj, nome)
+
+        @functools.wraps(original)
+        def medido(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.segundos[f'{prefixo}.{nome}'] += time.perf_counter() - inicio
+                self.chamadas[f'{prefixo}.{nome}'] += 1
+
+        setattr(obj, nome, medido)
+
+    def resumo(self) -> dict:
+        # Com max_workers > 1 os tempos de etapas concorrentes se sobrepõem
+        return {etapa: {'segundos': round(self.segundos[etapa], 4), 'chamadas': self.chamadas[etapa]}
+                for etapa in sorted(self.segundos)}
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss é em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def preparar_cvu(base_url: str, efeitos: defaultdict):
+    # Aponta o módulo de CVU para o servidor local e conta os efeitos em vez de executá-los;
+    # roda antes de criar Cvu(), com CVU_STATE_DIR/CVU_CACHE_DIR já definidos
+    from app.tasks import cvu
+    from constants import MAPEAMENTO_CVU
+
+    cvu.CCEE_DADOS_ABERTOS_URL = base_url
+
+    originais = cvu.constants
+    cvu.constants = types.SimpleNamespace(
+        BASE_URL=base_url,
+        GET_CVU=base_url + API_CVU,
+        GET_HISTORICO_CVU=base_url + API_HISTORICO,
+        GET_NOME_UTE=base_url + API_NOME_UTE,
+        WHATSAPP_DECKS=getattr(originais, 'WHATSAPP_DECKS', None),
+    )
+    for tipo_cvu, mapeamento in MAPEAMENTO_CVU.items():
+        mapeamento['url'] = f'{base_url}/pda/{tipo_cvu}/content'
+        mapeamento['endpoint'] = base_url + API_CVU + ('/merchant' if tipo_cvu == 'merchant' else '')
+
+    cvu.send_whatsapp_message = lambda *a, **k: efeitos.__setitem__('whatsapp', efeitos['whatsapp'] + 1)
+    return cvu
+
+
+def criar_tarefa(cvu, efeitos: defaultdict):
+    tarefa = cvu.Cvu()
+    tarefa.trigger_dag = lambda *a, **k: efeitos.__setitem__('trigger_dag', efeitos['trigger_dag'] + 1)
+    return tarefa
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay offline do workflow de CVU contra CCEE e backend locais")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    parser.add_argument('--sintetico', action='store_true', help="gera fixtures sintéticas antes de rodar")
+    parser.add_argument('--usinas', type=int, default=400)
+    parser.add_argument('--anos', type=int, default=5)
+    parser.add_argument('--escala', type=int, default=1, help="multiplica as linhas dos CSVs (ex.: 10, 100)")
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help="latência adicionada a cada requisição")
+    parser.add_argument('--tracemalloc', action='store_true', help="mede o pico do heap Python (mais lento)")
+    parser.add_argument('--saida', help="arquivo JSON de resultado (padrão: stdout)")
+    args = parser.parse_args()
+
+    # Configuração lida no import de app/constants.py: estado e cache isolados por execução
+    estado_dir = tempfile.mkdtemp(prefix='cvu-replay-')
+    os.environ['CVU_CACHE_DIR'] = os.path.join(estado_dir, 'cache')
+    os.environ['CVU_STATE_DIR'] = os.path.join(estado_dir, 'state')
+
+    if args.sintetico:
+        generate_synthetic(args.fixtures, args.usinas, args.anos)
+
+    server, state = start_server(args.fixtures, args.latencia_ms / 1000, args.escala)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    efeitos = defaultdict(int)
+    cvu = preparar_cvu(base_url, efeitos)
+
+    from tracing import get_tracer
+
+    timer = StageTimer()
+    rss_inicial = max_rss_mb()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    inicio = time.perf_counter()
+    tarefa = criar_tarefa(cvu, efeitos)
+    for nome in READ_CVU_STAGES:
+        timer.wrap(tarefa.read_cvu, nome, 'ReadCvu')
+    for nome in GENERATE_TABLE_STAGES:
+        timer.wrap(tarefa.generate_table, nome, 'GenerateTable')
+    timer.wrap(tarefa.read_cvu, 'run_process', 'ReadCvu')
+    timer.wrap(tarefa.generate_table, 'run_process', 'GenerateTable')
+    inicializacao = time.perf_counter() - inicio
+
+    tarefa.run_process()
+    total = time.perf_counter() - inicio
+
+    resultado = {
+        'commit': git_commit(),
+        'parametros': {'escala': args.escala, 'latencia_ms': args.latencia_ms, 'fixtures': args.fixtures},
+        'segundos_total': round(total, 4),
+        'segundos_inicializacao': round(inicializacao, 4),
+        'etapas': timer.resumo(),
+        'etapas_por_tipo': [
+            {chave: valor for chave, valor in etapa.items() if chave != 'memoria_delta_bytes'}
+            for etapa in get_tracer().summary()['etapas']
+        ],
+        'rss_pico_mb': round(max_rss_mb(), 1),
+        'rss_inicial_mb': round(rss_inicial, 1),
+        'requisicoes': dict(sorted(state.requisicoes.items())),
+        'bytes_servidos': dict(state.bytes_enviados),
+        'efeitos_colaterais': dict(efeitos),
+    }
+    if args.tracemalloc:
+        resultado['heap_pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+
+    server.shutdown()
+    saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(saida + '\n')
+    else:
+        print(saida)
+
+
+if __name__ == '__main__':
+    main()
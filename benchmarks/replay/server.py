@@ -0,0 +1,201 @@
+import os
+import gzip
+import json
+import time
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from fixtures import FIXTURES_DIR, ccee_dir, backend_dir, cvu_fixture_path
+
+# Caminhos do backend simulado (os reais vêm de middle.utils.Constants)
+API_CHECK_CVU = '/api/v2/decks/check-cvu'
+API_CVU = '/api/v2/decks/cvu'
+API_HISTORICO = '/api/v2/decks/cvu/historico'
+API_NOME_UTE = '/api/v2/decks/cvu/nome-ute'
+
+
+class ReplayState:
+    # Backend em memória: registros de check-cvu e snapshots postados, para que
+    # GenerateTable leia o que ReadCvu acabou de enviar
+
+    def __init__(self, fixtures_dir: str, latencia: float, escala: int, historico_status: bool = False):
+        self.fixtures_dir = fixtures_dir
+        self.latencia = latencia
+        self.escala = escala
+        # Cenários de regressão: fontes cujos POST de CVU respondem 500, e histórico com o status
+        # de cada revisão (o das fixtures já foi aceito pelo backend)
+        self.falhar_post = set()
+        self.historico_status = historico_status
+        self.lock = threading.RLock()
+        self.requisicoes = Counter()
+        self.bytes_enviados = Counter()
+        self.checks = {}
+        self.postados = {}
+        self._csv_cache = {}
+        with open(os.path.join(backend_dir(fixtures_dir), 'historico.json'), encoding='utf-8') as f:
+            self.historico = json.load(f)['data']
+
+    def csv(self, tipo_cvu: str) -> bytes:
+        # Escala o payload repetindo as linhas de dados do CSV gravado
+        if tipo_cvu not in self._csv_cache:
+            with open(os.path.join(ccee_dir(self.fixtures_dir, tipo_cvu), 'content.csv'), 'rb') as f:
+                header, _, body = f.read().partition(b'\n')
+            if body and not body.endswith(b'\n'):
+                body += b'\n'
+            self._csv_cache[tipo_cvu] = header + b'\n' + body * self.escala
+        return self._csv_cache[tipo_cvu]
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state: ReplayState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _rota(self, rota: str):
+        with self.state.lock:
+            self.state.requisicoes[f'{self.command} {rota}'] += 1
+        if self.state.latencia:
+            time.sleep(self.state.latencia)
+
+    def _responder(self, status: int, body: bytes = b'', content_type: str = 'application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for chave, valor in (headers or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.state.lock:
+            self.state.bytes_enviados[self.command] += len(body)
+
+    def _json(self, status: int, payload):
+        self._responder(status, json.dumps(payload).encode('utf-8'))
+
+    def _arquivo(self, path: str, content_type: str):
+        with open(path, 'rb') as f:
+            self._responder(200, f.read(), content_type)
+
+    def _body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return json.loads(body) if body else None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        partes = url.path.strip('/').split('/')
+
+        if url.path == '/api/3/action/package_show':
+            self._rota('package_show')
+            tipo_cvu = params['id'].replace('custo_variavel_unitario_', '')
+            return self._arquivo(os.path.join(ccee_dir(self.state.fixtures_dir, tipo_cvu), 'package_show.json'),
+                                 'application/json')
+        if partes[0] == 'dataset':
+            self._rota('dataset')
+            tipo_cvu = partes[1].replace('custo_variavel_unitario_', '')
+            return self._arquivo(os.path.join(ccee_dir(self.state.fixtures_dir, tipo_cvu), 'dataset.html'),
+                                 'text/html; charset=utf-8')
+        if partes[0] == 'pda':
+            self._rota('pda-download')
+            body = self.state.csv(partes[1])
+            etag = f'"{len(body)}-{self.state.escala}"'
+            if self.headers.get('If-None-Match') == etag:
+                return self._responder(304, headers={'ETag': etag})
+            return self._responder(200, body, 'text/csv; charset=utf-8', {'ETag': etag})
+
+        if url.path == API_CHECK_CVU:
+            self._rota('check-cvu')
+            registro = self.state.checks.get((params['tipo_cvu'], params['data_atualizacao']))
+            if registro is None:
+                return self._json(404, {'detail': 'não encontrado'})
+            return self._json(200, registro)
+        if url.path == API_HISTORICO:
+            self._rota('historico')
+            with self.state.lock:
+                historico = [dict(item) for item in self.state.historico]
+                if self.state.historico_status:
+                    for item in historico:
+                        registro = self.state.checks.get((item['tipo_cvu'], item['data_atualizacao']))
+                        item['status'] = registro.get('status') if registro else 'processado'
+            return self._json(200, {'data': historico})
+        if url.path == API_NOME_UTE:
+            self._rota('nome-ute')
+            return self._arquivo(os.path.join(backend_dir(self.state.fixtures_dir), 'nome_ute.json'),
+                                 'application/json')
+        if url.path == API_CVU:
+            self._rota('cvu')
+            chave = (params['fonte'], params['dt_atualizacao'])
+            if chave in self.state.postados:
+                return self._json(200, self.state.postados[chave])
+            path = cvu_fixture_path(self.state.fixtures_dir, *chave)
+            if os.path.exists(path):
+                return self._arquivo(path, 'application/json')
+            return self._json(200, [])
+
+        self._rota('desconhecida')
+        self._json(404, {'detail': url.path})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        payload = self._body()
+
+        if url.path == API_CHECK_CVU:
+            self._rota('check-cvu')
+            with self.state.lock:
+                registro = dict(payload, id=len(self.state.checks) + 1)
+                self.state.checks[(payload['tipo_cvu'], payload['data_atualizacao'])] = registro
+                # O histórico do backend lista as revisões registradas, com data e hora
+                item = {'tipo_cvu': payload['tipo_cvu'], 'data_atualizacao': payload['data_atualizacao']}
+                if item not in self.state.historico:
+                    self.state.historico.append(item)
+            return self._json(201, registro)
+        if url.path in (API_CVU, API_CVU + '/merchant'):
+            self._rota('cvu' if url.path == API_CVU else 'cvu/merchant')
+            fontes = {linha['fonte'].replace('CCEE_', '') for linha in payload}
+            if fontes & self.state.falhar_post:
+                return self._json(500, {'detail': 'falha simulada'})
+            with self.state.lock:
+                for linha in payload:
+                    # O backend expõe o CVU com frete de merchant também como vl_cvu
+                    if 'vl_cvu' not in linha and 'vl_cvu_cf' in linha:
+                        linha['vl_cvu'] = linha['vl_cvu_cf']
+                    # Coluna inteira no banco; tipos sem ano_horizonte enviam o ano como texto
+                    if linha.get('ano_horizonte') is not None:
+                        linha['ano_horizonte'] = int(linha['ano_horizonte'])
+                    fonte = linha['fonte'].replace('CCEE_', '')
+                    self.state.postados.setdefault((fonte, linha['dt_atualizacao']), []).append(linha)
+            return self._json(201, {'linhas': len(payload)})
+
+        self._rota('desconhecida')
+        self._json(404, {'detail': url.path})
+
+    def do_PATCH(self):
+        url = urlparse(self.path)
+        if url.path.startswith(API_CHECK_CVU + '/'):
+            self._rota('check-cvu/status')
+            id_check = int(url.path.split('/')[-2])
+            status = parse_qs(url.query).get('status', ['processado'])[0]
+            with self.state.lock:
+                registro = next((r for r in self.state.checks.values() if r['id'] == id_check), None)
+                if registro is not None:
+                    registro['status'] = status
+            if registro is None:
+                return self._json(404, {'detail': 'não encontrado'})
+            return self._json(200, registro)
+
+        self._rota('desconhecida')
+        self._json(404, {'detail': url.path})
+
+
+def start_server(fixtures_dir: str = FIXTURES_DIR, latencia: float = 0.0, escala: int = 1,
+                 historico_status: bool = False):
+    state = ReplayState(fixtures_dir, latencia, escala, historico_status)
+    handler = type('Handler', (ReplayHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
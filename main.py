@@ -1,27 +1,63 @@
+import os
 import sys
+import argparse
 from middle.utils import setup_logger
-from app.mapping import PRODUCT_MAPPING
-from app.TasksInterface import TasksInterface
+from app.mapping import PRODUCT_MAPPING, load_handler
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'app')))
+from constants import CVU_TRACE_OUTPUT, CVU_TRACE_FORMAT, CVU_PROFILE, CVU_DAEMON
+from tracing import get_tracer, profile
+from daemon import Daemon
 
 logger = setup_logger()
 
 
 def task_handler(nome: str):
-    product_handler: TasksInterface | None = PRODUCT_MAPPING[nome]
-    if not product_handler:
+    if nome not in PRODUCT_MAPPING:
         logger.error(f"Produto {nome} nao encontrado no mapeamento")
         raise ValueError("Produto nao mapeado")
-    product_handler = PRODUCT_MAPPING[nome]()
+    product_handler = load_handler(nome)()
     result = product_handler.run_workflow()
     return result
 
+
+def daemon_handler(nome: str, trace_saida: str = "", trace_formato: str = "json"):
+    if nome not in PRODUCT_MAPPING:
+        logger.error(f"Produto {nome} nao encontrado no mapeamento")
+        raise ValueError("Produto nao mapeado")
+    Daemon(nome, load_handler(nome), trace_saida=trace_saida, trace_formato=trace_formato).run()
+
+
+def parse_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ingestão de dados abertos da CCEE")
+    parser.add_argument("nome", help="Produto a executar (chave de PRODUCT_MAPPING)")
+    parser.add_argument("--trace-saida", default=CVU_TRACE_OUTPUT,
+                        help="Arquivo do resumo por etapa (.json ou .prom); vazio desliga")
+    parser.add_argument("--trace-formato", default=CVU_TRACE_FORMAT, choices=["json", "prometheus"])
+    parser.add_argument("--perfil", default=CVU_PROFILE, choices=["", "cprofile", "tracemalloc"],
+                        help="Captura de perfil da execução inteira")
+    parser.add_argument("--daemon", action="store_true", default=CVU_DAEMON,
+                        help="Processo contínuo: consulta as datas de atualização e só executa quando mudam")
+    # O ENTRYPOINT do Dockerfile repassa argumentos posicionais extras (ex.: "$ano" vazio)
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
 if __name__ == "__main__":
     logger.info("Iniciando aplicacao CCEE dados abertos")
-    if len(sys.argv) >= 1:
-        nome = sys.argv[1]
-        task_handler(nome)
+    if len(sys.argv) > 1:
+        args = parse_args(sys.argv[1:])
+        nome = args.nome
+        if args.daemon:
+            # No daemon o resumo é gravado a cada execução do workflow
+            daemon_handler(nome, args.trace_saida, args.trace_formato)
+        else:
+            try:
+                with profile(args.perfil):
+                    task_handler(nome)
+            finally:
+                get_tracer().write(args.trace_saida, args.trace_formato)
         logger.info(f"nome: {nome}")
     else:
         raise ValueError("nome nao fornecido corretamente")
 
-    logger.info("Aplicacao finalizada com sucesso")
\ No newline at end of file
+    logger.info("Aplicacao finalizada com sucesso")
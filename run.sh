@@ -10,5 +10,8 @@ trap 'echo "Parando container..."; docker stop $container_name; docker rm $conta
 
 docker run --rm --name $container_name \
   -v ~/.env:/root/.env \
+  -v ~/.cache/ccee-dados-abertos:/root/.cache/ccee-dados-abertos \
+  -v ~/.local/state/ccee-dados-abertos:/root/.local/state/ccee-dados-abertos \
   -e nome="$nome" \
+  -e CVU_DAEMON="${CVU_DAEMON:-false}" \
   ccee-dados-abertos:latest
\ No newline at end of file